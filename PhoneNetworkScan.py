@@ -2,32 +2,67 @@
 # Ulepszenia: Logi w txt z pełnymi szczegółami, sprawdzanie adresu IP, kolory, ikony ASCII, baner.
 # Funkcjonalności: Skanowanie numerów, rejestracja, wyszukiwanie, eksport CSV, usuwanie wpisów, sprawdzanie IP.
 # Etyczne użycie: Dla bezpieczeństwa i wykrywania oszustw, z zachowaniem prywatności.
-# Wymagane biblioteki: pip install phonenumbers keyboard pandas tabulate colorama requests
+# Wymagane biblioteki: pip install phonenumbers keyboard tabulate colorama requests (opcjonalnie pyarrow)
 # Dane przechowywane lokalnie w phone_registry.json, logi w registry_log.txt, eksport w CSV.
 
 import os
+import sys
+import csv
+import time
 import json
-import keyboard
-import phonenumbers
-from phonenumbers import geocoder, carrier, timezone, PhoneNumberType
+import argparse
+import bisect
+import itertools
+import threading
+from collections import deque, OrderedDict
 from datetime import datetime
 import re
-import pandas as pd
+import io
+import gzip
+import math
+import mmap
+import struct
+import shutil
 import hashlib
+import sqlite3
 import logging
-from tabulate import tabulate
-from colorama import init, Fore, Style
-import requests
 
-# Inicjalizacja colorama
-init(autoreset=True)
+# Ciężkie zależności (phonenumbers + metadane prefiksów, requests, colorama, tabulate) są ładowane
+# leniwie przy pierwszym użyciu danej funkcji - import modułu i krótkie wywołania CLI startują szybko
+phonenumbers = PhoneNumberType = None
+geocoder = carrier = timezone = None
+Fore = Style = tabulate = None
+BANNER = ""
 
-# Konfiguracja logowania
-logging.basicConfig(filename='registry_log.txt', level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+def load_phonenumbers():
+    global phonenumbers, PhoneNumberType
+    if phonenumbers is None:
+        import phonenumbers as phonenumbers_module
+        PhoneNumberType = phonenumbers_module.PhoneNumberType
+        phonenumbers = phonenumbers_module
+    return phonenumbers
 
-# Baner ASCII
-BANNER = f"""
+def load_metadata():
+    # Metadane geokodera (~0.4 s), operatorów i stref czasowych
+    global geocoder, carrier, timezone
+    if geocoder is None:
+        load_phonenumbers()
+        from phonenumbers import carrier as carrier_module, timezone as timezone_module
+        from phonenumbers import geocoder as geocoder_module
+        carrier, timezone = carrier_module, timezone_module
+        geocoder = geocoder_module
+
+def load_ui():
+    global Fore, Style, tabulate, BANNER
+    if Fore is None:
+        from colorama import init, Fore as fore, Style as style
+        from tabulate import tabulate as tabulate_function
+        # Inicjalizacja colorama
+        init(autoreset=True)
+        tabulate = tabulate_function
+        Fore, Style = fore, style
+        # Baner ASCII
+        BANNER = f"""
 {Fore.CYAN + Style.BRIGHT}
    _____ _          
   |  __ (_)         
@@ -38,6 +73,454 @@ BANNER = f"""
 {Fore.YELLOW}Creator: Kro3nos{Style.RESET_ALL}
 """
 
+# Loggery per podsystem (poziomy ustawiane osobno, np. scanner=WARNING, registry=INFO)
+log = logging.getLogger("phonescan")
+log.addHandler(logging.NullHandler())
+scanner_log = logging.getLogger("phonescan.scanner")
+registry_log = logging.getLogger("phonescan.registry")
+storage_log = logging.getLogger("phonescan.storage")
+enrichment_log = logging.getLogger("phonescan.enrichment")
+export_log = logging.getLogger("phonescan.export")
+app_log = logging.getLogger("phonescan.app")
+LOG_SUBSYSTEMS = ("scanner", "registry", "storage", "enrichment", "export", "app")
+
+class JsonLogFormatter(logging.Formatter):
+    # Jedna linia JSON na zdarzenie; zdarzenia z polami (extra={"event": ..., "fields": {...}})
+    # zapisują pola zamiast wielolinijkowego tekstu
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "subsystem": record.name.rpartition(".")[2]
+        }
+        event = getattr(record, "event", None)
+        if event:
+            data["event"] = event
+            data.update(getattr(record, "fields", {}))
+        else:
+            data["message"] = record.getMessage()
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class LogSampler(logging.Filter):
+    # Próbkowanie zdarzeń z gorących ścieżek (np. number_scan): rate=0.01 -> co setne, rate=0 -> tylko podsumowania.
+    # Dotyczy wyłącznie rekordów oznaczonych sampled=True (zdarzenia per numer/IP); podsumowania przechodzą zawsze.
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+        rate = self.rates.get(getattr(record, "event", None), self.rates.get("*", 1.0))
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        with self.lock:
+            count = self.counters.get(record.event, 0)
+            self.counters[record.event] = count + 1
+        return count % max(1, round(1 / rate)) == 0
+
+class LazyLogMessage:
+    # Tekst komunikatu budowany dopiero przy formatowaniu (odrzucone rekordy nic nie kosztują)
+    def __init__(self, build, fields):
+        self.build = build
+        self.fields = fields
+
+    def __str__(self):
+        return self.build(self.fields)
+
+_log_listener = None
+_log_config = None
+
+def configure_logging(log_file="registry_log.txt", level=logging.INFO, structured=False, async_handler=None,
+                      max_bytes=0, backup_count=5, levels=None, sample_rates=None):
+    # Konfiguracja logowania - wywoływana przez punkty wejścia, nie przy imporcie modułu.
+    # structured=True: JSON lines; async_handler (domyślnie = structured): zapis w wątku w tle;
+    # max_bytes > 0: rotacja pliku; levels: {"scanner": "WARNING", ...}; sample_rates: {"number_scan": 0.01}
+    global _log_listener, _log_config
+    import logging.handlers
+    _log_config = {"log_file": log_file, "level": level, "structured": structured, "levels": levels,
+                   "sample_rates": sample_rates}
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+    for handler in list(log.handlers):
+        if not isinstance(handler, logging.NullHandler):
+            log.removeHandler(handler)
+            handler.close()
+    if max_bytes:
+        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                       encoding="utf-8")
+    else:
+        handler = logging.FileHandler(log_file, encoding="utf-8")
+    if structured:
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    if async_handler is None:
+        async_handler = structured
+    if async_handler:
+        import queue
+        import atexit
+        class DeferredQueueHandler(logging.handlers.QueueHandler):
+            # Formatowanie (także wielolinijkowych komunikatów) odbywa się w wątku QueueListener
+            def prepare(self, record):
+                return record
+
+        _log_listener = logging.handlers.QueueListener(queue.SimpleQueue(), handler)
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
+        handler = DeferredQueueHandler(_log_listener.queue)
+    if sample_rates:
+        handler.addFilter(LogSampler(sample_rates))
+    log.addHandler(handler)
+    log.setLevel(level)
+    log.propagate = False
+    for subsystem in LOG_SUBSYSTEMS:
+        logging.getLogger(f"phonescan.{subsystem}").setLevel((levels or {}).get(subsystem, logging.NOTSET))
+
+# Metryki czasu działania (liczniki, gauge, histogramy) w modelu Prometheusa. Zbierane zawsze:
+# obserwacja to odczyt zegara i kilka inkrementacji pod blokadą metryki.
+class Counter:
+    __slots__ = ("lock", "value")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def reset(self):
+        self.value = 0
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+class Histogram:
+    BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+               1.0, 2.5, 5.0, 10.0)
+    __slots__ = ("lock", "counts", "sum", "count")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.BUCKETS, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return MetricTimer(self)
+
+    def quantile(self, fraction):
+        # Przybliżenie z kubełków: górna granica kubełka, w którym wypada kwantyl
+        if not self.count:
+            return 0.0
+        target, seen = fraction * self.count, 0
+        for bound, count in zip(self.BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound if bound != float("inf") else self.BUCKETS[-1]
+        return self.BUCKETS[-1]
+
+class MetricTimer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+class Metrics:
+    TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.help = {}
+        self.collectors = []
+
+    def _metric(self, cls, name, help_text, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = self.metrics[key] = cls()
+                self.help.setdefault(name, (self.TYPES[cls], help_text))
+            return metric
+
+    def counter(self, name, help_text="", **labels):
+        return self._metric(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text="", **labels):
+        return self._metric(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text="", **labels):
+        return self._metric(Histogram, name, help_text, labels)
+
+    def add_collector(self, collector):
+        # collector(metrics) ustawia gauge tuż przed odczytem (np. statystyki cache)
+        self.collectors.append(collector)
+
+    def _collect(self):
+        for collector in self.collectors:
+            collector(self)
+        with self.lock:
+            return sorted(self.metrics.items(), key=lambda item: item[0])
+
+    def snapshot(self):
+        # Stan do przesłania między procesami (merge) lub zapisu jako JSON
+        items = []
+        for (name, labels), metric in self._collect():
+            item = {"name": name, "labels": dict(labels), "type": self.help[name][0]}
+            if isinstance(metric, Histogram):
+                item.update(counts=list(metric.counts), sum=metric.sum, count=metric.count)
+            else:
+                item["value"] = metric.value
+            items.append(item)
+        return items
+
+    def drain(self):
+        # Snapshot niezerowych metryk i wyzerowanie (procesy robocze odsyłają przyrosty)
+        items = [item for item in self.snapshot() if item.get("count") or item.get("value")]
+        self.reset()
+        return items
+
+    def merge(self, items):
+        for item in items:
+            if item["type"] == "histogram":
+                metric = self.histogram(item["name"], **item["labels"])
+                with metric.lock:
+                    metric.counts = [a + b for a, b in zip(metric.counts, item["counts"])]
+                    metric.sum += item["sum"]
+                    metric.count += item["count"]
+            elif item["type"] == "counter":
+                self.counter(item["name"], **item["labels"]).inc(item["value"])
+
+    def reset(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.reset()
+
+    def summary(self):
+        # Zwięzły widok: liczniki/gauge jako liczby, histogramy jako count/średnia/p50/p99 w ms
+        summary = {}
+        for (name, labels), metric in self._collect():
+            key = name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+            if isinstance(metric, Histogram):
+                if metric.count:
+                    summary[key] = {"count": metric.count, "total_s": round(metric.sum, 4),
+                                    "mean_ms": round(metric.sum / metric.count * 1000, 4),
+                                    "p50_ms": metric.quantile(0.5) * 1000, "p99_ms": metric.quantile(0.99) * 1000}
+            elif metric.value:
+                summary[key] = metric.value
+        return summary
+
+    def render_prometheus(self):
+        lines = []
+        current = None
+        for (name, labels), metric in self._collect():
+            if name != current:
+                current = name
+                kind, help_text = self.help[name]
+                lines.append(f"# HELP {name} {help_text or name}")
+                lines.append(f"# TYPE {name} {kind}")
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                for bound, count in zip(metric.BUCKETS + (float("inf"),), metric.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{{label_text + "," if label_text else ""}le="{le}"}} {cumulative}')
+                suffix = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"{name}_sum{suffix} {metric.sum}")
+                lines.append(f"{name}_count{suffix} {metric.count}")
+            else:
+                lines.append(f"{name}{{{label_text}}} {metric.value}" if label_text else f"{name} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # .json -> snapshot + podsumowanie, inaczej format tekstowy Prometheusa
+        if path.endswith(".json"):
+            atomic_write_json(path, {"summary": self.summary(), "metrics": self.snapshot()}, indent=2, fsync=False)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.render_prometheus())
+
+METRICS = Metrics()
+
+SCAN_STAGES = ("parse", "validate", "format", "geocode", "carrier", "timezone", "log")
+SCAN_STAGE_SECONDS = {stage: METRICS.histogram("phonescan_scan_stage_seconds", "Time per validate_number stage",
+                                               stage=stage) for stage in SCAN_STAGES}
+# Trafienia w cache liczy phonescan_cache_hits - ścieżka trafienia nie jest mierzona (koszt rzędu µs)
+VALIDATE_SECONDS = METRICS.histogram("phonescan_validate_seconds", "validate_number latency on cache miss")
+NUMBERS_SCANNED = {result: METRICS.counter("phonescan_numbers_scanned_total", "Numbers scanned by outcome",
+                                           result=result)
+                   for result in ("valid", "invalid", "unsupported", "error", "screened")}
+BATCH_NUMBERS = METRICS.counter("phonescan_batch_numbers_total", "Numbers processed by stream_scan/batch_scan")
+BATCH_RATE = METRICS.gauge("phonescan_batch_numbers_per_second", "Throughput of the current or last batch")
+REGISTER_STAGE_SECONDS = {stage: METRICS.histogram("phonescan_register_stage_seconds",
+                                                   "Time per register_number stage", stage=stage)
+                          for stage in ("scan", "ip_enrichment", "store", "total")}
+REGISTRATIONS = {result: METRICS.counter("phonescan_registrations_total", "Registrations by outcome", result=result)
+                 for result in ("success", "error", "bulk")}
+
+IP_LOOKUP_SECONDS = {source: METRICS.histogram("phonescan_ip_lookup_seconds", "IP enrichment latency "
+                                                "(cache hit, single API call, batch request)", source=source)
+                     for source in ("cache", "api", "batch")}
+IP_LOOKUPS = {result: METRICS.counter("phonescan_ip_lookups_total", "IP addresses looked up via ip-api",
+                                      result=result) for result in ("success", "error")}
+IP_REQUEST_SECONDS = {method: METRICS.histogram("phonescan_ip_api_request_seconds", "HTTP round trip to ip-api",
+                                                method=method) for method in ("GET", "POST")}
+LOCK_WAIT_SECONDS = METRICS.histogram("phonescan_registry_lock_wait_seconds", "Time to acquire the registry file lock")
+WRITE_CONFLICTS = METRICS.counter("phonescan_registry_write_conflicts_total",
+                                  "Writes that hit entries changed by another process")
+REGISTRY_RELOADS = METRICS.counter("phonescan_registry_reloads_total", "Changes picked up from other processes")
+BULK_CHECKED = {result: METRICS.counter("phonescan_bulk_checked_total", "Numbers checked by bulk_check by outcome",
+                                        result=result) for result in ("registered", "absent", "error")}
+BULK_DEDUPLICATED = METRICS.counter("phonescan_bulk_check_duplicates_total",
+                                    "bulk_check inputs answered without a new lookup (repeated input or E.164)")
+BULK_FILTERED = METRICS.counter("phonescan_bulk_check_filtered_total", "Hashes ruled out by the Bloom filter snapshot")
+SERVER_IN_FLIGHT = METRICS.gauge("phonescan_server_in_flight", "HTTP requests being processed")
+SERVER_QUEUED = METRICS.gauge("phonescan_server_queued", "HTTP requests waiting for a concurrency slot")
+SERVER_REJECTED = METRICS.counter("phonescan_server_rejected_total", "HTTP requests rejected with 503 (queue full)")
+SERVER_BATCHES = METRICS.counter("phonescan_server_validate_batches_total", "Coalesced /validate batches")
+SERVER_BATCHED_NUMBERS = METRICS.counter("phonescan_server_validate_batched_total",
+                                         "Numbers validated through coalesced /validate batches")
+IP_RATE_LIMIT_WAIT = METRICS.histogram("phonescan_ip_rate_limit_wait_seconds", "Time spent waiting for the rate limiter")
+
+def storage_timer(backend, op):
+    return METRICS.histogram("phonescan_storage_seconds", "Persistence operations", backend=backend, op=op).time()
+
+class MetricsServer:
+    # Endpoint /metrics (tekst Prometheusa) i /stats (JSON) w wątku w tle
+    def __init__(self, port, host="127.0.0.1", metrics=None):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        metrics = metrics or METRICS
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] == "/metrics":
+                    body, content_type = metrics.render_prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path.split("?")[0] == "/stats":
+                    body, content_type = json.dumps(metrics.summary()).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        app_log.info(f"Metrics endpoint listening on http://{self.server.server_address[0]}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class StatsReporter:
+    # Okresowy zrzut podsumowania metryk do logu (zdarzenie "metrics")
+    def __init__(self, interval, metrics=None):
+        self.interval = interval
+        self.metrics = metrics or METRICS
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="stats-reporter", daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        summary = self.metrics.summary()
+        app_log.info(f"Metrics: {json.dumps(summary)}", extra={"event": "metrics", "fields": {"metrics": summary}})
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.report()
+
+class Profiler:
+    # Profilowanie jednego przebiegu: mode = "cpu" (cProfile -> <output>.pstats + top 30 w <output>.txt),
+    # "memory" (tracemalloc -> <output>.tracemalloc.txt) lub "all"
+    def __init__(self, mode="cpu", output="phonescan_profile"):
+        self.mode = mode
+        self.output = output
+        self.profile = None
+
+    def __enter__(self):
+        if self.mode in ("memory", "all"):
+            import tracemalloc
+            tracemalloc.start(25)
+        if self.mode in ("cpu", "all"):
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        files = []
+        if self.profile is not None:
+            import pstats
+            self.profile.disable()
+            self.profile.dump_stats(f"{self.output}.pstats")
+            with open(f"{self.output}.txt", "w", encoding="utf-8") as f:
+                pstats.Stats(self.profile, stream=f).sort_stats("cumulative").print_stats(30)
+            files += [f"{self.output}.pstats", f"{self.output}.txt"]
+        if self.mode in ("memory", "all"):
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(f"{self.output}.tracemalloc.txt", "w", encoding="utf-8") as f:
+                f.write(f"current: {current / 1024 / 1024:.2f} MiB, peak: {peak / 1024 / 1024:.2f} MiB\n\n")
+                for stat in snapshot.statistics("lineno")[:30]:
+                    f.write(f"{stat}\n")
+            files.append(f"{self.output}.tracemalloc.txt")
+        app_log.info(f"Profile written to {', '.join(files)}")
+        self.files = files
+        return False
+
 # Ikony ASCII dla menu i wyników
 ICONS = {
     "menu": "📋",
@@ -54,11 +537,390 @@ ICONS = {
     "exit": "🚪"
 }
 
+# Stałe opisy pól niedostępnych dla numeru telefonu
+NAME_PLACEHOLDER = "Not available (ethical privacy; use user_provided_name for manual input)"
+MAC_PLACEHOLDER = "N/A (MAC address is device-specific, not applicable to phone numbers)"
+SIGNAL_PLACEHOLDER = "N/A (requires device access; use user_reported_signal for manual input)"
+
+# Domyślny rozmiar paczki dla skanowania wsadowego
+BATCH_CHUNK_SIZE = 1000
+
+def _chunked(numbers, chunk_size):
+    iterator = iter(numbers)
+    while True:
+        chunk = [str(num).strip() for num in itertools.islice(iterator, chunk_size)]
+        if not chunk:
+            return
+        yield chunk
+
+# Skaner per proces roboczy (tworzony raz, nie dla każdej paczki)
+_worker_scanner = None
+_worker_scanner_key = None
+
+def _init_worker(log_config):
+    # Proces roboczy pisze do logu synchronicznie (wątek QueueListener nie przeżywa fork), bez rotacji
+    global _log_listener
+    _log_listener = None
+    # Metryki odziedziczone po fork należą do procesu głównego - worker odsyła tylko własne przyrosty
+    METRICS.reset()
+    if log_config:
+        configure_logging(**log_config, async_handler=False)
+
+def _scan_chunk(chunk, api_key=None, scam_check=False, options=None):
+    # options: PhoneScanner.options procesu nadrzędnego (prescreen, fields)
+    global _worker_scanner, _worker_scanner_key
+    key = (api_key, json.dumps(options, sort_keys=True))
+    if _worker_scanner is None or _worker_scanner_key != key:
+        _worker_scanner = PhoneScanner(api_key, **(options or {}))
+        _worker_scanner_key = key
+    return [_worker_scanner.scan_one(num, scam_check) for num in chunk], METRICS.drain()
+
+class ScanCache:
+    # Ograniczony cache LRU/TTL wyników validate_number (bez pól zmiennych jak scan_time)
+    SEPARATORS = re.compile(r"[\s\-().]")
+    PLAIN_NUMBER = re.compile(r"[\d\s\-().+]+")
+
+    def __init__(self, max_size=100000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def normalize(self, number_str):
+        number_str = str(number_str).strip()
+        if self.PLAIN_NUMBER.fullmatch(number_str):
+            return self.SEPARATORS.sub("", number_str)
+        return number_str
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            stored_at, value = item
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+# Wspólny cache dla skanera i rejestru w obrębie procesu
+SCAN_CACHE = ScanCache()
+
+# Adres usługi ip-api (nadpisywalny, np. na lokalny serwer testowy)
+IP_API_URL = os.environ.get("PHONESCAN_IP_API_URL", "http://ip-api.com")
+
+class RateLimiter:
+    # Token bucket: średnio per_minute żądań na minutę, z możliwością wstrzymania (nagłówki X-Rl/X-Ttl)
+    def __init__(self, per_minute=45):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+        if wait:
+            IP_RATE_LIMIT_WAIT.observe(wait)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class IPEnricher:
+    # Wzbogacanie IP przez ip-api: wspólna sesja HTTP (pula połączeń), limit żądań/min,
+    # endpoint /batch (do 100 adresów na żądanie), równoległe paczki i cache TTL per IP
+    def __init__(self, base_url=None, requests_per_minute=45, batch_size=100, workers=4,
+                 cache_ttl=86400, timeout=5.0, cache=None):
+        self.base_url = (base_url or IP_API_URL).rstrip("/")
+        self.limiter = RateLimiter(requests_per_minute)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.timeout = timeout
+        self.cache = cache if cache is not None else ScanCache(max_size=100000, ttl=cache_ttl)
+        self._session = None
+        self.lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self.lock:
+            if self._session is None:
+                import requests
+                import requests.adapters
+                self._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
+
+    @staticmethod
+    def _header_int(headers, name):
+        # X-Rl / X-Ttl mogą być zniekształcone (np. przez proxy): None zamiast wyjątku w każdym lookupie
+        try:
+            return max(0, int(float(headers.get(name))))
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    def _request(self, method, url, **kwargs):
+        for _ in range(3):
+            self.limiter.acquire()
+            with IP_REQUEST_SECONDS[method].time():
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            METRICS.counter("phonescan_ip_api_requests_total", "Requests sent to ip-api", method=method,
+                            status=str(response.status_code)).inc()
+            remaining = self._header_int(response.headers, "X-Rl")
+            ttl = self._header_int(response.headers, "X-Ttl")
+            if remaining is not None and remaining <= 0:
+                self.limiter.pause(ttl or 60)
+            if response.status_code == 429:
+                self.limiter.pause(ttl or 60)
+                continue
+            response.raise_for_status()
+            return response.json()
+        raise RuntimeError("rate limit exceeded")
+
+    def _parse(self, ip_address, data):
+        if data.get("status") != "success":
+            return {"error": f"IP check failed: {data.get('message', 'Unknown error')}"}
+        return {
+            "ip_address": ip_address,
+            "country": data.get("country", "Unknown"),
+            "country_code": data.get("countryCode", "Unknown"),
+            "region": data.get("regionName", "Unknown"),
+            "city": data.get("city", "Unknown"),
+            "isp": data.get("isp", "Unknown"),
+            "org": data.get("org", "Unknown"),
+            "as": data.get("as", "Unknown"),
+            "query_time": datetime.now().isoformat()
+        }
+
+    def lookup(self, ip_address):
+        started = time.perf_counter()
+        cached = self.cache.get(ip_address)
+        if cached is not None:
+            IP_LOOKUP_SECONDS["cache"].observe(time.perf_counter() - started)
+            return dict(cached)
+        try:
+            result = self._parse(ip_address, self._request("GET", f"{self.base_url}/json/{ip_address}"))
+        except Exception as e:
+            IP_LOOKUPS["error"].inc()
+            return {"error": f"IP check error: {str(e)}"}
+        finally:
+            IP_LOOKUP_SECONDS["api"].observe(time.perf_counter() - started)
+        IP_LOOKUPS["error" if "error" in result else "success"].inc()
+        # Błędów nie zapamiętujemy - ponowienie (retry_failed, backoff kolejki) musi zapytać ip-api jeszcze raz
+        if "error" not in result:
+            self.cache.put(ip_address, result)
+        return dict(result)
+
+    def _lookup_batch(self, ip_addresses):
+        try:
+            with IP_LOOKUP_SECONDS["batch"].time():
+                data = self._request("POST", f"{self.base_url}/batch", json=[{"query": ip} for ip in ip_addresses])
+        except Exception as e:
+            IP_LOOKUPS["error"].inc(len(ip_addresses))
+            return {ip: {"error": f"IP check error: {str(e)}"} for ip in ip_addresses}
+        results = {}
+        for ip_address, item in zip(ip_addresses, data):
+            results[ip_address] = self._parse(ip_address, item)
+            if "error" in results[ip_address]:
+                IP_LOOKUPS["error"].inc()
+            else:
+                IP_LOOKUPS["success"].inc()
+                self.cache.put(ip_address, results[ip_address])
+        return results
+
+    def lookup_many(self, ip_addresses):
+        unique = list(dict.fromkeys(ip.strip() for ip in ip_addresses if ip and ip.strip()))
+        results = {}
+        missing = []
+        for ip_address in unique:
+            cached = self.cache.get(ip_address)
+            if cached is not None:
+                results[ip_address] = dict(cached)
+            else:
+                missing.append(ip_address)
+        if len(missing) == 1:
+            results[missing[0]] = self.lookup(missing[0])
+        elif missing:
+            from concurrent.futures import ThreadPoolExecutor
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as pool:
+                for batch_results in pool.map(self._lookup_batch, batches):
+                    results.update(batch_results)
+        enrichment_log.info(f"IP enrichment: {len(unique)} addresses, {len(missing)} looked up, "
+                     f"{len(unique) - len(missing)} from cache")
+        return results
+
+_ip_enricher = None
+_ip_enricher_lock = threading.Lock()
+
+def get_ip_enricher():
+    # Wspólny enricher (sesja + cache) tworzony przy pierwszym użyciu
+    global _ip_enricher
+    with _ip_enricher_lock:
+        if _ip_enricher is None:
+            _ip_enricher = IPEnricher()
+        return _ip_enricher
+
+def _collect_cache_metrics(metrics):
+    caches = [("scan", SCAN_CACHE)]
+    if _ip_enricher is not None:
+        caches.append(("ip", _ip_enricher.cache))
+    for name, cache in caches:
+        for key, value in cache.stats().items():
+            if key in ("size", "hits", "misses", "evictions", "expirations"):
+                metrics.gauge(f"phonescan_cache_{key}", f"Cache {key} (per process)", cache=name).set(value)
+
+METRICS.add_collector(_collect_cache_metrics)
+
+# Pre-screen (PhoneScanner(prescreen=True)): początek numeru jak w phonenumbers (pierwsza cyfra lub "+"),
+# typowe separatory, granice długości numeru krajowego jak w phonenumbers (MIN/MAX_LENGTH_FOR_NSN)
+PRESCREEN_START = re.compile(r"[+\uff0b\d]")
+PRESCREEN_SEPARATORS = str.maketrans("", "", " \t\u00a0-.()/")
+PRESCREEN_MIN_NSN = 2
+PRESCREEN_MAX_NSN = 17
+# phonenumbers.ValidationResult -> opis w komunikacie odrzucenia
+POSSIBLE_NUMBER_REASONS = {1: "invalid country code", 2: "too short", 3: "too long", 5: "invalid length"}
+
+def _number_scan_message(fields):
+    # Pola metadanych pominięte przez PhoneScanner(fields=...) wypisywane jako "-"
+    return (
+        f"Number Scan:\n"
+        f"  Number: {fields['full_e164']}\n"
+        f"  Valid: {fields['valid']}\n"
+        f"  Type: {fields.get('number_type', '-')}\n"
+        f"  Country: {fields.get('country', '-')} ({fields['country_iso']})\n"
+        f"  Carrier: {fields.get('carrier', '-')}\n"
+        f"  Geolocation: {fields.get('geolocation', '-')}\n"
+        f"  Timezones: {', '.join(fields.get('timezones', ['-']))}\n"
+        f"  Scan Time: {fields['scan_time']}\n"
+        f"{'-'*50}"
+    )
+
+def _ip_check_message(fields):
+    return (
+        f"IP Check:\n"
+        f"  IP: {fields['ip_address']}\n"
+        f"  Country: {fields['country']} ({fields['country_code']})\n"
+        f"  Region: {fields['region']}\n"
+        f"  City: {fields['city']}\n"
+        f"  ISP: {fields['isp']}\n"
+        f"  Query Time: {fields['query_time']}\n"
+        f"{'-'*50}"
+    )
+
 class PhoneScanner:
-    def __init__(self, api_key=None):
+    # Grupy metadanych liczonych po walidacji; fields=None = wszystkie (pełny wynik jak dotąd)
+    SCAN_FIELDS = ("formats", "number_type", "country", "geolocation", "carrier", "timezones")
+    GEOCODER_FIELDS = frozenset(("country", "geolocation", "carrier", "timezones"))
+
+    def __init__(self, api_key=None, cache=None, enricher=None, prescreen=False, fields=None):
+        # prescreen=True: tanie odrzucanie śmieci przed pełnym skanem - kształt numeru, kod kraju
+        # (tablice zbiorów), potem is_possible_number; odrzucone wejścia dostają {"error", "screened": True}
         self.api_key = api_key
-        self.supported_countries = list(range(1, 49))
-        self.number_type_map = {
+        self.cache = SCAN_CACHE if cache is None else cache
+        self._enricher = enricher
+        self.supported_countries = frozenset(range(1, 49))
+        self._number_type_map = None
+        self._country_codes = None
+        self._length_table = None
+        unknown = [field for field in fields or () if field not in self.SCAN_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown scan fields: {', '.join(unknown)} (available: {', '.join(self.SCAN_FIELDS)})")
+        self.prescreen = prescreen
+        self.fields = frozenset(self.SCAN_FIELDS if fields is None else fields)
+        self.full = not prescreen and len(self.fields) == len(self.SCAN_FIELDS)
+        # Wyniki innych profili (prescreen / wybrane pola) w cache pod osobnym kluczem
+        self.cache_suffix = "" if self.full else f"|{int(prescreen)}:{','.join(sorted(self.fields))}"
+
+    @property
+    def options(self):
+        # Konfiguracja przekazywana do procesów roboczych stream_scan
+        return {"prescreen": self.prescreen, "fields": sorted(self.fields)}
+
+    @property
+    def country_codes(self):
+        # Wszystkie kody krajów z metadanych phonenumbers (bez ładowania geokodera)
+        if self._country_codes is None:
+            load_phonenumbers()
+            self._country_codes = frozenset(phonenumbers.COUNTRY_CODE_TO_REGION_CODE)
+        return self._country_codes
+
+    @property
+    def length_table(self):
+        # kod kraju -> (dopuszczalne długości numeru krajowego, minimum, wzorzec prefiksu krajowego lub None)
+        # z metadanych głównego regionu - tych samych, których używa is_possible_number
+        if self._length_table is None:
+            load_phonenumbers()
+            table = {}
+            for country_code in self.supported_countries & self.country_codes:
+                metadata = phonenumbers.PhoneMetadata.metadata_for_region_or_calling_code(
+                    country_code, phonenumbers.region_code_for_country_code(country_code))
+                general = metadata.general_desc if metadata is not None else None
+                lengths = frozenset(length for length in (general.possible_length or ()) +
+                                    (general.possible_length_local_only or ()) if length > 0) if general else None
+                if lengths:
+                    prefix = metadata.national_prefix_for_parsing
+                    table[country_code] = (lengths, min(lengths), re.compile(prefix) if prefix else None)
+            self._length_table = table
+        return self._length_table
+
+    @property
+    def number_type_map(self):
+        if self._number_type_map is None:
+            load_phonenumbers()
+            self._number_type_map = self._build_number_type_map()
+        return self._number_type_map
+
+    def _build_number_type_map(self):
+        return {
             PhoneNumberType.MOBILE: "Mobile",
             PhoneNumberType.FIXED_LINE: "Fixed Line",
             PhoneNumberType.FIXED_LINE_OR_MOBILE: "Fixed Line or Mobile",
@@ -74,66 +936,191 @@ class PhoneScanner:
         }
 
     def validate_number(self, number_str):
+        key = self.cache.normalize(number_str) + self.cache_suffix
+        cached = self.cache.get(key)
+        if cached is None:
+            started = time.perf_counter()
+            cached = self._scan_number(number_str)
+            self.cache.put(key, cached)
+            VALIDATE_SECONDS.observe(time.perf_counter() - started)
+        elif "error" not in cached:
+            scanner_log.debug("Number scan cache hit: %s", cached["full_e164"])
+        if "error" in cached:
+            return dict(cached)
+        # Kopia z cache, pola zmienne wypełniane przy każdym wywołaniu
+        result = {**cached, "scan_time": datetime.now().isoformat()}
+        for field in ("possible_formats", "timezones"):
+            if field in cached:
+                result[field] = list(cached[field])
+        return result
+
+    def _prescreen(self, number_str):
+        # Poziom 1 bez parsowania - odrzuca tylko wejścia, dla których phonenumbers.parse i tak zwróciłby
+        # błąd (albo kod kraju spoza obsługiwanych): pierwszy znak numeru to nie "+", nieznany kod kraju
+        # (tablica zbiorów), długość numeru krajowego poza granicami. Zwraca komunikat albo None
+        text = str(number_str)
+        start = PRESCREEN_START.search(text)
+        if start is None or start.group() not in "+\uff0b":
+            return "Invalid number format: expected international format starting with '+'"
+        digits = text[start.end():].translate(PRESCREEN_SEPARATORS)
+        if not (digits.isascii() and digits.isdigit()):
+            # Litery, numer wewnętrzny, nietypowe separatory - decyzję podejmie phonenumbers
+            return None
+        country_code, size = None, 0
+        if digits[0] != "0":
+            country_codes = self.country_codes
+            for size in (1, 2, 3):
+                if int(digits[:size]) in country_codes:
+                    country_code = int(digits[:size])
+                    break
+        if country_code is None:
+            return "Invalid number format: unknown country code"
+        if country_code not in self.supported_countries:
+            return f"Unsupported country code: +{country_code}. Supported: +1 to +48."
+        national_length = len(digits) - size
+        if not PRESCREEN_MIN_NSN <= national_length <= PRESCREEN_MAX_NSN:
+            return "Invalid number format: wrong number of digits"
+        lengths = self.length_table.get(country_code)
+        if lengths is not None:
+            # Za krótki zostaje za krótki także po odcięciu prefiksu krajowego; pozostałe długości
+            # rozstrzygamy tylko, gdy phonenumbers nie będzie niczego odcinał
+            possible, shortest, national_prefix = lengths
+            if national_length < shortest:
+                return "Not a possible number: too short"
+            if national_length not in possible and (national_prefix is None
+                                                    or not national_prefix.match(digits, size)):
+                return "Not a possible number: invalid length"
+        return None
+
+    def _screened(self, message):
+        NUMBERS_SCANNED["screened"].inc()
+        scanner_log.debug("Number rejected by pre-screen: %s", message)
+        return {"error": message, "screened": True}
+
+    def normalize_e164(self, number_str):
+        # Minimalne parsowanie do E.164 (bez walidacji i metadanych) dla sprawdzania przynależności do rejestru;
+        # zwraca (e164, None) albo (None, błąd). Wejście "+cyfry" z obsługiwanym kodem kraju jest już postacią
+        # E.164, o ile phonenumbers niczego z niego nie odetnie (prefiks krajowy nie pasuje); reszta - parse
+        text = str(number_str)
+        start = PRESCREEN_START.search(text)
+        if start is not None and start.group() in "+\uff0b":
+            digits = text[start.end():].translate(PRESCREEN_SEPARATORS)
+            if digits.isascii() and digits.isdigit() and digits[0] != "0":
+                length_table = self.length_table
+                # Kody krajów są bezprefiksowe, więc pierwsze trafienie w tablicy to kod kraju numeru
+                for size in (1, 2, 3):
+                    lengths = length_table.get(int(digits[:size]))
+                    if lengths is not None:
+                        national_prefix = lengths[2]
+                        if (PRESCREEN_MIN_NSN <= len(digits) - size <= PRESCREEN_MAX_NSN and
+                                (national_prefix is None or not national_prefix.match(digits, size))):
+                            return "+" + digits, None
+                        break
+        load_phonenumbers()
         try:
+            parsed = phonenumbers.parse(text)
+        except phonenumbers.NumberParseException as e:
+            return None, f"Invalid number format: {str(e)}"
+        return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164), None
+
+    def _scan_number(self, number_str):
+        if self.prescreen:
+            rejected = self._prescreen(number_str)
+            if rejected is not None:
+                return self._screened(rejected)
+        selected = self.fields
+        if selected & self.GEOCODER_FIELDS:
+            load_metadata()
+        else:
+            load_phonenumbers()
+        clock = time.perf_counter
+        try:
+            started = clock()
             parsed = phonenumbers.parse(number_str)
-            is_valid = phonenumbers.is_valid_number(parsed)
+            parsed_at = clock()
+            # Poziom 2: is_possible_number (sama długość wg metadanych regionu) przed is_valid_number
             is_possible = phonenumbers.is_possible_number(parsed)
+            if self.prescreen and not is_possible:
+                reason = phonenumbers.is_possible_number_with_reason(parsed)
+                return self._screened(f"Not a possible number: {POSSIBLE_NUMBER_REASONS.get(reason, 'invalid length')}")
+            is_valid = phonenumbers.is_valid_number(parsed)
             country_code = parsed.country_code
             national_number = parsed.national_number
             
             if country_code not in self.supported_countries:
+                NUMBERS_SCANNED["unsupported"].inc()
                 return {"error": f"Unsupported country code: +{country_code}. Supported: +1 to +48."}
             
-            number_type = phonenumbers.number_type(parsed)
-            number_type_str = self.number_type_map.get(number_type, "Unknown")
-            country = geocoder.country_name_for_number(parsed, "en") or "Unknown"
-            country_iso = phonenumbers.region_code_for_number(parsed) or "Unknown"
-            possible_formats = [
-                phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.INTERNATIONAL),
-                phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164),
-                phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.NATIONAL)
-            ]
-            
+            # Wynik budowany w stałej kolejności kluczy; pola spoza self.fields są pomijane
             result = {
                 "valid": is_valid,
                 "possible": is_possible,
                 "country_code": f"+{country_code}",
-                "national_number": str(national_number),
-                "full_international": phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.INTERNATIONAL),
-                "full_e164": phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164),
-                "possible_formats": possible_formats,
-                "country": country,
-                "country_iso": country_iso,
-                "scan_time": datetime.now().isoformat(),
-                "carrier": carrier.name_for_number(parsed, "en") or "Unknown",
-                "geolocation": geocoder.description_for_number(parsed, "en") or "Unknown",
-                "timezones": list(timezone.time_zones_for_number(parsed)) or ["Unknown"],
-                "number_type": number_type_str,
-                "name": "Not available (ethical privacy; use user_provided_name for manual input)",
+                "national_number": str(national_number)
+            }
+            if "number_type" in selected:
+                number_type = self.number_type_map.get(phonenumbers.number_type(parsed), "Unknown")
+            country_iso = phonenumbers.region_code_for_number(parsed) or "Unknown"
+            validated_at = clock()
+            stages = [("parse", parsed_at - started), ("validate", validated_at - parsed_at)]
+            if "formats" in selected:
+                possible_formats = [
+                    phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.INTERNATIONAL),
+                    phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164),
+                    phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.NATIONAL)
+                ]
+                result["full_international"] = possible_formats[0]
+                result["full_e164"] = possible_formats[1]
+                result["possible_formats"] = possible_formats
+            else:
+                result["full_e164"] = phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+            checkpoint = clock()
+            stages.append(("format", checkpoint - validated_at))
+            if "country" in selected or "geolocation" in selected:
+                if "country" in selected:
+                    result["country"] = geocoder.country_name_for_number(parsed, "en") or "Unknown"
+                if "geolocation" in selected:
+                    geolocation = geocoder.description_for_number(parsed, "en") or "Unknown"
+                checkpoint, previous = clock(), checkpoint
+                stages.append(("geocode", checkpoint - previous))
+            result["country_iso"] = country_iso
+            result["scan_time"] = datetime.now().isoformat()
+            if "carrier" in selected:
+                result["carrier"] = carrier.name_for_number(parsed, "en") or "Unknown"
+                checkpoint, previous = clock(), checkpoint
+                stages.append(("carrier", checkpoint - previous))
+            if "geolocation" in selected:
+                result["geolocation"] = geolocation
+            if "timezones" in selected:
+                result["timezones"] = list(timezone.time_zones_for_number(parsed)) or ["Unknown"]
+                checkpoint, previous = clock(), checkpoint
+                stages.append(("timezone", checkpoint - previous))
+            if "number_type" in selected:
+                result["number_type"] = number_type
+            result.update({
+                "name": NAME_PLACEHOLDER,
                 "user_provided_name": "",
-                "mac_address": "N/A (MAC address is device-specific, not applicable to phone numbers)",
-                "signal_strength": "N/A (requires device access; use user_reported_signal for manual input)",
+                "mac_address": MAC_PLACEHOLDER,
+                "signal_strength": SIGNAL_PLACEHOLDER,
                 "user_reported_signal": "",
                 "ip_address": ""  # Pole dla opcjonalnego IP
-            }
+            })
             
             # Logowanie szczegółów
-            log_message = (
-                f"Number Scan:\n"
-                f"  Number: {result['full_e164']}\n"
-                f"  Valid: {is_valid}\n"
-                f"  Type: {number_type_str}\n"
-                f"  Country: {country} ({country_iso})\n"
-                f"  Carrier: {result['carrier']}\n"
-                f"  Geolocation: {result['geolocation']}\n"
-                f"  Timezones: {', '.join(result['timezones'])}\n"
-                f"  Scan Time: {result['scan_time']}\n"
-                f"{'-'*50}"
-            )
-            logging.info(log_message)
+            fields = {key: result[key] for key in ("full_e164", "valid", "number_type", "country", "country_iso",
+                                                   "carrier", "geolocation", "timezones", "scan_time")
+                      if key in result}
+            scanner_log.info(LazyLogMessage(_number_scan_message, fields),
+                             extra={"event": "number_scan", "fields": fields, "sampled": True})
+            stages.append(("log", clock() - checkpoint))
+            for stage, elapsed in stages:
+                SCAN_STAGE_SECONDS[stage].observe(elapsed)
+            NUMBERS_SCANNED["valid" if is_valid else "invalid"].inc()
             return result
         except phonenumbers.NumberParseException as e:
-            logging.error(f"Invalid number format: {str(e)}")
+            NUMBERS_SCANNED["error"].inc()
+            scanner_log.error("Invalid number format: %s", e,
+                              extra={"event": "number_invalid", "fields": {"error": str(e)}, "sampled": True})
             return {"error": f"Invalid number format: {str(e)}"}
 
     def check_for_scams(self, number_str, search_engine="google"):
@@ -145,102 +1132,1574 @@ class PhoneScanner:
             "suggested_search_url": search_url,
             "warning": "For safety only. Do not misuse."
         }
-        logging.info(f"Scam check initiated for {formatted_number}")
+        scanner_log.info(f"Scam check initiated for {formatted_number}")
         return result
 
-    def check_ip_address(self, ip_address):
-        try:
-            response = requests.get(f"http://ip-api.com/json/{ip_address}")
-            data = response.json()
-            if data["status"] == "success":
-                result = {
-                    "ip_address": ip_address,
-                    "country": data.get("country", "Unknown"),
-                    "country_code": data.get("countryCode", "Unknown"),
-                    "region": data.get("regionName", "Unknown"),
-                    "city": data.get("city", "Unknown"),
-                    "isp": data.get("isp", "Unknown"),
-                    "org": data.get("org", "Unknown"),
-                    "as": data.get("as", "Unknown"),
-                    "query_time": datetime.now().isoformat()
-                }
-                log_message = (
-                    f"IP Check:\n"
-                    f"  IP: {ip_address}\n"
-                    f"  Country: {result['country']} ({result['country_code']})\n"
-                    f"  Region: {result['region']}\n"
-                    f"  City: {result['city']}\n"
-                    f"  ISP: {result['isp']}\n"
-                    f"  Query Time: {result['query_time']}\n"
-                    f"{'-'*50}"
-                )
-                logging.info(log_message)
-                return result
+    @property
+    def enricher(self):
+        if self._enricher is None:
+            self._enricher = get_ip_enricher()
+        return self._enricher
+
+    def check_ip_address(self, ip_address):
+        result = self.enricher.lookup(ip_address)
+        if "error" in result:
+            scanner_log.error(result["error"])
+            return result
+        fields = {key: result[key] for key in ("ip_address", "country", "country_code", "region", "city", "isp",
+                                               "query_time")}
+        scanner_log.info(LazyLogMessage(_ip_check_message, fields),
+                         extra={"event": "ip_check", "fields": fields, "sampled": True})
+        return result
+
+    def scan_one(self, number_str, scam_check=False):
+        result = self.validate_number(number_str)
+        if scam_check and "error" not in result:
+            result.update(self.check_for_scams(number_str))
+        return result
+
+    def stream_scan(self, numbers, workers=None, chunk_size=BATCH_CHUNK_SIZE, scam_check=False):
+        # Wyniki w kolejności wejścia; w locie najwyżej 2 paczki na proces, więc pamięć jest stała
+        workers = workers or os.cpu_count() or 1
+        total = 0
+        started = time.perf_counter()
+        if workers == 1:
+            for chunk in _chunked(numbers, chunk_size):
+                for num in chunk:
+                    yield self.scan_one(num, scam_check)
+                total += len(chunk)
+                self._record_progress(len(chunk), total, started)
+            self._log_stream_summary(total, workers, started)
+            return
+        from concurrent.futures import ProcessPoolExecutor
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(_log_config,)) as pool:
+            try:
+                for chunk in _chunked(numbers, chunk_size):
+                    pending.append(pool.submit(_scan_chunk, chunk, self.api_key, scam_check, self.options))
+                    if len(pending) >= workers * 2:
+                        total = yield from self._collect_chunk(pending.popleft(), total, started)
+                while pending:
+                    total = yield from self._collect_chunk(pending.popleft(), total, started)
+            finally:
+                for future in pending:
+                    future.cancel()
+        self._log_stream_summary(total, workers, started)
+
+    def _collect_chunk(self, future, total, started):
+        results, worker_metrics = future.result()
+        METRICS.merge(worker_metrics)
+        yield from results
+        total += len(results)
+        self._record_progress(len(results), total, started)
+        return total
+
+    def _record_progress(self, count, total, started):
+        BATCH_NUMBERS.inc(count)
+        elapsed = time.perf_counter() - started
+        if elapsed > 0:
+            BATCH_RATE.set(round(total / elapsed, 1))
+
+    def _log_stream_summary(self, total, workers, started):
+        elapsed = time.perf_counter() - started
+        fields = {"numbers": total, "workers": workers, "elapsed_s": round(elapsed, 3),
+                  "numbers_per_s": round(total / elapsed, 1) if elapsed > 0 else 0.0}
+        scanner_log.info(f"Stream scan completed for {total} numbers using {workers} workers "
+                         f"in {elapsed:.2f}s", extra={"event": "stream_scan_summary", "fields": fields})
+
+    def batch_scan(self, numbers_list, workers=1):
+        results = list(self.stream_scan(numbers_list, workers=workers, scam_check=True))
+        scanner_log.info(f"Batch scan completed for {len(results)} numbers")
+        return results
+
+def _json_default(value):
+    if isinstance(value, RegistryRecord):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def atomic_write_json(path, data, indent=None, fsync=True):
+    # Zapis do pliku tymczasowego + os.replace: przerwany zapis nie psuje pliku docelowego
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, default=_json_default)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def atomic_write_json_lines(path, records):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _file_id(path):
+    # Tożsamość pliku na dysku: zmienia się przy każdym os.replace lub dopisaniu
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class JsonFileStorage:
+    # Klasyczny zapis: cały rejestr w jednym pliku JSON przy każdej zmianie
+    BACKEND = "json"
+
+    def __init__(self, registry_file="phone_registry.json"):
+        self.registry_file = registry_file
+        self.loaded_id = None
+
+    def sync(self):
+        # Zmiany zapisane przez inne procesy: None (bez zmian) albo ("full", rejestr)
+        if _file_id(self.registry_file) == self.loaded_id:
+            return None
+        return "full", self.load()
+
+    def load(self, truncate=True):
+        # truncate: zgodność z JournalStorage (plik JSON jest zapisywany atomowo, nie ma czego przycinać)
+        self.loaded_id = _file_id(self.registry_file)
+        if os.path.exists(self.registry_file):
+            try:
+                with open(self.registry_file, 'r', encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception as e:
+                storage_log.error(f"Failed to load registry: {str(e)}")
+                return {}
+        return {}
+
+    def save(self, registry):
+        try:
+            atomic_write_json(self.registry_file, registry, indent=2, fsync=False)
+            self.loaded_id = _file_id(self.registry_file)
+            storage_log.info("Registry saved successfully")
+        except Exception as e:
+            storage_log.error(f"Failed to save registry: {str(e)}")
+
+    def put(self, hashed_number, entry, registry):
+        self.save(registry)
+
+    def put_many(self, entries, registry):
+        self.save(registry)
+
+    def delete(self, hashed_number, registry):
+        self.save(registry)
+
+    def close(self):
+        pass
+
+class JournalStorage:
+    # Snapshot JSON (registry_file) + dziennik operacji dopisywanych na końcu (registry_file.journal).
+    # Rejestracja kosztuje jedną linię, niezależnie od rozmiaru rejestru; dziennik jest
+    # okresowo scalany do snapshotu (koszt zamortyzowany O(1) na operację).
+    BACKEND = "journal"
+
+    def __init__(self, registry_file="phone_registry.json", compact_every=10000, fsync=False):
+        self.registry_file = registry_file
+        self.journal_file = f"{registry_file}.journal"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.journal = None
+        self.pending_ops = 0
+        # Stan zsynchronizowany z dyskiem: snapshot, i-węzeł dziennika i przeczytana część dziennika
+        self.snapshot_id = None
+        self.journal_ino = None
+        self.journal_offset = 0
+
+    def load(self, truncate=True):
+        # truncate=False: odczyt bez blokady - niepełna ostatnia linia może być zapisem innego procesu w toku
+        self.close()
+        snapshot = JsonFileStorage(self.registry_file)
+        registry = snapshot.load()
+        self.snapshot_id = snapshot.loaded_id
+        self.pending_ops = 0
+        self.journal_ino = None
+        self.journal_offset = 0
+        if not os.path.exists(self.journal_file):
+            return registry
+        self.journal_ino = os.stat(self.journal_file).st_ino
+        records, good_offset = self._read_journal(0, truncate)
+        for record in records:
+            self._apply(registry, record)
+        if truncate and good_offset < os.path.getsize(self.journal_file):
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(good_offset)
+        self.journal_offset = good_offset
+        storage_log.info(f"Replayed {self.pending_ops} journal records from {self.journal_file}")
+        return registry
+
+    def _read_journal(self, offset, log_torn=True):
+        records = []
+        with open(self.journal_file, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Urwana ostatnia linia (awaria albo zapis w toku) - pomijamy ją
+                    if log_torn:
+                        storage_log.warning(f"Discarding truncated journal record in {self.journal_file}")
+                    break
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    storage_log.error(f"Skipping corrupt journal record in {self.journal_file}")
+                    continue
+                records.append(record)
+                self.pending_ops += len(record.get("records", ())) or 1
+        return records, offset
+
+    def sync(self):
+        # Zmiany innych procesów: None, ("ops", rekordy dziennika od ostatniego odczytu) albo
+        # ("full", rejestr) po kompakcji (nowy snapshot / nowy plik dziennika)
+        journal_stat = os.stat(self.journal_file) if os.path.exists(self.journal_file) else None
+        journal_ino = journal_stat.st_ino if journal_stat else None
+        if _file_id(self.registry_file) != self.snapshot_id or journal_ino != self.journal_ino or (
+                journal_stat and journal_stat.st_size < self.journal_offset):
+            return "full", self.load(truncate=False)
+        if journal_stat is None or journal_stat.st_size == self.journal_offset:
+            return None
+        records, self.journal_offset = self._read_journal(self.journal_offset, log_torn=False)
+        return ("ops", records) if records else None
+
+    def _apply(self, registry, record):
+        if record.get("op") == "put":
+            registry[record["key"]] = record["entry"]
+        elif record.get("op") == "del":
+            registry.pop(record["key"], None)
+        elif record.get("op") == "batch":
+            for item in record["records"]:
+                self._apply(registry, item)
+
+    def _append(self, record, registry):
+        try:
+            if self.journal is None:
+                self.journal = open(self.journal_file, "a", encoding="utf-8")
+                self.journal_ino = os.fstat(self.journal.fileno()).st_ino
+            self.journal.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.journal.flush()
+            if self.fsync:
+                os.fsync(self.journal.fileno())
+            self.journal_offset = self.journal.tell()
+            self.pending_ops += len(record.get("records", ())) or 1
+        except Exception as e:
+            storage_log.error(f"Failed to append to journal: {str(e)}")
+            return
+        if self.pending_ops >= max(self.compact_every, len(registry)):
+            self.compact(registry)
+
+    def put(self, hashed_number, entry, registry):
+        self._append({"op": "put", "key": hashed_number, "entry": entry}, registry)
+
+    def put_many(self, entries, registry):
+        # Cała paczka w jednej linii dziennika: po awarii albo jest w całości, albo wcale
+        if self.pending_ops + len(entries) >= max(self.compact_every, len(registry)):
+            self.compact(registry)
+            return
+        records = [{"op": "put", "key": hashed_number, "entry": entry} for hashed_number, entry in entries.items()]
+        self._append({"op": "batch", "records": records}, registry)
+
+    def delete(self, hashed_number, registry):
+        self._append({"op": "del", "key": hashed_number}, registry)
+
+    def write(self, records, registry):
+        # Dowolne operacje put/del (już zastosowane do registry) w jednej linii dziennika
+        if len(records) == 1:
+            self._append(records[0], registry)
+        elif records:
+            self._append({"op": "batch", "records": records}, registry)
+
+    def apply(self, registry, records):
+        # Rekordy z sync() ("ops") naniesione na słownik w pamięci
+        for record in records:
+            self._apply(registry, record)
+
+    def compact(self, registry):
+        # Najpierw nowy snapshot (atomowo), potem pusty dziennik. Awaria pomiędzy jest bezpieczna:
+        # operacje w dzienniku są idempotentne i zostaną ponownie zastosowane do nowego snapshotu.
+        try:
+            with storage_timer(self.BACKEND, "compact"):
+                atomic_write_json(self.registry_file, registry)
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            atomic_write_json_lines(self.journal_file, [])
+            self.snapshot_id = _file_id(self.registry_file)
+            self.journal_ino = os.stat(self.journal_file).st_ino
+            self.journal_offset = 0
+            self.pending_ops = 0
+            storage_log.info(f"Registry compacted into {self.registry_file} ({len(registry)} entries)")
+        except Exception as e:
+            storage_log.error(f"Failed to compact registry: {str(e)}")
+
+    def save(self, registry):
+        self.compact(registry)
+
+    def import_registry(self, source_file):
+        # Jednorazowy import istniejącego phone_registry.json do snapshotu
+        registry = JsonFileStorage(source_file).load()
+        self.compact(registry)
+        storage_log.info(f"Imported {len(registry)} entries from {source_file}")
+        return registry
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+STORAGE_BACKENDS = {
+    "json": JsonFileStorage,
+    "journal": JournalStorage
+}
+
+class RegistryConflictError(Exception):
+    # Zapis warunkowy (expected_version) trafił na wpis zmieniony w międzyczasie przez inny proces
+    def __init__(self, keys, expected_version, current_version):
+        self.keys = list(keys)
+        self.expected_version = expected_version
+        self.current_version = current_version
+        super().__init__(f"Conflicting write: {len(self.keys)} entries changed since version {expected_version} "
+                         f"(current version {current_version})")
+
+class RegistryLock:
+    # Doradcza blokada międzyprocesowa na pliku <registry>.lock (flock / msvcrt), reentrant w obrębie procesu.
+    # Plik przechowuje też wersję rejestru (licznik zapisów) - czytelnicy porównują ją bez blokady.
+    VERSION_WIDTH = 20
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.handle = None
+
+    def _open(self, create=True):
+        # create=False: odczyt wersji nie tworzy pliku - powstaje przy pierwszej blokadzie (zapisie)
+        if self.handle is None:
+            try:
+                fd = os.open(self.path, os.O_RDWR | (os.O_CREAT if create else 0), 0o644)
+            except FileNotFoundError:
+                return None
+            self.handle = os.fdopen(fd, "r+b", buffering=0)
+        return self.handle
+
+    def exists(self):
+        return self.handle is not None or os.path.exists(self.path)
+
+    def _try_lock(self, handle):
+        if os.name == "nt":
+            import msvcrt
+            # Blokowany bajt za polem wersji, żeby odczyt wersji nie był blokowany
+            handle.seek(self.VERSION_WIDTH + 1)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(self, handle):
+        if os.name == "nt":
+            import msvcrt
+            handle.seek(self.VERSION_WIDTH + 1)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def acquire(self):
+        if not self.thread_lock.acquire(timeout=self.timeout):
+            raise TimeoutError(f"Timed out waiting for registry lock {self.path}")
+        if self.depth == 0:
+            try:
+                handle = self._open()
+                deadline = time.monotonic() + self.timeout
+                started = time.perf_counter()
+                while True:
+                    try:
+                        self._try_lock(handle)
+                        break
+                    except OSError:
+                        if time.monotonic() >= deadline:
+                            raise TimeoutError(f"Registry {self.path} is locked by another process")
+                        time.sleep(0.005)
+                LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+            except BaseException:
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            self._unlock(self.handle)
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def read_version(self):
+        with self.thread_lock:
+            handle = self._open(create=False)
+            if handle is None:
+                return 0
+            handle.seek(0)
+            data = handle.read(self.VERSION_WIDTH)
+        try:
+            return int(data)
+        except ValueError:
+            return 0
+
+    def write_version(self, version):
+        # Tylko pod blokadą; stała szerokość pola - nadpisanie w miejscu, bez chwili z pustym plikiem
+        handle = self._open()
+        handle.seek(0)
+        handle.write(f"{version:0{self.VERSION_WIDTH}d}\n".encode())
+
+    def close(self):
+        with self.thread_lock:
+            if self.handle is not None and self.depth == 0:
+                self.handle.close()
+                self.handle = None
+
+class ChangeLog:
+    # Dziennik zmian rejestru (<registry_file>.changes) dla synchronizacji przyrostowej: linia JSON na zmieniony
+    # wpis, seq = wersja rejestru nadana zapisowi, dopisywana pod blokadą pliku rejestru przed podbiciem wersji
+    # (seq niemalejące; linie do opublikowanej wersji są zawsze kompletne). Pierwsza linia {"op": "start"}
+    # z wersją, od której dziennik jest prowadzony - wcześniejszych zmian w nim nie ma
+    def __init__(self, path):
+        self.path = path
+        # (i-węzeł, start) - truncate podmienia plik, więc start z innego i-węzła jest nieaktualny
+        self._start = None
+
+    @staticmethod
+    def _header(version):
+        return json.dumps({"seq": version, "op": "start", "changed_at": datetime.now().isoformat()}) + "\n"
+
+    def open(self, version):
+        # Pod blokadą rejestru, gdy dziennika jeszcze nie ma: zaczyna się od bieżącej wersji
+        with open(self.path, "x", encoding="utf-8") as f:
+            f.write(self._header(version))
+
+    @property
+    def start(self):
+        with open(self.path, "rb") as f:
+            ino = os.fstat(f.fileno()).st_ino
+            if self._start is None or self._start[0] != ino:
+                self._start = (ino, json.loads(f.readline())["seq"])
+        return self._start[1]
+
+    def append(self, seq, changes):
+        # changes: [(op, hashed_number, original_number)], op = register / update / delete
+        changed_at = datetime.now().isoformat()
+        lines = "".join(json.dumps({"seq": seq, "op": op, "changed_at": changed_at, "hashed_number": hashed_number,
+                                    "original_number": original_number}, separators=(",", ":")) + "\n"
+                        for op, hashed_number, original_number in changes)
+        with open(self.path, "a+b") as f:
+            # Urwana linia po awarii nie może skleić się z nowym zapisem
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    lines = "\n" + lines
+            f.write(lines.encode())
+
+    @staticmethod
+    def _next_seq(f):
+        # seq pierwszej pełnej, poprawnej linii od bieżącej pozycji; None na końcu pliku
+        for line in iter(f.readline, b""):
+            if not line.endswith(b"\n"):
+                return None
+            try:
+                return json.loads(line)["seq"]
+            except (ValueError, KeyError, TypeError):
+                continue
+        return None
+
+    @staticmethod
+    def _seek_line(f, position):
+        # Na początek pierwszej linii zaczynającej się na pozycji >= position
+        f.seek(max(position - 1, 0))
+        if position:
+            f.readline()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _seek_after(self, f, since):
+        # Wyszukiwanie binarne po pozycji w pliku: na początek pierwszej linii o seq > since
+        low, high = 0, f.seek(0, os.SEEK_END)
+        while low < high:
+            middle = (low + high) // 2
+            self._seek_line(f, middle)
+            seq = self._next_seq(f)
+            if seq is None or seq > since:
+                high = middle
+            else:
+                low = middle + 1
+        self._seek_line(f, low)
+
+    def read(self, since=0, until=None):
+        # Zdarzenia o seq > since (i <= until): wyszukiwanie binarne, potem odczyt sekwencyjny - koszt zależy
+        # od liczby zmian, nie od długości dziennika
+        if not self.exists():
+            return
+        with open(self.path, "rb") as f:
+            self._seek_after(f, since)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    continue
+                if until is not None and change["seq"] > until:
+                    break
+                if change["op"] != "start" and change["seq"] > since:
+                    yield change
+
+    def truncate(self, version):
+        # Pod blokadą rejestru: usuwa zdarzenia o seq <= version, dziennik zaczyna się od version.
+        # Nowy plik (nagłówek + skopiowany ogon) podmieniany atomowo; zwraca liczbę usuniętych zdarzeń
+        removed = 0
+        temp_path = f"{self.path}.tmp"
+        with open(self.path, "rb") as f:
+            f.readline()
+            header_end = f.tell()
+            self._seek_after(f, version)
+            tail = f.tell()
+            f.seek(header_end)
+            while f.tell() < tail:
+                removed += f.read(min(1 << 20, tail - f.tell())).count(b"\n")
+            with open(temp_path, "wb") as out:
+                out.write(self._header(version).encode())
+                shutil.copyfileobj(f, out)
+        os.replace(temp_path, self.path)
+        return removed
+
+# Znacznik wpisu, którego ip_info czeka na kolejkę wzbogacania
+PENDING_IP_INFO = {"status": "pending"}
+
+class EnrichmentQueue:
+    # Trwała kolejka odroczonego wzbogacania IP: rejestracja zapisuje wpis od razu z ip_info "pending",
+    # a wątki robocze uzupełniają dane później (ponowienia z wykładniczym backoffem).
+    # Stan kolejki (tylko niezakończone pozycje): snapshot <registry_file>.enrich.json + dziennik operacji
+    # (JournalStorage) - zgłoszenie kosztuje jedną linię. Każda zmiana pod blokadą pliku rejestru, po wczytaniu
+    # zmian innych procesów, więc kilka procesów może dzielić jedną kolejkę.
+    def __init__(self, registry, state_file=None, enricher=None, max_attempts=5, base_delay=30,
+                 max_delay=3600, batch_size=100, claim_timeout=600, compact_every=10000):
+        self.registry = registry
+        self.state_file = state_file or f"{registry.registry_file}.enrich.json"
+        self._enricher = enricher
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        # Pozycja "in_progress" starsza niż claim_timeout (proces przerwany w trakcie) wraca do kolejki
+        self.claim_timeout = claim_timeout
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.storage = JournalStorage(self.state_file, compact_every=compact_every)
+        if registry.file_lock.exists():
+            with registry.file_lock, self.lock:
+                self.items = self.storage.load()
+        else:
+            self.items = self.storage.load(truncate=False)
+        registry.enrichment = self
+
+    @property
+    def enricher(self):
+        return self._enricher or self.registry.scanner.enricher
+
+    def _sync(self):
+        # Pod blokadą pliku rejestru: zmiany kolejki zapisane przez inne procesy
+        changes = self.storage.sync()
+        if changes is None:
+            return
+        kind, data = changes
+        if kind == "full":
+            self.items = data
+        else:
+            self.storage.apply(self.items, data)
+
+    def _refresh(self):
+        with self.registry.file_lock, self.lock:
+            self._sync()
+
+    def submit(self, hashed_number, ip_address):
+        self.submit_many([(hashed_number, ip_address)])
+
+    def submit_many(self, items):
+        queued_at = datetime.now().isoformat()
+        records = []
+        with self.registry.file_lock, self.lock:
+            self._sync()
+            for hashed_number, ip_address in items:
+                item = self.items[hashed_number] = {
+                    "hashed_number": hashed_number,
+                    "ip_address": ip_address,
+                    "status": "pending",
+                    "attempts": 0,
+                    "next_attempt": 0,
+                    "last_error": "",
+                    "queued_at": queued_at
+                }
+                records.append({"op": "put", "key": hashed_number, "entry": item})
+            self.storage.write(records, self.items)
+        if records:
+            enrichment_log.info(f"Queued {len(records)} entries for IP enrichment")
+            self.wakeup.set()
+        return len(records)
+
+    def pending(self):
+        self._refresh()
+        with self.lock:
+            return [dict(item) for item in self.items.values() if item["status"] != "failed"]
+
+    def failed(self):
+        self._refresh()
+        with self.lock:
+            return [dict(item) for item in self.items.values() if item["status"] == "failed"]
+
+    def retry_failed(self):
+        with self.registry.file_lock, self.lock:
+            self._sync()
+            records = []
+            for hashed_number, item in self.items.items():
+                if item["status"] == "failed":
+                    item.update({"status": "pending", "attempts": 0, "next_attempt": 0})
+                    records.append({"op": "put", "key": hashed_number, "entry": item})
+            self.storage.write(records, self.items)
+        self.wakeup.set()
+        return len(records)
+
+    def requeue_entries(self, mode="missing"):
+        # missing = wpisy z IP bez danych (lub pending/failed), all = wszystkie wpisy z IP
+        items = []
+        for entry in self.registry.iter_entries():
+            ip_address = entry["scan_data"].get("ip_address", "")
+            ip_info = entry.get("ip_info")
+            ip_info = ip_info if isinstance(ip_info, dict) else {}
+            if ip_address and (mode == "all" or not ip_info or ip_info.get("status") in ("pending", "failed")):
+                items.append((entry["hashed_number"], ip_address))
+        return self.submit_many(items)
+
+    def _claimable(self, item, now):
+        if item["status"] == "in_progress":
+            return item.get("claimed_at", 0) + self.claim_timeout <= now
+        return item["status"] == "pending" and item["next_attempt"] <= now
+
+    def _claim(self, now):
+        # Zajęcie pozycji jest zapisywane - inny proces nie weźmie ich do czasu claim_timeout
+        with self.registry.file_lock, self.lock:
+            self._sync()
+            due = list(itertools.islice((item for item in self.items.values() if self._claimable(item, now)),
+                                        self.batch_size))
+            for item in due:
+                item["status"] = "in_progress"
+                item["claimed_at"] = now
+            self.storage.write([{"op": "put", "key": item["hashed_number"], "entry": item} for item in due],
+                               self.items)
+            return [dict(item) for item in due]
+
+    def run_once(self):
+        # Przetwarza jedną paczkę należnych pozycji, zwraca listę wyników
+        now = time.time()
+        batch = self._claim(now)
+        if not batch:
+            return []
+        infos = self.enricher.lookup_many(item["ip_address"] for item in batch)
+        results = []
+        updates = {}
+        with self.registry.file_lock, self.lock:
+            self._sync()
+            records = []
+            for claimed in batch:
+                hashed_number = claimed["hashed_number"]
+                item = self.items.get(hashed_number)
+                # Pozycja zgłoszona ponownie albo przejęta po claim_timeout - wynik jest nieaktualny
+                if item is None or item["status"] != "in_progress" or item.get("claimed_at") != now:
+                    continue
+                info = infos.get(claimed["ip_address"], {"error": "IP check error: no result"})
+                if "error" not in info:
+                    del self.items[hashed_number]
+                    records.append({"op": "del", "key": hashed_number})
+                    updates[hashed_number] = (item["ip_address"], info)
+                    results.append({"hashed_number": hashed_number, "ip_address": item["ip_address"],
+                                    "status": "done"})
+                    continue
+                item["attempts"] += 1
+                item["last_error"] = info["error"]
+                # "IP check failed" = odpowiedź usługi (np. private range), ponawianie nic nie zmieni
+                if info["error"].startswith("IP check failed") or item["attempts"] >= self.max_attempts:
+                    item["status"] = "failed"
+                    updates[hashed_number] = (item["ip_address"], {"status": "failed", "message": info["error"]})
+                    enrichment_log.error(f"IP enrichment failed for {hashed_number}: {info['error']}")
+                else:
+                    item["status"] = "pending"
+                    item["next_attempt"] = now + min(self.max_delay, self.base_delay * 2 ** (item["attempts"] - 1))
+                    enrichment_log.warning(f"IP enrichment retry {item['attempts']} scheduled for {hashed_number}: "
+                                    f"{info['error']}")
+                records.append({"op": "put", "key": hashed_number, "entry": item})
+                results.append({key: item[key] for key in ("hashed_number", "ip_address", "status",
+                                                           "attempts", "last_error")})
+            self.storage.write(records, self.items)
+        self.registry.update_ip_infos(updates)
+        return results
+
+    def process_due(self):
+        results = []
+        while True:
+            batch = self.run_once()
+            if not batch:
+                return results
+            results += batch
+
+    def _next_due_in(self):
+        self._refresh()
+        with self.lock:
+            due = [item["next_attempt"] if item["status"] == "pending" else
+                   item.get("claimed_at", 0) + self.claim_timeout
+                   for item in self.items.values() if item["status"] != "failed"]
+        return max(0.0, min(due) - time.time()) if due else None
+
+    def _worker(self):
+        while not self.stopping.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                enrichment_log.error(f"Enrichment worker error: {str(e)}")
+            wait = self._next_due_in()
+            self.wakeup.wait(timeout=min(wait, 60) if wait is not None else 60)
+            self.wakeup.clear()
+
+    def start(self, workers=1):
+        self.stopping.clear()
+        for _ in range(workers):
+            thread = threading.Thread(target=self._worker, name="ip-enrichment", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+        with self.lock:
+            self.storage.close()
+
+# Brak pola w oryginalnym wpisie (odróżniany od pustej wartości)
+_MISSING = object()
+
+class RegistryRecord:
+    # Zwarty wpis rejestru w pamięci: __slots__ zamiast zagnieżdżonych słowników, internowane pola
+    # kategoryczne, stałe opisy i possible_formats/full_e164 wyliczane przy odczycie.
+    # to_dict() odtwarza dokładnie dotychczasowy kształt JSON (łącznie z kolejnością kluczy).
+    SCAN_FIELD_ORDER = (
+        "valid", "possible", "country_code", "national_number", "full_international", "full_e164",
+        "possible_formats", "country", "country_iso", "scan_time", "carrier", "geolocation", "timezones",
+        "number_type", "name", "user_provided_name", "mac_address", "signal_strength", "user_reported_signal",
+        "ip_address", "last_scanned"
+    )
+    STORED_SCAN_FIELDS = tuple(field for field in SCAN_FIELD_ORDER if field not in ("full_e164", "possible_formats"))
+    INTERNED_FIELDS = frozenset(("country_code", "country", "country_iso", "carrier", "geolocation", "number_type"))
+    PLACEHOLDERS = {"name": NAME_PLACEHOLDER, "mac_address": MAC_PLACEHOLDER, "signal_strength": SIGNAL_PLACEHOLDER}
+    ENTRY_FIELDS = ("hashed_number", "original_number", "scan_data", "ip_info", "notes", "registered_at")
+    _timezones = {}
+
+    __slots__ = STORED_SCAN_FIELDS + (
+        "hashed_number", "original_number", "national_format", "ip_info", "notes", "registered_at",
+        "overrides", "extra"
+    )
+
+    @classmethod
+    def from_dict(cls, entry):
+        record = cls.__new__(cls)
+        scan_data = entry.get("scan_data", {})
+        record.hashed_number = entry.get("hashed_number", _MISSING)
+        record.original_number = entry.get("original_number", _MISSING)
+        record.notes = entry.get("notes", _MISSING)
+        record.registered_at = entry.get("registered_at", _MISSING)
+        ip_info = entry.get("ip_info", _MISSING)
+        record.ip_info = None if ip_info == {} else ip_info
+        for field in cls.STORED_SCAN_FIELDS:
+            value = scan_data.get(field, _MISSING)
+            if field in cls.INTERNED_FIELDS and type(value) is str:
+                value = sys.intern(value)
+            elif field in cls.PLACEHOLDERS and value == cls.PLACEHOLDERS[field]:
+                value = None
+            elif field == "timezones" and type(value) is list:
+                key = tuple(value)
+                value = cls._timezones.setdefault(key, key)
+            setattr(record, field, value)
+        # Pola wyliczane: zapamiętujemy tylko odstępstwa od postaci kanonicznej
+        overrides = {}
+        full_e164 = scan_data.get("full_e164", _MISSING)
+        if full_e164 != record.original_number:
+            overrides["full_e164"] = full_e164
+        formats = scan_data.get("possible_formats", _MISSING)
+        record.national_format = None
+        if (type(formats) is list and len(formats) == 3 and formats[0] == record.full_international
+                and formats[1] == full_e164):
+            record.national_format = formats[2]
+        else:
+            overrides["possible_formats"] = formats
+        for key, value in scan_data.items():
+            if key not in cls.SCAN_FIELD_ORDER:
+                overrides[key] = value
+        record.overrides = overrides or None
+        extra = {key: value for key, value in entry.items() if key not in cls.ENTRY_FIELDS}
+        record.extra = extra or None
+        return record
+
+    def scan_value(self, field, default=_MISSING):
+        if self.overrides and field in self.overrides:
+            value = self.overrides[field]
+        elif field == "full_e164":
+            value = self.original_number
+        elif field == "possible_formats":
+            value = [self.full_international, self.original_number, self.national_format]
+        elif field in self.PLACEHOLDERS:
+            value = self.PLACEHOLDERS[field] if getattr(self, field) is None else getattr(self, field)
+        elif field == "timezones":
+            value = list(self.timezones) if type(self.timezones) is tuple else self.timezones
+        elif field in self.STORED_SCAN_FIELDS:
+            value = getattr(self, field)
+        else:
+            value = _MISSING
+        return default if value is _MISSING else value
+
+    def ip_data(self):
+        # ip_info do odczytu: brak pola (_MISSING zostaje tylko dla to_dict), None i wartości spoza słownika -> {}
+        return self.ip_info if isinstance(self.ip_info, dict) else {}
+
+    def scan_data(self):
+        scan_data = {}
+        for field in self.SCAN_FIELD_ORDER:
+            value = self.scan_value(field)
+            if value is not _MISSING:
+                scan_data[field] = value
+        if self.overrides:
+            for key, value in self.overrides.items():
+                if key not in scan_data and value is not _MISSING:
+                    scan_data[key] = value
+        return scan_data
+
+    def to_dict(self):
+        entry = {}
+        for field, value in (("hashed_number", self.hashed_number), ("original_number", self.original_number),
+                             ("scan_data", self.scan_data()),
+                             ("ip_info", {} if self.ip_info is None else self.ip_info),
+                             ("notes", self.notes), ("registered_at", self.registered_at)):
+            if value is not _MISSING:
+                entry[field] = dict(value) if field == "ip_info" and isinstance(value, dict) else value
+        if self.extra:
+            entry.update(self.extra)
+        return entry
+
+# Liczba wierszy na paczkę przy eksporcie strumieniowym
+EXPORT_CHUNK_SIZE = 10000
+
+def _export_value(value):
+    return "" if value is _MISSING or value is None else value
+
+class RegistryExporter:
+    # Strumieniowy eksport rejestru (CSV / JSONL / Parquet / Arrow IPC) paczkami wprost z iteratora
+    # rekordów - bez budowania listy słowników ani DataFrame, pamięć ograniczona do jednej paczki
+    COLUMNS = [
+        ("Hashed Number", lambda r: r.hashed_number),
+        ("Original Number", lambda r: r.original_number),
+        ("Country", lambda r: r.scan_value("country", "")),
+        ("Country ISO", lambda r: r.scan_value("country_iso", "")),
+        ("Carrier", lambda r: r.scan_value("carrier", "")),
+        ("Geolocation", lambda r: r.scan_value("geolocation", "")),
+        ("Number Type", lambda r: r.scan_value("number_type", "")),
+        ("User Provided Name", lambda r: r.scan_value("user_provided_name", "")),
+        ("User Reported Signal", lambda r: r.scan_value("user_reported_signal", "")),
+        ("IP Address", lambda r: r.scan_value("ip_address", "")),
+        ("IP Country", lambda r: r.ip_data().get("country", "")),
+        ("IP ISP", lambda r: r.ip_data().get("isp", "")),
+        ("Notes", lambda r: r.notes),
+        ("Registered At", lambda r: r.registered_at),
+        ("Last Scanned", lambda r: r.scan_value("last_scanned", ""))
+    ]
+    FORMATS = ("csv", "jsonl", "parquet", "arrow")
+
+    def __init__(self, fields=None, chunk_size=EXPORT_CHUNK_SIZE):
+        # Pola po nazwie kolumny ("Original Number") lub w wersji snake_case ("original_number")
+        columns = {self.key(name): (name, getter) for name, getter in self.COLUMNS}
+        if fields:
+            unknown = [field for field in fields if self.key(field) not in columns]
+            if unknown:
+                raise ValueError(f"Unknown export fields: {', '.join(unknown)}")
+            self.columns = [columns[self.key(field)] for field in fields]
+        else:
+            self.columns = list(self.COLUMNS)
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def key(name):
+        return name.strip().lower().replace(" ", "_")
+
+    def chunks(self, records):
+        getters = [getter for _, getter in self.columns]
+        records = iter(records)
+        while True:
+            chunk = [[_export_value(getter(record)) for getter in getters]
+                     for record in itertools.islice(records, self.chunk_size)]
+            if not chunk:
+                return
+            yield chunk
+
+    def _open_text(self, output_file, compress):
+        if output_file in (None, "-"):
+            if compress:
+                return gzip.open(sys.stdout.buffer, "wt", encoding="utf-8", newline=""), False
+            return sys.stdout, False
+        if compress:
+            return gzip.open(output_file, "wt", encoding="utf-8", newline=""), True
+        return open(output_file, "w", encoding="utf-8", newline=""), True
+
+    def export(self, records, output_file, fmt="csv", compress=False):
+        if fmt not in self.FORMATS:
+            return {"error": f"Unsupported export format: {fmt}"}
+        if compress and output_file not in (None, "-") and fmt in ("csv", "jsonl") and not output_file.endswith(".gz"):
+            output_file += ".gz"
+        try:
+            if fmt in ("parquet", "arrow"):
+                rows = self._export_columnar(records, output_file, fmt, compress)
+            else:
+                rows = self._export_text(records, output_file, fmt, compress)
+        except ImportError:
+            export_log.error(f"Export to {fmt} failed: pyarrow is not installed")
+            return {"error": f"Export to {fmt} requires pyarrow (pip install pyarrow)"}
+        except Exception as e:
+            export_log.error(f"Export failed: {str(e)}")
+            return {"error": f"Export failed: {str(e)}"}
+        export_log.info(f"Registry exported to {output_file} ({fmt}, {rows} rows)")
+        return {"success": True, "message": f"Exported to {output_file}", "rows": rows}
+
+    def text_chunks(self, records, fmt="csv"):
+        # (tekst, liczba wierszy) paczka po paczce - wspólne dla eksportu do pliku i strumienia HTTP
+        names = [name for name, _ in self.columns]
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            writer.writerow(names)
+            for chunk in self.chunks(records):
+                writer.writerows(chunk)
+                yield buffer.getvalue(), len(chunk)
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue(), 0
+        else:
+            keys = [self.key(name) for name in names]
+            for chunk in self.chunks(records):
+                yield "".join(json.dumps(dict(zip(keys, row)), ensure_ascii=False) + "\n" for row in chunk), len(chunk)
+
+    def _export_text(self, records, output_file, fmt, compress):
+        stream, owned = self._open_text(output_file, compress)
+        rows = 0
+        try:
+            for text, count in self.text_chunks(records, fmt):
+                stream.write(text)
+                rows += count
+        finally:
+            if owned or compress:
+                stream.close()
+            else:
+                stream.flush()
+        return rows
+
+    def _export_columnar(self, records, output_file, fmt, compress):
+        import pyarrow as pa
+        if output_file in (None, "-"):
+            raise ValueError(f"{fmt} export needs an output file")
+        schema = pa.schema([(self.key(name), pa.string()) for name, _ in self.columns])
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(output_file, schema, compression="gzip" if compress else "snappy")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression="zstd" if compress else None)
+            writer = pa.ipc.new_file(output_file, schema, options=options)
+        rows = 0
+        try:
+            for chunk in self.chunks(records):
+                columns = [pa.array([str(row[i]) for row in chunk], type=pa.string()) for i in range(len(self.columns))]
+                writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+                rows += len(chunk)
+        finally:
+            writer.close()
+        return rows
+
+def normalize_number_key(value):
+    # "+48 500-12" / "4850012" -> "+4850012" (klucz indeksu E.164; bez walidacji - prefiks nie musi być numerem)
+    digits = re.sub(r"\D", "", str(value))
+    return "+" + digits if digits else ""
+
+def _prefix_end(prefix):
+    # Najmniejszy klucz większy od wszystkich ciągów zaczynających się od prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+
+def _number_bounds(prefix=None, start=None, end=None, after=None):
+    # Zawężenie do przedziału [low, high) kluczy E.164; None = brak wyniku (sprzeczne warunki)
+    low, high, high_inclusive = "", None, False
+    if prefix:
+        low, high = prefix, _prefix_end(prefix)
+    if start and start > low:
+        low = start
+    if end and (high is None or end < high):
+        high, high_inclusive = end, True
+    if after and after >= low:
+        low = after + "\0"
+    if high is not None and (low > high or (low == high and not high_inclusive)):
+        return None
+    return low, high, high_inclusive
+
+class RegistryIndex:
+    # Posortowane indeksy rejestru w pamięci: lista (E.164, hash) oraz osobna lista dla każdej wartości
+    # pól kategorycznych. Prefiks/zakres to bisect (O(log n)), filtry łączone iterują najkrótszą listę
+    # kandydatów. Utrzymywany przyrostowo przy zapisie i usuwaniu wpisów.
+    FIELDS = ("country_iso", "country", "carrier", "number_type", "geolocation")
+    # Paczki większe niż 1/BULK_RATIO indeksu przebudowują listy (sort scala posortowane serie) zamiast insort
+    BULK_RATIO = 16
+
+    def __init__(self):
+        self.numbers = []
+        self.values = {field: {} for field in self.FIELDS}
+
+    _value_keys = {}
+
+    @classmethod
+    def value_key(cls, value):
+        # Wartości kategoryczne są internowane i nieliczne - casefold liczony raz na wartość
+        key = cls._value_keys.get(value)
+        if key is None:
+            key = value.casefold() if isinstance(value, str) else str(value)
+            if len(cls._value_keys) < 100000:
+                cls._value_keys[value] = key
+        return key
+
+    def keys(self, hashed_number, record):
+        number = record.original_number
+        if not isinstance(number, str) or not number:
+            return None, ()
+        item = (number, hashed_number)
+        fields = []
+        overrides = record.overrides
+        for field in self.FIELDS:
+            value = overrides[field] if overrides and field in overrides else getattr(record, field)
+            if value is not _MISSING and value not in ("", None):
+                fields.append((field, self.value_key(value)))
+        return item, fields
+
+    def add(self, hashed_number, record):
+        item, fields = self.keys(hashed_number, record)
+        if item is None:
+            return
+        bisect.insort(self.numbers, item)
+        for field, value in fields:
+            bisect.insort(self.values[field].setdefault(value, []), item)
+
+    def remove(self, hashed_number, record):
+        item, fields = self.keys(hashed_number, record)
+        if item is None:
+            return
+        self._discard(self.numbers, item)
+        for field, value in fields:
+            items = self.values[field].get(value)
+            if items is not None:
+                self._discard(items, item)
+                if not items:
+                    del self.values[field][value]
+
+    @staticmethod
+    def _discard(items, item):
+        position = bisect.bisect_left(items, item)
+        if position < len(items) and items[position] == item:
+            del items[position]
+
+    def update_many(self, removed, added):
+        # removed/added: [(hash, RegistryRecord)] - stare wersje nadpisywanych wpisów i nowe wpisy
+        if len(removed) + len(added) <= max(64, len(self.numbers) // self.BULK_RATIO):
+            for hashed_number, record in removed:
+                self.remove(hashed_number, record)
+            for hashed_number, record in added:
+                self.add(hashed_number, record)
+            return
+        drop = {}
+        for hashed_number, record in removed:
+            item, fields = self.keys(hashed_number, record)
+            if item is not None:
+                drop.setdefault(None, set()).add(item)
+                for field, value in fields:
+                    drop.setdefault((field, value), set()).add(item)
+        extend = {}
+        for hashed_number, record in added:
+            item, fields = self.keys(hashed_number, record)
+            if item is not None:
+                extend.setdefault(None, []).append(item)
+                for field, value in fields:
+                    extend.setdefault((field, value), []).append(item)
+        for key in set(drop) | set(extend):
+            items = self.numbers if key is None else self.values[key[0]].get(key[1], [])
+            if key in drop:
+                items = [item for item in items if item not in drop[key]]
+            items.extend(extend.get(key, ()))
+            items.sort()
+            if key is None:
+                self.numbers = items
+            elif items:
+                self.values[key[0]][key[1]] = items
+            else:
+                self.values[key[0]].pop(key[1], None)
+
+    def build(self, records):
+        self.__init__()
+        self.update_many((), list(records))
+
+    @staticmethod
+    def _slice(items, bounds):
+        low, high, high_inclusive = bounds
+        first = bisect.bisect_left(items, (low,))
+        if high is None:
+            return first, len(items)
+        if high_inclusive:
+            return first, bisect.bisect_left(items, (high + "\0",))
+        return first, bisect.bisect_left(items, (high,))
+
+    def query(self, bounds, filters, records):
+        # Generator hashy w kolejności E.164; filters: {pole: wartość} (dopasowanie dokładne, bez wielkości liter)
+        candidates = [(self.numbers, None)]
+        for field, value in filters.items():
+            items = self.values[field].get(self.value_key(value))
+            if items is None:
+                return
+            candidates.append((items, field))
+        ranges = [(items, field, *self._slice(items, bounds)) for items, field in candidates]
+        items, driver, first, last = min(ranges, key=lambda item: item[3] - item[2])
+        checks = [(field, self.value_key(value)) for field, value in filters.items() if field != driver]
+        if not checks:
+            for position in range(first, last):
+                yield items[position][1]
+            return
+        for position in range(first, last):
+            hashed_number = items[position][1]
+            record = records.get(hashed_number)
+            if record is not None and all(self.value_key(record.scan_value(field, "")) == value
+                                          for field, value in checks):
+                yield hashed_number
+
+# Pola dostępne jako filtry w PhoneRegistry.query
+QUERY_FIELDS = ("country_code",) + RegistryIndex.FIELDS
+
+CHECK_BATCH_SIZE = 10000
+# Po przekroczeniu tej liczby zapamiętanych wejść słowniki deduplikacji są czyszczone (ograniczenie pamięci)
+CHECK_DEDUPE_LIMIT = 1000000
+
+def hash_number(number):
+    return hashlib.sha256(number.encode()).hexdigest()
+
+class RegistryBloomFilter:
+    # Filtr Blooma nad skrótami SHA-256 wpisów: pewna odpowiedź "nie ma w rejestrze" bez ładowania rejestru.
+    # Plik = nagłówek + tablica bitów, otwierany przez mmap - procesy sprawdzające współdzielą strony z page
+    # cache. Skrót jest już losowy, więc pozycje bitów to double hashing z dwóch jego 64-bitowych fragmentów
+    MAGIC = b"PNSBLOOM"
+    FORMAT = 1
+    # magic, format, liczba funkcji, liczba bitów, liczba wpisów, wersja rejestru, czas utworzenia
+    HEADER = struct.Struct("<8sIIQQQd")
+
+    def __init__(self, bits, hashes, count=0, version=0, created=None, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.count = count
+        self.version = version
+        self.created = time.time() if created is None else created
+        self.data = bytearray((bits + 7) // 8) if data is None else data
+        self.path = None
+        self._mmap = None
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.001, version=0):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        capacity = max(capacity, 1)
+        bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        return cls(bits, max(1, round(bits / capacity * math.log(2))), version=version)
+
+    def _positions(self, hashed_number):
+        first, step, bits = int(hashed_number[:16], 16), int(hashed_number[16:32], 16) | 1, self.bits
+        return [(first + i * step) % bits for i in range(self.hashes)]
+
+    def add(self, hashed_number):
+        data = self.data
+        for position in self._positions(hashed_number):
+            data[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, hashed_number):
+        first, step, bits, data = int(hashed_number[:16], 16), int(hashed_number[16:32], 16) | 1, self.bits, self.data
+        for i in range(self.hashes):
+            position = (first + i * step) % bits
+            if not data[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def error_rate(self):
+        # Oczekiwany odsetek fałszywych trafień przy obecnym zapełnieniu
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def info(self):
+        return {
+            "path": self.path,
+            "count": self.count,
+            "bits": self.bits,
+            "hashes": self.hashes,
+            "bytes": self.HEADER.size + len(self.data),
+            "version": self.version,
+            "created": datetime.fromtimestamp(self.created).isoformat(),
+            "error_rate": round(self.error_rate, 6)
+        }
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.FORMAT, self.hashes, self.bits, self.count, self.version,
+                                     self.created))
+            f.write(self.data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.path = path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(mapped) < cls.HEADER.size:
+                raise ValueError(f"{path} is not a registry Bloom filter")
+            magic, fmt, hashes, bits, count, version, created = cls.HEADER.unpack_from(mapped)
+            if magic != cls.MAGIC or fmt != cls.FORMAT:
+                raise ValueError(f"{path} is not a registry Bloom filter (format {fmt})")
+            if len(mapped) != cls.HEADER.size + (bits + 7) // 8:
+                raise ValueError(f"{path} is truncated")
+        except ValueError:
+            mapped.close()
+            raise
+        bloom = cls(bits, hashes, count, version, created, memoryview(mapped)[cls.HEADER.size:])
+        bloom.path, bloom._mmap = path, mapped
+        return bloom
+
+    def close(self):
+        if self._mmap is not None:
+            self.data.release()
+            self._mmap.close()
+            self._mmap = None
+
+def bulk_check(scanner, numbers, lookup=None, bloom=None, batch_size=CHECK_BATCH_SIZE):
+    # Masowe sprawdzanie przynależności do rejestru, wyniki w kolejności wejścia. Numery normalizowane
+    # minimalnym parsowaniem (PhoneScanner.normalize_e164), powtórzone wejścia i numery o tym samym E.164
+    # liczone raz; paczki skrótów najpierw przez filtr Blooma (pewne "nie ma"), reszta przez
+    # lookup(skróty) -> zbiór obecnych. lookup=None: sam filtr, trafienia z "confirmed": False
+    inputs, answers = {}, {}
+    totals = {"registered": 0, "absent": 0, "error": 0}
+    started, count = time.perf_counter(), 0
+    for batch in _chunked(numbers, batch_size):
+        keys, pending, duplicates = [], {}, 0
+        for number in batch:
+            key = inputs.get(number)
+            if key is None:
+                e164, error = scanner.normalize_e164(number)
+                if error is not None:
+                    key = {"error": error}
+                else:
+                    key = hash_number(e164)
+                    if key in answers or key in pending:
+                        duplicates += 1
+                    else:
+                        pending[key] = e164
+                inputs[number] = key
+            else:
+                duplicates += 1
+            keys.append(key)
+        candidates = list(pending)
+        if bloom is not None:
+            candidates = [hashed_number for hashed_number in candidates if hashed_number in bloom]
+            BULK_FILTERED.inc(len(pending) - len(candidates))
+        present = set(candidates) if lookup is None else lookup(candidates)
+        for hashed_number, e164 in pending.items():
+            registered = hashed_number in present
+            answers[hashed_number] = {"e164": e164, "registered": registered}
+            if registered and lookup is None:
+                answers[hashed_number]["confirmed"] = False
+        batch_totals = {"registered": 0, "absent": 0, "error": 0}
+        for key in keys:
+            result = key if isinstance(key, dict) else answers[key]
+            batch_totals["error" if "error" in result else "registered" if result["registered"] else "absent"] += 1
+            yield dict(result)
+        for result, value in batch_totals.items():
+            totals[result] += value
+            BULK_CHECKED[result].inc(value)
+        BULK_DEDUPLICATED.inc(duplicates)
+        count += len(batch)
+        if len(inputs) > CHECK_DEDUPE_LIMIT:
+            inputs.clear()
+            answers.clear()
+    elapsed = time.perf_counter() - started
+    registry_log.info(f"Bulk check of {count} numbers: {totals['registered']} registered, {totals['absent']} absent, "
+                      f"{totals['error']} invalid ({count / elapsed if elapsed else 0:.0f} numbers/s)",
+                      extra={"event": "bulk_check", "fields": {"count": count, **totals}})
+
+class PhoneRegistry:
+    # Wielu pisarzy w osobnych procesach: każdy zapis pod blokadą pliku <registry>.lock, najpierw wczytuje
+    # zmiany innych procesów (storage.sync), potem dopisuje swoje i podbija wersję. Odczyty przeładowują
+    # rejestr, gdy wersja w pliku blokady się zmieniła (auto_reload).
+    def __init__(self, registry_file="phone_registry.json", scanner=None, storage=None, lock_timeout=30.0,
+                 auto_reload=True):
+        self.registry_file = registry_file
+        self.scanner = scanner or PhoneScanner()
+        self.storage = storage or JsonFileStorage(registry_file)
+        self.lock = threading.RLock()
+        self.enrichment = None
+        self.auto_reload = auto_reload
+        self.file_lock = RegistryLock(f"{registry_file}.lock", lock_timeout)
+        # Wersja rejestru, do której jesteśmy zsynchronizowani, i wersje wpisów zmienionych od wczytania
+        self.key_versions = {}
+        self._index = None
+        # Pliki .lock i .changes powstają przy pierwszym zapisie - samo otwarcie (lookup, search, export)
+        # niczego nie tworzy
+        self.change_log = ChangeLog(f"{registry_file}.changes")
+        if self.file_lock.exists():
+            with self.file_lock:
+                self.version = self.loaded_version = self.file_lock.read_version()
+                self.registry = self.load_registry()
+        else:
+            # Nikt jeszcze nie pisał pod blokadą; urwanej linii dziennika nie przycinamy (może to być zapis w toku)
+            self.version = self.loaded_version = 0
+            self.registry = self.load_registry(truncate=False)
+
+    def load_registry(self, truncate=True):
+        # W pamięci trzymamy zwarte RegistryRecord zamiast zagnieżdżonych słowników
+        with storage_timer(self.storage_backend, "load"):
+            loaded = self.storage.load(truncate)
+        registry = {}
+        for hashed_number in list(loaded):
+            registry[hashed_number] = RegistryRecord.from_dict(loaded.pop(hashed_number))
+        return registry
+
+    @property
+    def storage_backend(self):
+        return getattr(self.storage, "BACKEND", type(self.storage).__name__)
+
+    def save_registry(self):
+        with self.lock, self.file_lock, storage_timer(self.storage_backend, "save"):
+            self.refresh()
+            self.storage.save(self.registry)
+
+    def close(self):
+        self.storage.close()
+        self.file_lock.close()
+
+    def refresh(self):
+        # Wczytanie zmian zapisanych przez inne procesy; zwraca liczbę zmienionych wpisów
+        with self.lock:
+            version = self.file_lock.read_version()
+            if version == self.version:
+                return 0
+            changed = self._apply_sync(self.storage.sync(), version)
+            self.version = version
+            return changed
+
+    def _maybe_refresh(self):
+        if self.auto_reload:
+            self.refresh()
+
+    def current_version(self):
+        self._maybe_refresh()
+        return self.version
+
+    def _apply_sync(self, changes, version):
+        if changes is None:
+            return 0
+        kind, data = changes
+        changed = []
+        if kind == "full":
+            # Pełne przeładowanie (JSON / po kompakcji dziennika): zmienione wpisy wyznaczamy porównaniem
+            registry = {}
+            for hashed_number in list(data):
+                entry = data.pop(hashed_number)
+                old = self.registry.get(hashed_number)
+                if old is not None and old.to_dict() == entry:
+                    registry[hashed_number] = old
+                else:
+                    registry[hashed_number] = RegistryRecord.from_dict(entry)
+                    changed.append(hashed_number)
+            changed += [hashed_number for hashed_number in self.registry if hashed_number not in registry]
+            self.registry = registry
+            self._index = None
+        else:
+            removed, added = [], []
+            def apply(record):
+                if record.get("op") == "batch":
+                    for item in record["records"]:
+                        apply(item)
+                    return
+                hashed_number = record["key"]
+                old = self.registry.pop(hashed_number, None)
+                if old is not None:
+                    removed.append((hashed_number, old))
+                if record.get("op") == "put":
+                    new = self.registry[hashed_number] = RegistryRecord.from_dict(record["entry"])
+                    added.append((hashed_number, new))
+                changed.append(hashed_number)
+            for record in data:
+                apply(record)
+            if self._index is not None:
+                self._index.update_many(removed, added)
+        for hashed_number in changed:
+            self.key_versions[hashed_number] = version
+        if changed:
+            REGISTRY_RELOADS.inc(len(changed))
+            registry_log.info(f"Reloaded {len(changed)} entries changed by other processes (version {version})")
+        return len(changed)
+
+    def _begin_write(self, keys, expected_version=None):
+        # Wywoływane pod self.lock i blokadą pliku: synchronizacja z dyskiem i kontrola konfliktów
+        base_version = self.version
+        self.refresh()
+        if not self.change_log.exists():
+            self._open_change_log()
+        # Wpisy niezmienione od wczytania mają co najwyżej wersję z chwili wczytania
+        conflicts = [key for key in keys if self.key_versions.get(key, self.loaded_version) > (
+            base_version if expected_version is None else expected_version)]
+        if conflicts and expected_version is not None:
+            raise RegistryConflictError(conflicts, expected_version, self.version)
+        if conflicts:
+            # Zapis bezwarunkowy (np. ponowna rejestracja): wygrywa ostatni, ale odnotowujemy konflikt
+            WRITE_CONFLICTS.inc(len(conflicts))
+            registry_log.warning(f"Overwriting {len(conflicts)} entries changed concurrently by another process",
+                                 extra={"event": "write_conflict", "fields": {"keys": conflicts[:10]}})
+
+    def _commit_write(self, keys):
+        self.version += 1
+        self.file_lock.write_version(self.version)
+        for key in keys:
+            self.key_versions[key] = self.version
+
+    def _open_change_log(self):
+        # Pod blokadą, przy pierwszym zapisie: dziennik zmian zaczyna się od bieżącej wersji
+        if self.registry and not self.version:
+            # Wpisy sprzed dziennika: sekwencja 0 ("nic nie zsynchronizowano") musi wymagać pełnego eksportu
+            self.version = 1
+            self.file_lock.write_version(self.version)
+        self.change_log.open(self.version)
+
+    # Operacje niskiego poziomu, nadpisywane przez inne backendy (np. SQLitePhoneRegistry)
+    def _get_entry(self, hashed_number):
+        self._maybe_refresh()
+        record = self.registry.get(hashed_number)
+        return record.to_dict() if record is not None else None
+
+    def _store_entry(self, hashed_number, entry, expected_version=None):
+        self._store_entries({hashed_number: entry}, expected_version)
+
+    def _store_entries(self, entries, expected_version=None):
+        with self.lock, self.file_lock:
+            self._begin_write(entries, expected_version)
+            removed, added, changes = [], [], []
+            for hashed_number, entry in entries.items():
+                old = self.registry.get(hashed_number)
+                if old is not None:
+                    removed.append((hashed_number, old))
+                record = self.registry[hashed_number] = RegistryRecord.from_dict(entry)
+                added.append((hashed_number, record))
+                changes.append(("register" if old is None else "update", hashed_number, entry["original_number"]))
+            if self._index is not None:
+                self._index.update_many(removed, added)
+            if len(entries) == 1:
+                with storage_timer(self.storage_backend, "put"):
+                    self.storage.put(hashed_number, entry, self.registry)
             else:
-                logging.error(f"IP check failed: {data.get('message', 'Unknown error')}")
-                return {"error": f"IP check failed: {data.get('message', 'Unknown error')}"}
-        except Exception as e:
-            logging.error(f"IP check error: {str(e)}")
-            return {"error": f"IP check error: {str(e)}"}
+                with storage_timer(self.storage_backend, "put_many"):
+                    self.storage.put_many(entries, self.registry)
+            self.change_log.append(self.version + 1, changes)
+            self._commit_write(entries)
 
-    def batch_scan(self, numbers_list):
-        results = []
-        for num in numbers_list:
-            result = self.validate_number(num)
-            if "error" not in result:
-                result.update(self.check_for_scams(num))
-            results.append(result)
-        logging.info(f"Batch scan completed for {len(numbers_list)} numbers")
-        return results
+    def _remove_entry(self, hashed_number, expected_version=None):
+        with self.lock, self.file_lock:
+            self._begin_write((hashed_number,), expected_version)
+            record = self.registry.pop(hashed_number, None)
+            if record is None:
+                return False
+            if self._index is not None:
+                self._index.remove(hashed_number, record)
+            with storage_timer(self.storage_backend, "delete"):
+                self.storage.delete(hashed_number, self.registry)
+            self.change_log.append(self.version + 1, [("delete", hashed_number, record.original_number)])
+            self._commit_write((hashed_number,))
+            return True
 
-class PhoneRegistry:
-    def __init__(self, registry_file="phone_registry.json"):
-        self.registry_file = registry_file
-        self.registry = self.load_registry()
+    @property
+    def index(self):
+        # Indeks budowany przy pierwszym zapytaniu (komendy bez query nie płacą za niego przy starcie),
+        # potem utrzymywany przyrostowo
+        with self.lock:
+            if self._index is None:
+                self._index = RegistryIndex()
+                self._index.build(self.registry.items())
+            return self._index
 
-    def load_registry(self):
-        if os.path.exists(self.registry_file):
-            try:
-                with open(self.registry_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Failed to load registry: {str(e)}")
-                return {}
-        return {}
+    def _query_entries(self, bounds, filters, limit):
+        with self.lock:
+            self._maybe_refresh()
+            hashes = list(itertools.islice(self.index.query(bounds, filters, self.registry), limit))
+            return [self.registry[hashed_number].to_dict() for hashed_number in hashes]
 
-    def save_registry(self):
-        try:
-            with open(self.registry_file, 'w') as f:
-                json.dump(self.registry, f, indent=2)
-            logging.info("Registry saved successfully")
-        except Exception as e:
-            logging.error(f"Failed to save registry: {str(e)}")
+    def iter_records(self):
+        with self.lock:
+            self._maybe_refresh()
+            return iter(list(self.registry.values()))
+
+    def iter_entries(self):
+        return (record.to_dict() for record in self.iter_records())
+
+    def update_ip_infos(self, ip_infos):
+        # Jeden zapis dla całej paczki wyników wzbogacania; odczyt-modyfikacja-zapis pod blokadą pliku.
+        # ip_infos: {hashed_number: (ip_address, ip_info)} - wpis ponownie zarejestrowany z innym IP pomijamy
+        with self.lock, self.file_lock:
+            entries = {}
+            for hashed_number, (ip_address, ip_info) in ip_infos.items():
+                entry = self._get_entry(hashed_number)
+                if entry is not None and entry["scan_data"].get("ip_address") == ip_address:
+                    entry["ip_info"] = ip_info
+                    entries[hashed_number] = entry
+            if entries:
+                self._store_entries(entries)
+            return len(entries)
+
+    def __len__(self):
+        self._maybe_refresh()
+        return len(self.registry)
 
     def hash_number(self, number):
-        return hashlib.sha256(number.encode()).hexdigest()
+        return hash_number(number)
 
-    def register_number(self, number_str, notes="", user_provided_name="", user_reported_signal="", ip_address=""):
-        scan_result = PhoneScanner().validate_number(number_str)
-        if "error" in scan_result:
-            logging.error(f"Registration failed: {scan_result['error']}")
-            return scan_result
-        
-        user_provided_name = user_provided_name.strip()[:50] or ""
-        user_reported_signal = user_reported_signal.strip()[:20] or ""
-        notes = notes.strip()[:200] or ""
-        ip_address = ip_address.strip()[:45] or ""  # Max 45 dla IPv6
-        
+    def _build_entry(self, scan_result, notes, user_provided_name, user_reported_signal, ip_address, ip_info):
         hashed_number = self.hash_number(scan_result["full_e164"])
         scan_result["user_provided_name"] = user_provided_name
         scan_result["user_reported_signal"] = user_reported_signal
         scan_result["ip_address"] = ip_address
         scan_result["last_scanned"] = datetime.now().isoformat()
-        
-        ip_info = {}
-        if ip_address:
-            ip_info = PhoneScanner().check_ip_address(ip_address)
-        
-        entry = {
+        return {
             "hashed_number": hashed_number,
             "original_number": scan_result["full_e164"],
             "scan_data": scan_result,
@@ -248,91 +2707,1292 @@ class PhoneRegistry:
             "notes": notes,
             "registered_at": datetime.now().isoformat()
         }
-        self.registry[hashed_number] = entry
-        self.save_registry()
-        logging.info(
-            f"Number {scan_result['full_e164']} registered with hash {hashed_number}, "
-            f"Name={user_provided_name}, Signal={user_reported_signal}, IP={ip_address}, Notes={notes}"
+
+    def register_number(self, number_str, notes="", user_provided_name="", user_reported_signal="", ip_address="",
+                        expected_version=None):
+        # expected_version: zapis tylko, jeśli wpis nie zmienił się od tej wersji rejestru (z check_if_registered)
+        clock = time.perf_counter
+        started = clock()
+        scan_result = self.scanner.validate_number(number_str)
+        scanned_at = clock()
+        REGISTER_STAGE_SECONDS["scan"].observe(scanned_at - started)
+        if "error" in scan_result:
+            REGISTRATIONS["error"].inc()
+            registry_log.error("Registration failed: %s", scan_result['error'],
+                               extra={"event": "register_failed", "fields": {"error": scan_result['error']},
+                                      "sampled": True})
+            return scan_result
+        
+        user_provided_name = user_provided_name.strip()[:50] or ""
+        user_reported_signal = user_reported_signal.strip()[:20] or ""
+        notes = notes.strip()[:200] or ""
+        ip_address = ip_address.strip()[:45] or ""  # Max 45 dla IPv6
+        
+        ip_info = {}
+        if ip_address and self.enrichment is not None:
+            # Wzbogacanie IP odroczone do kolejki - zapis nie czeka na ip-api
+            ip_info = dict(PENDING_IP_INFO)
+        elif ip_address:
+            ip_info = self.scanner.check_ip_address(ip_address)
+        enriched_at = clock()
+        
+        entry = self._build_entry(scan_result, notes, user_provided_name, user_reported_signal, ip_address, ip_info)
+        hashed_number = entry["hashed_number"]
+        try:
+            self._store_entry(hashed_number, entry, expected_version)
+        except RegistryConflictError as e:
+            return self._conflict_result(e)
+        stored_at = clock()
+        REGISTER_STAGE_SECONDS["ip_enrichment"].observe(enriched_at - scanned_at)
+        REGISTER_STAGE_SECONDS["store"].observe(stored_at - enriched_at)
+        REGISTER_STAGE_SECONDS["total"].observe(stored_at - started)
+        REGISTRATIONS["success"].inc()
+        if ip_address and self.enrichment is not None:
+            self.enrichment.submit(hashed_number, ip_address)
+        registry_log.info(
+            "Number %s registered with hash %s, Name=%s, Signal=%s, IP=%s, Notes=%s",
+            scan_result['full_e164'], hashed_number, user_provided_name, user_reported_signal, ip_address, notes,
+            extra={"event": "number_registered", "sampled": True,
+                   "fields": {"number": scan_result['full_e164'], "hash": hashed_number}}
         )
         return {"success": True, "message": f"Number registered successfully.", "entry": entry}
 
+    def register_many(self, records, workers=1):
+        # records: (number, notes, name, signal, ip) - krotki mogą być krótsze, brakujące pola są puste
+        records = [tuple(record) if isinstance(record, (tuple, list)) else (record,) for record in records]
+        numbers = (record[0] for record in records)
+        results = []
+        entries = {}
+        positions = {}
+        # Najpierw skan, potem wzbogacanie IP tylko dla rekordów, które przeszły walidację
+        scan_results = list(self.scanner.stream_scan(numbers, workers=workers))
+        ip_addresses = (str(record[4]).strip()[:45] for record, scan_result in zip(records, scan_results)
+                        if len(record) > 4 and record[4] and "error" not in scan_result)
+        if self.enrichment is not None:
+            ip_infos = {}
+        else:
+            ip_infos = self.scanner.enricher.lookup_many(ip_addresses)
+        for index, (record, scan_result) in enumerate(zip(records, scan_results)):
+            number_str = str(record[0]).strip()
+            if "error" in scan_result:
+                results.append({"index": index, "input": number_str, "error": scan_result["error"]})
+                continue
+            notes, user_provided_name, user_reported_signal, ip_address = (
+                (tuple(str(field or "") for field in record[1:5]) + ("", "", "", ""))[:4]
+            )
+            ip_address = ip_address.strip()[:45]
+            entry = self._build_entry(scan_result, notes.strip()[:200], user_provided_name.strip()[:50],
+                                      user_reported_signal.strip()[:20], ip_address,
+                                      ip_infos.get(ip_address, dict(PENDING_IP_INFO) if ip_address and self.enrichment else {}))
+            hashed_number = entry["hashed_number"]
+            # Duplikat w paczce: wygrywa ostatni rekord (jak przy kolejnych register_number)
+            if hashed_number in positions:
+                previous = results[positions[hashed_number]]
+                previous.update({"duplicate": True, "message": f"Superseded by record {index} in this batch."})
+            entries[hashed_number] = entry
+            positions[hashed_number] = index
+            results.append({"index": index, "input": number_str, "success": True,
+                            "hashed_number": hashed_number, "message": "Number registered successfully."})
+        if entries:
+            self._store_entries(entries)
+            if self.enrichment is not None:
+                self.enrichment.submit_many((hashed_number, entry["scan_data"]["ip_address"])
+                                            for hashed_number, entry in entries.items()
+                                            if entry["scan_data"]["ip_address"])
+        errors = sum(1 for result in results if "error" in result)
+        duplicates = sum(1 for result in results if result.get("duplicate"))
+        REGISTRATIONS["bulk"].inc(len(entries))
+        REGISTRATIONS["error"].inc(errors)
+        registry_log.info(
+            "Bulk registration: %d numbers registered from %d records "
+            "(%d duplicates, %d errors, %d IP addresses enriched)",
+            len(entries), len(results), duplicates, errors, len(ip_infos),
+            extra={"event": "register_many_summary",
+                   "fields": {"registered": len(entries), "records": len(results), "duplicates": duplicates,
+                              "errors": errors, "ip_enriched": len(ip_infos)}}
+        )
+        return {"success": True, "registered": len(entries), "duplicates": duplicates, "errors": errors,
+                "results": results}
+
+    def _conflict_result(self, error):
+        WRITE_CONFLICTS.inc(len(error.keys))
+        registry_log.warning(str(error), extra={"event": "write_conflict",
+                                                "fields": {"expected_version": error.expected_version,
+                                                           "version": error.current_version}})
+        return {"error": "Entry was modified by another writer; re-read it and retry.", "conflict": True,
+                "version": error.current_version}
+
     def get_registered_numbers(self):
-        return list(self.registry.values())
+        return list(self.iter_entries())
 
     def check_if_registered(self, number_str):
-        scan_result = PhoneScanner().validate_number(number_str)
+        scan_result = self.scanner.validate_number(number_str)
         if "error" in scan_result:
             return scan_result
         hashed_number = self.hash_number(scan_result["full_e164"])
-        if hashed_number in self.registry:
-            logging.info(f"Number {scan_result['full_e164']} found in registry")
-            return {"registered": True, "entry": self.registry[hashed_number]}
-        logging.info(f"Number {scan_result['full_e164']} not found in registry")
-        return {"registered": False}
+        # Wersja odczytana przed wpisem - przekazana jako expected_version wykryje późniejsze zmiany
+        with self.lock:
+            version = self.current_version()
+            entry = self._get_entry(hashed_number)
+        if entry is not None:
+            registry_log.info("Number %s found in registry", scan_result['full_e164'],
+                              extra={"event": "number_lookup", "fields": {"found": True}, "sampled": True})
+            return {"registered": True, "entry": entry, "version": version}
+        registry_log.info("Number %s not found in registry", scan_result['full_e164'],
+                          extra={"event": "number_lookup", "fields": {"found": False}, "sampled": True})
+        return {"registered": False, "version": version}
+
+    def contains_hashes(self, hashes):
+        # Które z podanych skrótów są w rejestrze (indeks haszowy = klucze słownika rejestru)
+        with self.lock:
+            self._maybe_refresh()
+            registry = self.registry
+            return {hashed_number for hashed_number in hashes if hashed_number in registry}
+
+    def registered_hashes(self):
+        with self.lock:
+            self._maybe_refresh()
+            return list(self.registry)
+
+    def change_log_start(self):
+        if not self.change_log.exists():
+            # Dziennik jeszcze nie założony - zacznie się od bieżącej wersji (jak w _open_change_log)
+            version = self.current_version()
+            return version or (1 if len(self) else 0)
+        return self.change_log.start
+
+    def changes(self, since=0, until=None):
+        # Zdarzenia register/update/delete o seq > since (i <= until) w kolejności zapisu
+        return self.change_log.read(since, until)
+
+    def truncate_changes(self, keep):
+        # Retencja dziennika zmian: zostają zdarzenia z ostatnich keep wersji rejestru, starsze delta()
+        # zastępuje pełnym snapshotem; zwraca {"start", "removed"}
+        with self.lock, self.file_lock:
+            self.refresh()
+            if not self.change_log.exists():
+                return {"start": self.change_log_start(), "removed": 0}
+            start = max(self.version - keep, self.change_log.start)
+            removed = self.change_log.truncate(start) if start > self.change_log.start else 0
+        registry_log.info(f"Change log truncated to sequence {start} ({removed} events removed)")
+        return {"start": start, "removed": removed}
+
+    def _entries_for(self, hashes):
+        with self.lock:
+            self._maybe_refresh()
+            return {hashed_number: self.registry[hashed_number].to_dict()
+                    for hashed_number in hashes if hashed_number in self.registry}
+
+    def delta(self, since=0, events=False):
+        # Synchronizacja przyrostowa: wpisy zmienione po sekwencji since (koszt ~ liczba zmian, nie rozmiar
+        # rejestru) -> {"since", "until", "records"}; until = sekwencja do zapamiętania jako następne since.
+        # Rekord = bieżący stan wpisu (op register/update, do wstawienia lub nadpisania) albo tombstone
+        # (op delete, "deleted": True); events=True - każde zdarzenie osobno, bez danych wpisu
+        until, start = self.current_version(), self.change_log_start()
+        if since > until:
+            return {"error": f"Sequence {since} is ahead of the registry (at {until})"}
+        if since < start:
+            return self._full_delta(since, until, start)
+        if events:
+            records = [{**change, "deleted": change["op"] == "delete"} for change in self.changes(since, until)]
+        else:
+            # Ostatnie zdarzenie na wpis, w kolejności ostatniej zmiany
+            latest = {}
+            for change in self.changes(since, until):
+                latest.pop(change["hashed_number"], None)
+                latest[change["hashed_number"]] = change
+            entries = self._entries_for([key for key, change in latest.items() if change["op"] != "delete"])
+            records = []
+            for hashed_number, change in latest.items():
+                entry = entries.get(hashed_number)
+                record = {"seq": change["seq"], "op": change["op"] if entry is not None else "delete",
+                          "changed_at": change["changed_at"], "deleted": entry is None}
+                record.update(entry or {"hashed_number": hashed_number, "original_number": change["original_number"]})
+                records.append(record)
+        if self.change_log_start() > since:
+            # Dziennik przycięty w trakcie odczytu - część zdarzeń mogła zniknąć
+            return self._full_delta(since, until, self.change_log_start())
+        registry_log.info(f"Delta since sequence {since}: {len(records)} {'events' if events else 'changed entries'} "
+                          f"(through {until})")
+        return {"since": since, "until": until, "records": records}
+
+    def _full_delta(self, since, until, start):
+        # Zdarzeń sprzed początku dziennika już nie ma: pełny snapshot ("full": True) - odbiorca zastępuje
+        # całą kopię (wpisy spoza snapshotu zostały usunięte); until odczytane przed wpisami, więc późniejsze
+        # zmiany przyjdą w kolejnej delcie najwyżej drugi raz
+        records = [{"seq": until, "op": "register", "changed_at": entry.get("registered_at", ""), "deleted": False,
+                    **entry} for entry in self.iter_entries()]
+        registry_log.warning(f"Change log starts at sequence {start}, after {since}: "
+                             f"sending a full snapshot of {len(records)} entries (through {until})")
+        return {"since": since, "until": until, "records": records, "full": True, "start": start}
+
+    def check_many(self, numbers, bloom=None, batch_size=CHECK_BATCH_SIZE):
+        # Odpowiednik check_if_registered dla milionów numerów: bez pełnego skanu i metadanych, wynik
+        # {"e164", "registered"} albo {"error"} dla każdego wejścia. Filtr Blooma z innej wersji rejestru
+        # mógłby zgubić nowe wpisy - wtedy jest pomijany
+        if bloom is not None and bloom.version != self.current_version():
+            registry_log.warning(f"Bloom filter {bloom.path or ''} is stale (registry version {self.version}, "
+                                 f"snapshot {bloom.version}); checking the registry directly")
+            bloom = None
+        return bulk_check(self.scanner, numbers, self.contains_hashes, bloom, batch_size)
+
+    def build_bloom_filter(self, path, error_rate=0.001):
+        # Snapshot skrótów do pliku ładowanego przez mmap w innych procesach; wersja odczytana przed skrótami,
+        # więc równoległy zapis daje co najwyżej snapshot oznaczony jako nieaktualny, nigdy niepełny
+        with self.lock:
+            version = self.current_version()
+            hashes = self.registered_hashes()
+        bloom = RegistryBloomFilter.for_capacity(len(hashes), error_rate, version)
+        for hashed_number in hashes:
+            bloom.add(hashed_number)
+        bloom.save(path)
+        info = bloom.info()
+        registry_log.info(f"Bloom filter snapshot of {info['count']} entries written to {path} "
+                          f"({info['bytes']} bytes, version {version})")
+        return info
 
     def search_by_notes(self, keyword):
-        results = [entry for entry in self.registry.values() if keyword.lower() in entry["notes"].lower()]
-        logging.info(f"Search by notes with keyword '{keyword}' returned {len(results)} results")
+        needle = keyword.lower()
+        results = [record.to_dict() for record in self.iter_records() if needle in record.notes.lower()]
+        registry_log.info(f"Search by notes with keyword '{keyword}' returned {len(results)} results")
         return results
 
     def search_by_field(self, field, keyword):
+        needle = keyword.lower()
         results = []
-        for entry in self.registry.values():
-            value = entry["scan_data"].get(field, "")
-            if isinstance(value, str) and keyword.lower() in value.lower():
-                results.append(entry)
-        logging.info(f"Search by {field} with keyword '{keyword}' returned {len(results)} results")
+        for record in self.iter_records():
+            value = record.scan_value(field, "")
+            if isinstance(value, str) and needle in value.lower():
+                results.append(record.to_dict())
+        registry_log.info(f"Search by {field} with keyword '{keyword}' returned {len(results)} results")
         return results
 
-    def delete_entry(self, number_str):
-        scan_result = PhoneScanner().validate_number(number_str)
+    def query(self, prefix=None, start=None, end=None, limit=100, after=None, **filters):
+        # Zapytania indeksowane: prefiks E.164, zakres [start, end] (porównanie kluczy E.164), filtry dokładne
+        # po polach kategorycznych (country_code, country_iso, country, carrier, number_type, geolocation)
+        # i paginacja kursorem: after = "next" z poprzedniej strony
+        unknown = [field for field in filters if field not in QUERY_FIELDS]
+        if unknown:
+            return {"error": f"Unknown query fields: {', '.join(unknown)}"}
+        filters = {field: value for field, value in filters.items() if value not in (None, "")}
+        prefix = normalize_number_key(prefix) if prefix else None
+        # Kody krajów E.164 są bezprefiksowe, więc country_code to po prostu prefiks "+<kod>"
+        country_code = filters.pop("country_code", None)
+        code_prefix = normalize_number_key(country_code) if country_code is not None else None
+        bounds = None
+        if not (prefix and code_prefix and not prefix.startswith(code_prefix) and not code_prefix.startswith(prefix)):
+            prefix = max(prefix or "", code_prefix or "", key=len) or None
+            bounds = _number_bounds(prefix, normalize_number_key(start) if start else None,
+                                    normalize_number_key(end) if end else None,
+                                    normalize_number_key(after) if after else None)
+        results = [] if bounds is None else self._query_entries(bounds, filters, limit + 1 if limit else None)
+        next_cursor = None
+        if limit and len(results) > limit:
+            results = results[:limit]
+            next_cursor = results[-1]["original_number"]
+        registry_log.info(f"Query prefix={prefix or ''} range={start or ''}..{end or ''} filters={filters} "
+                          f"returned {len(results)} results")
+        return {"results": results, "count": len(results), "next": next_cursor}
+
+    def delete_entry(self, number_str, expected_version=None):
+        scan_result = self.scanner.validate_number(number_str)
         if "error" in scan_result:
-            logging.error(f"Deletion failed: {scan_result['error']}")
+            registry_log.error(f"Deletion failed: {scan_result['error']}")
             return scan_result
         hashed_number = self.hash_number(scan_result["full_e164"])
-        if hashed_number in self.registry:
-            del self.registry[hashed_number]
-            self.save_registry()
-            logging.info(f"Number {scan_result['full_e164']} deleted from registry")
+        try:
+            removed = self._remove_entry(hashed_number, expected_version)
+        except RegistryConflictError as e:
+            return self._conflict_result(e)
+        if removed:
+            registry_log.info(f"Number {scan_result['full_e164']} deleted from registry")
             return {"success": True, "message": f"Number {number_str} deleted successfully."}
-        logging.info(f"Number {scan_result['full_e164']} not found for deletion")
+        registry_log.info(f"Number {scan_result['full_e164']} not found for deletion")
         return {"error": "Number not found in registry."}
 
-    def export_to_csv(self, output_file="phone_registry_export.csv"):
-        if not self.registry:
-            logging.warning("Export failed: Registry is empty")
+    def export(self, output_file="phone_registry_export.csv", fmt="csv", fields=None, compress=False,
+               chunk_size=None):
+        if not len(self):
+            registry_log.warning("Export failed: Registry is empty")
             return {"error": "Registry is empty"}
-        data = [{
-            "Hashed Number": entry["hashed_number"],
-            "Original Number": entry["original_number"],
-            "Country": entry["scan_data"]["country"],
-            "Country ISO": entry["scan_data"]["country_iso"],
-            "Carrier": entry["scan_data"]["carrier"],
-            "Geolocation": entry["scan_data"]["geolocation"],
-            "Number Type": entry["scan_data"]["number_type"],
-            "User Provided Name": entry["scan_data"]["user_provided_name"],
-            "User Reported Signal": entry["scan_data"]["user_reported_signal"],
-            "IP Address": entry["scan_data"]["ip_address"],
-            "IP Country": entry["ip_info"].get("country", ""),
-            "IP ISP": entry["ip_info"].get("isp", ""),
-            "Notes": entry["notes"],
-            "Registered At": entry["registered_at"],
-            "Last Scanned": entry["scan_data"]["last_scanned"]
-        } for entry in self.registry.values()]
-        df = pd.DataFrame(data)
-        df.to_csv(output_file, index=False)
-        logging.info(f"Registry exported to {output_file}")
-        return {"success": True, "message": f"Exported to {output_file}"}
+        exporter = RegistryExporter(fields, chunk_size or EXPORT_CHUNK_SIZE)
+        return exporter.export(self.iter_records(), output_file, fmt, compress)
+
+    def export_to_csv(self, output_file="phone_registry_export.csv"):
+        return self.export(output_file, "csv")
+
+# Limit parametrów zapytania w starszych wersjach SQLite
+SQLITE_MAX_PARAMS = 999
+# Wiersze na stronę przy iteracji po całej tabeli entries
+SQLITE_PAGE_ROWS = 1000
+
+class SQLitePhoneRegistry(PhoneRegistry):
+    # Rejestr w SQLite: indeksy na polach scan_data, FTS (trigram) na notatkach, wpisy nie są trzymane w RAM
+    INDEXED_FIELDS = ("country", "country_iso", "carrier", "number_type", "geolocation")
+    # PRAGMA user_version: 1 = indeksy (pole, numer) zamiast indeksów jednokolumnowych
+    SCHEMA_VERSION = 1
+    storage_backend = "sqlite"
+
+    # Wielu pisarzy: transakcje BEGIN IMMEDIATE (blokada zapisu SQLite) i busy_timeout zamiast pliku .lock;
+    # wersja rejestru w tabeli meta, wersja każdego wpisu w kolumnie entries.version
+    def __init__(self, registry_file="phone_registry.db", scanner=None, lock_timeout=30.0):
+        self.registry_file = registry_file
+        self.scanner = scanner or PhoneScanner()
+        self.storage = None
+        self.lock = threading.RLock()
+        self.enrichment = None
+        # Atrybuty wspólne z PhoneRegistry (metody dziedziczone): każde zapytanie widzi bieżący stan bazy,
+        # więc bez przeładowań, indeksu w pamięci i wersji wpisów; dziennik zmian w tabeli changes.
+        # Plik blokady tylko dla plików pomocniczych (kolejka wzbogacania)
+        self.auto_reload = False
+        self.file_lock = RegistryLock(f"{registry_file}.lock", lock_timeout)
+        self.key_versions = {}
+        self._index = None
+        self.change_log = None
+        self.conn = sqlite3.connect(registry_file, check_same_thread=False, timeout=lock_timeout)
+        self.conn.execute(f"PRAGMA busy_timeout={int(lock_timeout * 1000)}")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.fts = self._create_schema()
+        self.version = self.loaded_version = self.current_version()
+
+    def _create_schema(self):
+        columns = ", ".join(f"{field} TEXT" for field in self.INDEXED_FIELDS)
+        with self.conn:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, hashed_number TEXT NOT NULL UNIQUE, "
+                f"original_number TEXT, {columns}, notes TEXT, registered_at TEXT, data TEXT NOT NULL, "
+                f"version INTEGER NOT NULL DEFAULT 0)"
+            )
+            if "version" not in {row[1] for row in self.conn.execute("PRAGMA table_info(entries)")}:
+                self.conn.execute("ALTER TABLE entries ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+            # Dziennik zmian dla delta(); changes_start = wersja, od której jest prowadzony
+            self.conn.execute("CREATE TABLE IF NOT EXISTS changes (seq INTEGER NOT NULL, changed_at TEXT NOT NULL, "
+                              "op TEXT NOT NULL, hashed_number TEXT NOT NULL, original_number TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_changes_seq ON changes(seq)")
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = 'changes_start'").fetchone() is None:
+                # Wpisy sprzed dziennika: sekwencja 0 musi wymagać pełnego eksportu
+                self.conn.execute("UPDATE meta SET value = 1 WHERE key = 'version' AND value = 0 "
+                                  "AND EXISTS (SELECT 1 FROM entries)")
+                self.conn.execute("INSERT INTO meta (key, value) SELECT 'changes_start', value FROM meta "
+                                  "WHERE key = 'version'")
+            # Indeksy (pole, numer): filtr po wartości + prefiks/zakres numeru bez skanowania tabeli
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_original_number ON entries(original_number)")
+            schema_version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            for field in self.INDEXED_FIELDS:
+                if schema_version < 1:
+                    # Migracja jednorazowa: stare indeksy jednokolumnowe zastąpione indeksami (pole, numer)
+                    self.conn.execute(f"DROP INDEX IF EXISTS idx_entries_{field}")
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_entries_{field}_number "
+                                  f"ON entries({field}, original_number)")
+            if schema_version < self.SCHEMA_VERSION:
+                self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            # Słownik wartości pól kategorycznych (z licznikami) - wyszukiwanie podciągu odbywa się
+            # na kilku tysiącach wartości, a potem trafia w indeks zamiast skanować cały rejestr
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS field_values (field TEXT NOT NULL, value TEXT NOT NULL, "
+                "count INTEGER NOT NULL, PRIMARY KEY (field, value)) WITHOUT ROWID"
+            )
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5("
+                    "notes, content='entries', content_rowid='id', tokenize='trigram')"
+                )
+                self.conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN "
+                    "INSERT INTO entries_fts(rowid, notes) VALUES (new.id, new.notes); END"
+                )
+                self.conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN "
+                    "INSERT INTO entries_fts(entries_fts, rowid, notes) VALUES ('delete', old.id, old.notes); END"
+                )
+                self.conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE OF notes ON entries BEGIN "
+                    "INSERT INTO entries_fts(entries_fts, rowid, notes) VALUES ('delete', old.id, old.notes); "
+                    "INSERT INTO entries_fts(rowid, notes) VALUES (new.id, new.notes); END"
+                )
+            return True
+        except sqlite3.OperationalError as e:
+            registry_log.warning(f"SQLite FTS5 trigram index unavailable, notes search will scan: {str(e)}")
+            return False
+
+    def load_registry(self):
+        return {entry["hashed_number"]: entry for entry in self.iter_entries()}
+
+    def save_registry(self):
+        with self.lock, storage_timer("sqlite", "save"):
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+        self.file_lock.close()
+
+    def refresh(self):
+        # Każde zapytanie widzi bieżący stan bazy - nie ma czego przeładowywać
+        return 0
+
+    def current_version(self):
+        self.version = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        return self.version
+
+    def _begin_write(self, keys, expected_version=None):
+        # Wywoływane w transakcji: BEGIN IMMEDIATE od razu bierze blokadę zapisu, więc odczyt wersji
+        # i zapis są atomowe względem innych procesów; zwraca wersję nadawaną zapisywanym wpisom
+        if not self.conn.in_transaction:
+            started = time.perf_counter()
+            self.conn.execute("BEGIN IMMEDIATE")
+            LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+        version = self.current_version()
+        if expected_version is not None:
+            keys = list(keys)
+            conflicts = []
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                conflicts += [key for (key,) in self.conn.execute(
+                    f"SELECT hashed_number FROM entries WHERE version > ? "
+                    f"AND hashed_number IN ({', '.join('?' * len(chunk))})", (expected_version, *chunk)
+                )]
+            if conflicts:
+                raise RegistryConflictError(conflicts, expected_version, version)
+        return version + 1
+
+    def _commit_write(self, version):
+        self.conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+        self.version = version
+
+    def _adjust_field_values(self, values, delta):
+        for field, value in zip(self.INDEXED_FIELDS, values):
+            self.conn.execute(
+                "INSERT INTO field_values (field, value, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(field, value) DO UPDATE SET count = count + excluded.count",
+                (field, value, delta)
+            )
+            if delta < 0:
+                self.conn.execute("DELETE FROM field_values WHERE field = ? AND value = ? AND count <= 0",
+                                  (field, value))
+
+    def _write_entry(self, hashed_number, entry, version=0):
+        scan_data = entry["scan_data"]
+        values = tuple(str(scan_data.get(field, "")) for field in self.INDEXED_FIELDS)
+        old = self.conn.execute(
+            f"SELECT {', '.join(self.INDEXED_FIELDS)} FROM entries WHERE hashed_number = ?", (hashed_number,)
+        ).fetchone()
+        if old:
+            self._adjust_field_values(old, -1)
+        assignments = ", ".join(f"{field} = excluded.{field}" for field in self.INDEXED_FIELDS)
+        self.conn.execute(
+            f"INSERT INTO entries (hashed_number, original_number, {', '.join(self.INDEXED_FIELDS)}, notes, "
+            f"registered_at, data, version) VALUES (?, ?, {', '.join('?' * len(self.INDEXED_FIELDS))}, ?, ?, ?, ?) "
+            f"ON CONFLICT(hashed_number) DO UPDATE SET original_number = excluded.original_number, "
+            f"{assignments}, notes = excluded.notes, registered_at = excluded.registered_at, data = excluded.data, "
+            f"version = excluded.version",
+            (hashed_number, entry["original_number"], *values, entry["notes"], entry["registered_at"],
+             json.dumps(entry, separators=(",", ":")), version)
+        )
+        self._adjust_field_values(values, 1)
+        self._log_change(version, "update" if old else "register", hashed_number, entry["original_number"])
+
+    def _log_change(self, version, op, hashed_number, original_number):
+        self.conn.execute("INSERT INTO changes (seq, changed_at, op, hashed_number, original_number) "
+                          "VALUES (?, ?, ?, ?, ?)", (version, datetime.now().isoformat(), op, hashed_number,
+                                                     original_number))
+
+    def _get_entry(self, hashed_number):
+        row = self.conn.execute("SELECT data FROM entries WHERE hashed_number = ?", (hashed_number,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store_entry(self, hashed_number, entry, expected_version=None):
+        with self.lock, storage_timer("sqlite", "put"), self.conn:
+            version = self._begin_write((hashed_number,), expected_version)
+            self._write_entry(hashed_number, entry, version)
+            self._commit_write(version)
+
+    def _store_entries(self, entries, expected_version=None):
+        with self.lock, storage_timer("sqlite", "put_many"), self.conn:
+            version = self._begin_write(entries, expected_version)
+            for hashed_number, entry in entries.items():
+                self._write_entry(hashed_number, entry, version)
+            self._commit_write(version)
+
+    def update_ip_infos(self, ip_infos):
+        # Odczyt i zapis w jednej transakcji IMMEDIATE - inny proces nie nadpisze wpisu pomiędzy
+        with self.lock, storage_timer("sqlite", "put_many"), self.conn:
+            version = self._begin_write(())
+            count = 0
+            for hashed_number, (ip_address, ip_info) in ip_infos.items():
+                entry = self._get_entry(hashed_number)
+                if entry is not None and entry["scan_data"].get("ip_address") == ip_address:
+                    entry["ip_info"] = ip_info
+                    self._write_entry(hashed_number, entry, version)
+                    count += 1
+            if count:
+                self._commit_write(version)
+            return count
+
+    def _remove_entry(self, hashed_number, expected_version=None):
+        with self.lock, storage_timer("sqlite", "delete"), self.conn:
+            version = self._begin_write((hashed_number,), expected_version)
+            old = self.conn.execute(
+                f"SELECT {', '.join(self.INDEXED_FIELDS)}, original_number FROM entries WHERE hashed_number = ?",
+                (hashed_number,)
+            ).fetchone()
+            if not old:
+                return False
+            self.conn.execute("DELETE FROM entries WHERE hashed_number = ?", (hashed_number,))
+            self._adjust_field_values(old[:-1], -1)
+            self._log_change(version, "delete", hashed_number, old[-1])
+            self._commit_write(version)
+            return True
+
+    def import_entries(self, entries):
+        count = 0
+        with self.lock, storage_timer("sqlite", "import"), self.conn:
+            version = self._begin_write(())
+            for entry in entries:
+                self._write_entry(entry["hashed_number"], entry, version)
+                count += 1
+            self._commit_write(version)
+        registry_log.info(f"Imported {count} entries into {self.registry_file}")
+        return count
+
+    def iter_entries(self):
+        # Strony po id czytane pod self.lock: między kolejnymi next() (eksport HTTP woła je z różnych wątków)
+        # nie zostaje otwarty kursor na połączeniu, którym w tym czasie idą zapisy
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute("SELECT id, data FROM entries WHERE id > ? ORDER BY id LIMIT ?",
+                                         (last_id, SQLITE_PAGE_ROWS)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for _, data in rows:
+                yield json.loads(data)
+
+    def iter_records(self):
+        return (RegistryRecord.from_dict(entry) for entry in self.iter_entries())
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def contains_hashes(self, hashes):
+        # Paczki po SQLITE_MAX_PARAMS w indeksie UNIQUE(hashed_number)
+        hashes, present = list(hashes), set()
+        with self.lock:
+            for offset in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                chunk = hashes[offset:offset + SQLITE_MAX_PARAMS]
+                rows = self.conn.execute(f"SELECT hashed_number FROM entries WHERE hashed_number IN "
+                                         f"({', '.join('?' * len(chunk))})", chunk)
+                present.update(hashed_number for (hashed_number,) in rows)
+        return present
+
+    def registered_hashes(self):
+        with self.lock:
+            return [hashed_number for (hashed_number,) in self.conn.execute("SELECT hashed_number FROM entries")]
+
+    def change_log_start(self):
+        return self.conn.execute("SELECT value FROM meta WHERE key = 'changes_start'").fetchone()[0]
+
+    def truncate_changes(self, keep):
+        with self.lock, storage_timer("sqlite", "truncate_changes"), self.conn:
+            version = self._begin_write(()) - 1
+            start = max(version - keep, self.change_log_start())
+            removed = self.conn.execute("DELETE FROM changes WHERE seq <= ?", (start,)).rowcount
+            self.conn.execute("UPDATE meta SET value = ? WHERE key = 'changes_start'", (start,))
+        registry_log.info(f"Change log truncated to sequence {start} ({removed} events removed)")
+        return {"start": start, "removed": removed}
+
+    def changes(self, since=0, until=None):
+        rows = self.conn.execute(
+            "SELECT seq, op, changed_at, hashed_number, original_number FROM changes WHERE seq > ? AND seq <= ? "
+            "ORDER BY seq, rowid", (since, 2 ** 63 - 1 if until is None else until)
+        )
+        for seq, op, changed_at, hashed_number, original_number in rows:
+            yield {"seq": seq, "op": op, "changed_at": changed_at, "hashed_number": hashed_number,
+                   "original_number": original_number}
+
+    def _entries_for(self, hashes):
+        hashes, entries = list(hashes), {}
+        with self.lock:
+            for offset in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                chunk = hashes[offset:offset + SQLITE_MAX_PARAMS]
+                rows = self.conn.execute(f"SELECT hashed_number, data FROM entries WHERE hashed_number IN "
+                                         f"({', '.join('?' * len(chunk))})", chunk)
+                entries.update((hashed_number, json.loads(data)) for hashed_number, data in rows)
+        return entries
+
+    def search_by_notes(self, keyword):
+        needle = keyword.lower()
+        if self.fts and len(keyword) >= 3:
+            rows = self.conn.execute(
+                "SELECT e.notes, e.data FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid "
+                "WHERE entries_fts MATCH ? ORDER BY e.id", ('"' + keyword.replace('"', '""') + '"',)
+            )
+        else:
+            rows = self.conn.execute("SELECT notes, data FROM entries ORDER BY id")
+        # Filtr końcowy gwarantuje tę samą semantykę co PhoneRegistry (podciąg bez rozróżniania wielkości liter)
+        results = [json.loads(data) for notes, data in rows if needle in notes.lower()]
+        registry_log.info(f"Search by notes with keyword '{keyword}' returned {len(results)} results")
+        return results
+
+    def search_by_field(self, field, keyword):
+        if field not in self.INDEXED_FIELDS:
+            return super().search_by_field(field, keyword)
+        needle = keyword.lower()
+        values = [value for (value,) in self.conn.execute("SELECT value FROM field_values WHERE field = ?", (field,))
+                  if needle in value.lower()]
+        results = []
+        if values:
+            rows = []
+            for start in range(0, len(values), 500):
+                chunk = values[start:start + 500]
+                rows += self.conn.execute(
+                    f"SELECT id, data FROM entries WHERE {field} IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+            rows.sort()
+            results = [json.loads(data) for _, data in rows]
+        registry_log.info(f"Search by {field} with keyword '{keyword}' returned {len(results)} results")
+        return results
+
+    def _field_values(self, field, value):
+        # Wartości pola równe value bez rozróżniania wielkości liter (słownik field_values jest mały)
+        key = RegistryIndex.value_key(value)
+        return [stored for (stored,) in self.conn.execute("SELECT value FROM field_values WHERE field = ?", (field,))
+                if RegistryIndex.value_key(stored) == key]
+
+    def _query_entries(self, bounds, filters, limit):
+        low, high, high_inclusive = bounds
+        clauses, params = ["original_number >= ?"], [low]
+        if high is not None:
+            clauses.append(f"original_number {'<=' if high_inclusive else '<'} ?")
+            params.append(high)
+        for field, value in filters.items():
+            values = self._field_values(field, value)
+            if not values:
+                return []
+            clauses.append(f"{field} IN ({', '.join('?' * len(values))})")
+            params += values
+        rows = self.conn.execute(
+            f"SELECT data FROM entries WHERE {' AND '.join(clauses)} ORDER BY original_number LIMIT ?",
+            (*params, -1 if limit is None else limit)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+def registry_path(registry_file, storage):
+    # phone_registry.json <-> phone_registry.db zależnie od backendu
+    base, ext = os.path.splitext(registry_file)
+    if storage == "sqlite" and ext == ".json":
+        return base + ".db"
+    if storage != "sqlite" and ext == ".db":
+        return base + ".json"
+    return registry_file
+
+# Pola rekordów delty/różnicy, które nie należą do wpisu
+CHANGE_FIELDS = ("seq", "op", "changed_at", "deleted", "changed_fields")
+
+def load_snapshot(path):
+    # Snapshot rejestru do porównania -> {skrót: wpis}: baza SQLite (.db), eksport lub delta JSONL (.jsonl,
+    # także .gz; tombstone usuwa wpis) albo rejestr JSON (z dziennikiem .journal, jeśli istnieje).
+    # Eksport ma spłaszczone kolumny - porównywać snapshoty tego samego rodzaju
+    if path.endswith(".db"):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return {hashed_number: json.loads(data)
+                    for hashed_number, data in conn.execute("SELECT hashed_number, data FROM entries")}
+        finally:
+            conn.close()
+    if path.endswith((".jsonl", ".jsonl.gz")):
+        entries = {}
+        with (gzip.open if path.endswith(".gz") else open)(path, "rt", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "hashed_number" not in record and "original_number" not in record:
+                    raise ValueError(f"{path}:{line_number}: record has neither hashed_number nor original_number")
+                key = record.get("hashed_number") or hash_number(record["original_number"])
+                if record.get("deleted"):
+                    entries.pop(key, None)
+                else:
+                    entries[key] = {field: value for field, value in record.items() if field not in CHANGE_FIELDS}
+        return entries
+    if os.path.exists(f"{path}.journal"):
+        return JournalStorage(path).load(truncate=False)
+    return JsonFileStorage(path).load()
+
+def _changed_fields(old, new, prefix=""):
+    fields = []
+    for field in sorted(set(old) | set(new), key=str):
+        before, after = old.get(field), new.get(field)
+        if before == after:
+            continue
+        if isinstance(before, dict) and isinstance(after, dict):
+            fields += _changed_fields(before, after, f"{prefix}{field}.")
+        else:
+            fields.append(f"{prefix}{field}")
+    return fields
+
+def diff_snapshots(old, new):
+    # Różnica dwóch snapshotów w formacie delty: register (nowy wpis), update (changed_fields, pola
+    # zagnieżdżone jako scan_data.carrier), delete (tombstone)
+    for hashed_number, entry in new.items():
+        previous = old.get(hashed_number)
+        if previous is None:
+            yield {"op": "register", "deleted": False, **entry}
+        elif previous != entry:
+            yield {"op": "update", "deleted": False, "changed_fields": _changed_fields(previous, entry), **entry}
+    for hashed_number, entry in old.items():
+        if hashed_number not in new:
+            yield {"op": "delete", "deleted": True, "hashed_number": hashed_number,
+                   "original_number": entry.get("original_number", "")}
+
+def open_registry(registry_file="phone_registry.json", storage="json", scanner=None, lock_timeout=30.0):
+    registry_file = registry_path(registry_file, storage)
+    if storage == "sqlite":
+        return SQLitePhoneRegistry(registry_file, scanner=scanner, lock_timeout=lock_timeout)
+    return PhoneRegistry(registry_file, scanner=scanner, storage=STORAGE_BACKENDS[storage](registry_file),
+                         lock_timeout=lock_timeout)
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ScanBatcher:
+    # Łączy pojedyncze żądania /validate z wielu połączeń w paczki: jedno przejście do puli wątków
+    # na paczkę zamiast na numer. Gdy nic się nie skanuje, paczka idzie od razu (w następnym obiegu pętli),
+    # inaczej zbiera żądania do max_batch numerów albo window sekund - pojedynczy klient nie czeka na okno
+    def __init__(self, scanner, executor, max_batch=64, window=0.002):
+        self.scanner = scanner
+        self.executor = executor
+        self.max_batch = max_batch
+        self.window = window
+        self.pending = []
+        self.timer = None
+        self.running = 0
+
+    async def validate(self, number):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((number, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_soon(self.flush) if not self.running else loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        import asyncio
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        SERVER_BATCHES.inc()
+        SERVER_BATCHED_NUMBERS.inc(len(batch))
+        self.running += 1
+        task = asyncio.get_running_loop().run_in_executor(self.executor, self._scan, [num for num, _ in batch])
+
+        def deliver(task):
+            self.running -= 1
+            if self.pending and not self.running:
+                self.flush()
+            error = asyncio.CancelledError() if task.cancelled() else task.exception()
+            for index, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(task.result()[index])
+        task.add_done_callback(deliver)
+
+    def _scan(self, numbers):
+        return [self.scanner.validate_number(num) for num in numbers]
+
+class ScanService:
+    # Długo działający serwer HTTP/JSON (asyncio, tylko biblioteka standardowa): metadane skanera, cache
+    # i rejestr zostają w pamięci między żądaniami. Operacje blokujące idą do puli wątków; najwyżej
+    # max_concurrency żądań naraz, kolejne czekają w kolejce do max_queue, ponad nią 503.
+    MAX_BODY = 16 * 1024 * 1024
+    ROUTES = {
+        ("GET", "/health"): "health",
+        ("GET", "/metrics"): "metrics",
+        ("GET", "/stats"): "stats",
+        ("GET", "/validate"): "validate",
+        ("POST", "/validate"): "validate",
+        ("POST", "/validate/batch"): "validate_batch",
+        ("POST", "/register"): "register",
+        ("POST", "/register/batch"): "register_batch",
+        ("GET", "/lookup"): "lookup",
+        ("POST", "/lookup"): "lookup",
+        ("POST", "/lookup/batch"): "lookup_batch",
+        ("GET", "/search"): "search",
+        ("GET", "/query"): "query",
+        ("GET", "/export"): "export",
+        ("GET", "/changes"): "changes",
+        ("POST", "/delete"): "delete"
+    }
+    # Trasy, które same czytają ciało (JSON albo numer na linię)
+    BODY_ROUTES = ("validate_batch", "lookup_batch")
+    # Parametry z numerem E.164: "+" w zapytaniu to znak numeru, nie zakodowana spacja
+    NUMBER_PARAMS = ("number", "prefix", "from", "to", "after")
+
+    def __init__(self, registry, scanner=None, host="127.0.0.1", port=8080, max_concurrency=64, max_queue=1024,
+                 max_batch=64, batch_window=0.002, workers=1, chunk_size=BATCH_CHUNK_SIZE):
+        from concurrent.futures import ThreadPoolExecutor
+        self.registry = registry
+        self.scanner = scanner or registry.scanner
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="phonescan-server")
+        self.batcher = ScanBatcher(self.scanner, self.executor, max_batch, batch_window)
+        # Procesy robocze tylko dla /validate/batch (duże paczki); pojedyncze numery obsługują wątki.
+        # "spawn": fork procesu z działającymi wątkami serwera mógłby skopiować zajęte blokady
+        self.pool = None
+        if workers and workers > 1:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker, initargs=(_log_config,))
+        self.server = None
+        self.semaphore = None
+        self.stopping = None
+        self.queued = 0
+        self.in_flight = 0
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+
+    async def start(self):
+        import asyncio
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.stopping = asyncio.Event()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=64 * 1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        app_log.info(f"Service listening on http://{self.host}:{self.port}",
+                     extra={"event": "server_started", "fields": {"host": self.host, "port": self.port}})
+        return self
+
+    async def serve_forever(self, ready=None):
+        import signal
+        import asyncio
+        await self.start()
+        if ready is not None:
+            ready(self)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stopping.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C przerywa przez KeyboardInterrupt
+        try:
+            await self.stopping.wait()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        self.batcher.flush()
+        self.executor.shutdown(wait=True)
+        if self.pool is not None:
+            self.pool.shutdown()
+        app_log.info(f"Service stopped after {self.requests} requests ({self.errors} errors)",
+                     extra={"event": "server_stopped", "fields": {"requests": self.requests, "errors": self.errors}})
+
+    def run(self, ready=None):
+        import asyncio
+        asyncio.run(self.serve_forever(ready))
+        return {"requests": self.requests, "errors": self.errors}
+
+    # Protokół HTTP/1.1 (keep-alive, Content-Length, odpowiedzi strumieniowe chunked)
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self._handle_request(writer, *request)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _readline(reader, status, message):
+        # Linia dłuższa niż limit strumienia (limit w start_server): readline rzuca ValueError
+        try:
+            return await reader.readline()
+        except ValueError:
+            raise HTTPError(status, message)
+
+    async def _read_request(self, reader):
+        from urllib.parse import urlsplit, parse_qs, unquote
+        line = await self._readline(reader, 414, "Request line too long")
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await self._readline(reader, 431, "Request header too long")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+            if len(headers) > 100:
+                raise HTTPError(431, "Too many headers")
+        if "chunked" in headers.get("transfer-encoding", ""):
+            raise HTTPError(411, "Chunked request bodies are not supported, send Content-Length")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > self.MAX_BODY:
+            raise HTTPError(413, f"Request body larger than {self.MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        for item in url.query.split("&"):
+            key, _, value = item.partition("=")
+            if unquote(key) in self.NUMBER_PARAMS and value:
+                query[unquote(key)] = unquote(value)
+        keep_alive = headers.get("connection", "").lower() != "close" and version != "HTTP/1.0"
+        return method.upper(), url.path.rstrip("/") or "/", query, headers, body, keep_alive
+
+    async def _handle_request(self, writer, method, path, query, headers, body, keep_alive):
+        self.requests += 1
+        started = time.perf_counter()
+        route = self.ROUTES.get((method, path))
+        status = 200
+        try:
+            if route is None:
+                known = any(route_path == path for _, route_path in self.ROUTES)
+                raise HTTPError(405 if known else 404, f"{'Method not allowed' if known else 'Not found'}: "
+                                                       f"{method} {path}")
+            params = dict(query)
+            if body and method == "POST" and route not in self.BODY_ROUTES:
+                params.update(self._json_body(body))
+            if route in ("health", "metrics", "stats"):
+                # Sonda zdrowia i metryki omijają limit - muszą odpowiadać także pod obciążeniem
+                status = await getattr(self, f"route_{route}")(writer, params, keep_alive)
+            else:
+                if self.semaphore.locked() and self.queued >= self.max_queue:
+                    SERVER_REJECTED.inc()
+                    raise HTTPError(503, "Server busy, retry later")
+                self.queued += 1
+                SERVER_QUEUED.set(self.queued)
+                try:
+                    await self.semaphore.acquire()
+                finally:
+                    self.queued -= 1
+                    SERVER_QUEUED.set(self.queued)
+                self.in_flight += 1
+                SERVER_IN_FLIGHT.set(self.in_flight)
+                try:
+                    if route in self.BODY_ROUTES:
+                        status = await getattr(self, f"route_{route}")(writer, params, body, headers, keep_alive)
+                    else:
+                        status = await getattr(self, f"route_{route}")(writer, params, keep_alive)
+                finally:
+                    self.in_flight -= 1
+                    SERVER_IN_FLIGHT.set(self.in_flight)
+                    self.semaphore.release()
+        except HTTPError as e:
+            status = e.status
+            await self._send_json(writer, status, {"error": str(e)}, keep_alive)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            status = 500
+            app_log.error(f"Request {method} {path} failed: {str(e)}")
+            await self._send_json(writer, status, {"error": f"Internal error: {str(e)}"}, keep_alive)
+        if status >= 500:
+            self.errors += 1
+        elapsed = time.perf_counter() - started
+        METRICS.histogram("phonescan_server_request_seconds", "HTTP request latency by route",
+                          route=route or "unknown").observe(elapsed)
+        METRICS.counter("phonescan_server_responses_total", "HTTP responses by status", status=str(status)).inc()
+        app_log.info(f"{method} {path} {status} {elapsed * 1000:.1f}ms", extra={
+            "event": "http_request", "sampled": True,
+            "fields": {"method": method, "path": path, "status": status, "elapsed_ms": round(elapsed * 1000, 2)}})
+        return keep_alive
+
+    @staticmethod
+    def _json_body(body):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "Request body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return data
+
+    @staticmethod
+    def _param(params, name, required=True, default=""):
+        value = params.get(name)
+        if value in (None, ""):
+            if required:
+                raise HTTPError(400, f"Missing parameter: {name}")
+            return default
+        return value
+
+    @staticmethod
+    def _version_param(params):
+        value = params.get("if_version")
+        if value in (None, ""):
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise HTTPError(400, "if_version must be an integer")
+
+    @staticmethod
+    def _result_status(result):
+        # Wynik operacji rejestru z "error" (np. nieprawidłowy numer) -> 422, konflikt wersji -> 409
+        if result.get("conflict"):
+            return 409
+        return 422 if "error" in result else 200
+
+    async def _send(self, writer, status, body, content_type, keep_alive, headers=()):
+        from http import HTTPStatus
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}", *headers]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+        return status
+
+    async def _send_json(self, writer, status, data, keep_alive=True):
+        headers = ("Retry-After: 1",) if status == 503 else ()
+        body = json.dumps(data, ensure_ascii=False, default=_json_default).encode()
+        return await self._send(writer, status, body, "application/json", keep_alive, headers)
+
+    async def _send_stream(self, writer, content_type, chunks, keep_alive):
+        # Transfer-Encoding: chunked; drain() po każdej paczce - wolny klient spowalnia producenta
+        writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\nTransfer-Encoding: chunked\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1"))
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                    await writer.drain()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # Nagłówek już wysłany - klient dostaje urwaną odpowiedź (brak kończącej paczki 0)
+            app_log.error(f"Streaming response failed: {str(e)}")
+            raise ConnectionAbortedError(str(e)) from e
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return 200
+
+    async def _call(self, function, *args, **kwargs):
+        import asyncio
+        import functools
+        return await asyncio.get_running_loop().run_in_executor(self.executor,
+                                                                functools.partial(function, *args, **kwargs))
+
+    # Endpointy
+    async def route_health(self, writer, params, keep_alive):
+        registry = self.registry
+        return await self._send_json(writer, 200, {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "entries": await self._call(len, registry),
+            "version": await self._call(registry.current_version),
+            "storage": registry.storage_backend,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "requests": self.requests
+        }, keep_alive)
+
+    async def route_metrics(self, writer, params, keep_alive):
+        body = METRICS.render_prometheus().encode()
+        return await self._send(writer, 200, body, "text/plain; version=0.0.4", keep_alive)
+
+    async def route_stats(self, writer, params, keep_alive):
+        return await self._send_json(writer, 200, METRICS.summary(), keep_alive)
+
+    async def route_validate(self, writer, params, keep_alive):
+        number = str(self._param(params, "number"))
+        return await self._send_json(writer, 200, {"input": number, **await self.batcher.validate(number)},
+                                     keep_alive)
+
+    async def route_validate_batch(self, writer, params, body, headers, keep_alive):
+        # Ciało: {"numbers": [...], "scam_check": false} albo tekst - jeden numer na linię; odpowiedź NDJSON
+        # w kolejności wejścia, wysyłana paczka po paczce w miarę skanowania
+        import asyncio
+        numbers, data = self._body_numbers(body, headers)
+        scam_check = bool(data.get("scam_check", params.get("scam_check") in ("1", "true")))
+        loop = asyncio.get_running_loop()
+
+        def submit(chunk):
+            if self.pool is not None:
+                return asyncio.wrap_future(self.pool.submit(_scan_chunk, chunk, self.scanner.api_key, scam_check,
+                                                            self.scanner.options))
+            return loop.run_in_executor(self.executor, lambda: ([self.scanner.scan_one(num, scam_check)
+                                                                 for num in chunk], None))
+
+        async def lines():
+            # Najwyżej dwie paczki w locie: kolejna skanuje się, gdy poprzednia jest wysyłana
+            pending = deque()
+            chunks = _chunked(numbers, self.chunk_size)
+            try:
+                for chunk in itertools.islice(chunks, 2):
+                    pending.append((chunk, submit(chunk)))
+                while pending:
+                    chunk, future = pending.popleft()
+                    results, worker_metrics = await future
+                    if worker_metrics:
+                        METRICS.merge(worker_metrics)
+                    BATCH_NUMBERS.inc(len(chunk))
+                    chunk_next = next(chunks, None)
+                    if chunk_next is not None:
+                        pending.append((chunk_next, submit(chunk_next)))
+                    yield "".join(json.dumps({"input": num, **result}, ensure_ascii=False) + "\n"
+                                  for num, result in zip(chunk, results)).encode()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+        return await self._send_stream(writer, "application/x-ndjson", lines(), keep_alive)
+
+    def _body_numbers(self, body, headers):
+        # -> (numbers, pozostałe pola JSON)
+        if headers.get("content-type", "").startswith("application/json"):
+            data = self._json_body(body)
+            numbers = data.get("numbers")
+            if not isinstance(numbers, list):
+                raise HTTPError(400, "Expected {\"numbers\": [...]}")
+        else:
+            data = {}
+            numbers = [line.strip() for line in body.decode("utf-8", "replace").splitlines()
+                       if line.strip() and not line.lstrip().startswith("#")]
+        return [str(num) for num in numbers], data
+
+    async def route_register(self, writer, params, keep_alive):
+        result = await self._call(self.registry.register_number, str(self._param(params, "number")),
+                                  str(self._param(params, "notes", False)), str(self._param(params, "name", False)),
+                                  str(self._param(params, "signal", False)), str(self._param(params, "ip", False)),
+                                  self._version_param(params))
+        return await self._send_json(writer, self._result_status(result), result, keep_alive)
+
+    async def route_register_batch(self, writer, params, keep_alive):
+        # records: lista [number, notes, name, signal, ip] lub obiektów {"number", "notes", ...}
+        records = params.get("records")
+        if not isinstance(records, list):
+            raise HTTPError(400, "Expected {\"records\": [...]}")
+        records = [tuple(record.get(key, "") for key in ("number", "notes", "name", "signal", "ip"))
+                   if isinstance(record, dict) else record for record in records]
+        result = await self._call(self.registry.register_many, records)
+        return await self._send_json(writer, 200, result, keep_alive)
+
+    async def route_lookup(self, writer, params, keep_alive):
+        result = await self._call(self.registry.check_if_registered, str(self._param(params, "number")))
+        return await self._send_json(writer, self._result_status(result), result, keep_alive)
+
+    async def route_lookup_batch(self, writer, params, body, headers, keep_alive):
+        # Masowe sprawdzanie przynależności (check_many), ciało jak w /validate/batch; NDJSON w kolejności wejścia
+        numbers, _ = self._body_numbers(body, headers)
+        results = self.registry.check_many(numbers)
+
+        async def lines():
+            for chunk in _chunked(numbers, CHECK_BATCH_SIZE):
+                chunk_results = await self._call(list, itertools.islice(results, len(chunk)))
+                yield "".join(json.dumps({"input": num, **result}, ensure_ascii=False) + "\n"
+                              for num, result in zip(chunk, chunk_results)).encode()
+        return await self._send_stream(writer, "application/x-ndjson", lines(), keep_alive)
+
+    async def route_search(self, writer, params, keep_alive):
+        keyword = str(self._param(params, "keyword"))
+        if params.get("field"):
+            results = await self._call(self.registry.search_by_field, params["field"], keyword)
+        else:
+            results = await self._call(self.registry.search_by_notes, keyword)
+        return await self._send_json(writer, 200, {"results": results, "count": len(results)}, keep_alive)
+
+    async def route_query(self, writer, params, keep_alive):
+        try:
+            limit = int(params.get("limit", 100))
+        except ValueError:
+            raise HTTPError(400, "limit must be an integer")
+        filters = {field: params.get(field) for field in QUERY_FIELDS}
+        result = await self._call(self.registry.query, params.get("prefix"), params.get("from"), params.get("to"),
+                                  limit or None, params.get("after"), **filters)
+        return await self._send_json(writer, 400 if "error" in result else 200, result, keep_alive)
+
+    async def route_export(self, writer, params, keep_alive):
+        fmt = params.get("format", "csv")
+        if fmt not in ("csv", "jsonl"):
+            raise HTTPError(400, "HTTP export supports csv and jsonl (use the export command for parquet/arrow)")
+        fields = [field for field in params.get("fields", "").split(",") if field.strip()] or None
+        try:
+            exporter = RegistryExporter(fields)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        chunks = exporter.text_chunks(await self._call(self.registry.iter_records), fmt)
+
+        async def body():
+            rows = 0
+            while True:
+                item = await self._call(next, chunks, None)
+                if item is None:
+                    break
+                rows += item[1]
+                yield item[0].encode()
+            export_log.info(f"Registry exported over HTTP ({fmt}, {rows} rows)")
+        content_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+        return await self._send_stream(writer, content_type, body(), keep_alive)
+
+    async def route_changes(self, writer, params, keep_alive):
+        try:
+            since = int(params.get("since", 0))
+        except ValueError:
+            raise HTTPError(400, "since must be an integer")
+        result = await self._call(self.registry.delta, since, params.get("events") in ("1", "true"))
+        return await self._send_json(writer, self._result_status(result), result, keep_alive)
+
+    async def route_delete(self, writer, params, keep_alive):
+        result = await self._call(self.registry.delete_entry, str(self._param(params, "number")),
+                                  self._version_param(params))
+        return await self._send_json(writer, self._result_status(result), result, keep_alive)
 
 class SimpleModernMenu:
-    def __init__(self):
+    def __init__(self, defer_enrichment=None):
+        load_ui()
         self.scanner = PhoneScanner()
-        self.registry = PhoneRegistry()
+        self.registry = PhoneRegistry(scanner=self.scanner)
+        # Odroczone wzbogacanie IP tylko na życzenie (jak --defer-enrichment); domyślnie lookup przy rejestracji
+        if defer_enrichment is None:
+            defer_enrichment = os.environ.get("PHONESCAN_DEFER_ENRICHMENT", "") not in ("", "0")
+        self.enrichment = EnrichmentQueue(self.registry) if defer_enrichment else None
         self.menu_options = [
             ("Scan Single Number", ICONS["scan"]),
             ("Batch Scan Numbers", ICONS["batch"]),
             ("Check for Scams", ICONS["scam"]),
             ("Register Number", ICONS["register"]),
+            ("Bulk Register from File", ICONS["batch"]),
             ("View Registered Numbers", ICONS["view"]),
             ("Check if Registered", ICONS["check"]),
             ("Search by Notes", ICONS["search"]),
@@ -365,8 +4025,10 @@ class SimpleModernMenu:
             print(f"{Fore.RED + Style.BRIGHT}{ICONS['scam']} Error: {result['error']}{Style.RESET_ALL}")
             return
         table = [[key, value] for key, value in result.items() if key not in ["possible_formats", "timezones"]]
-        table += [["Timezones", ", ".join(result["timezones"])]]
-        table += [["Possible Formats", ", ".join(result["possible_formats"])]]
+        if "timezones" in result:
+            table += [["Timezones", ", ".join(result["timezones"])]]
+        if "possible_formats" in result:
+            table += [["Possible Formats", ", ".join(result["possible_formats"])]]
         print(f"\n{Fore.CYAN + Style.BRIGHT}{ICONS['scan']} Results:{Style.RESET_ALL}")
         print(tabulate(table, headers=["Field", "Value"], tablefmt="fancy_grid"))
 
@@ -394,6 +4056,8 @@ class SimpleModernMenu:
         print(tabulate(table, headers=["Number", "Country", "ISO", "Carrier", "Geolocation", "Type", "Name", "Signal", "IP", "Notes", "Date"], tablefmt="fancy_grid"))
 
     def handle_input(self):
+        # keyboard wymaga roota na Linuksie, więc ładujemy go tylko dla menu interaktywnego
+        import keyboard
         while self.running:
             self.display_menu()
             event = keyboard.read_event(suppress=True)
@@ -444,6 +4108,18 @@ class SimpleModernMenu:
             self.display_result(result)
             input(f"\n{Fore.YELLOW}Press Enter to continue...{Style.RESET_ALL}")
 
+        elif option == "Bulk Register from File":
+            source = input(f"{Fore.YELLOW}Enter file path (one 'number,notes,name,signal,ip' per line): {Style.RESET_ALL}")
+            if not os.path.exists(source):
+                self.display_result({"error": f"File not found: {source}"})
+            else:
+                result = self.registry.register_many(read_records(source))
+                self.display_result({key: value for key, value in result.items() if key != "results"})
+                failed = [[item["index"], item["input"], item["error"]] for item in result["results"] if "error" in item]
+                if failed:
+                    print(tabulate(failed[:50], headers=["Line", "Number", "Error"], tablefmt="fancy_grid"))
+            input(f"\n{Fore.YELLOW}Press Enter to continue...{Style.RESET_ALL}")
+
         elif option == "View Registered Numbers":
             registered = self.registry.get_registered_numbers()
             self.display_list_results(registered)
@@ -493,17 +4169,555 @@ class SimpleModernMenu:
     def run(self):
         print(BANNER)
         print(f"{Fore.GREEN}Starting Ethical Phone Registry & Scanner...{Style.RESET_ALL}")
-        logging.info("Application started")
-        self.handle_input()
+        app_log.info("Application started")
+        if self.enrichment is not None:
+            self.enrichment.start()
+        try:
+            self.handle_input()
+        finally:
+            if self.enrichment is not None:
+                self.enrichment.stop()
+
+# Kolumny CSV dla trybu wsadowego (bez interaktywnego menu)
+SCAN_CSV_FIELDS = [
+    "input", "valid", "possible", "country_code", "national_number", "full_international",
+    "full_e164", "country", "country_iso", "carrier", "geolocation", "timezones",
+    "number_type", "scan_time", "error"
+]
+ENTRY_CSV_FIELDS = [
+    "index", "input", "registered", "success", "duplicate", "message", "hashed_number", "original_number",
+    "country", "country_iso", "carrier", "geolocation", "number_type", "user_provided_name",
+    "user_reported_signal", "ip_address", "notes", "registered_at", "status", "attempts", "version", "conflict",
+    "error"
+]
+CHANGE_CSV_FIELDS = [
+    "seq", "op", "changed_at", "deleted", "hashed_number", "original_number", "country", "country_iso", "carrier",
+    "geolocation", "number_type", "user_provided_name", "user_reported_signal", "ip_address", "notes",
+    "registered_at", "changed_fields", "error"
+]
+CHECK_CSV_FIELDS = ["input", "e164", "registered", "confirmed", "error"]
+BLOOM_CSV_FIELDS = ["path", "count", "bits", "hashes", "bytes", "version", "created", "error_rate"]
+
+def read_numbers(source):
+    # Jeden numer na linię, puste linie i komentarze (#) są pomijane
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def read_records(source):
+    # Linie CSV: number[,notes[,name[,signal[,ip]]]]; opcjonalny nagłówek zaczynający się od "number"
+    for index, record in enumerate(csv.reader(read_numbers(source))):
+        if index == 0 and record and record[0].strip().lower() == "number":
+            continue
+        if record:
+            yield record
+
+def entry_row(entry):
+    scan_data = entry.get("scan_data", {})
+    row = {key: value for key, value in entry.items() if key not in ("scan_data", "ip_info")}
+    row.update({field: scan_data.get(field, "") for field in
+                ("country", "country_iso", "carrier", "geolocation", "number_type",
+                 "user_provided_name", "user_reported_signal", "ip_address")})
+    return row
+
+class RecordWriter:
+    def __init__(self, output="-", fmt="jsonl", fields=None):
+        self.fmt = fmt
+        self.stream = sys.stdout if output in (None, "-") else open(output, "w", encoding="utf-8", newline="")
+        self.csv_writer = None
+        if fmt == "csv":
+            self.csv_writer = csv.DictWriter(self.stream, fieldnames=fields, extrasaction="ignore")
+            self.csv_writer.writeheader()
+        self.count = 0
+        self.errors = 0
+
+    def write(self, record):
+        self.count += 1
+        if "error" in record:
+            self.errors += 1
+        if self.csv_writer:
+            self.csv_writer.writerow({key: ";".join(map(str, value)) if isinstance(value, list) else value
+                                      for key, value in record.items()})
+        else:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        if self.stream is sys.stdout:
+            self.stream.flush()
+        else:
+            self.stream.close()
+
+class HeadlessCLI:
+    def __init__(self, args):
+        self.args = args
+        self.scanner = PhoneScanner()
+        self._registry = None
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            self._registry = open_registry(self.args.registry, self.args.storage, scanner=self.scanner,
+                                           lock_timeout=self.args.lock_timeout)
+            if self.args.defer_enrichment or self.args.command == "enrich":
+                EnrichmentQueue(self._registry)
+        return self._registry
+
+    def validation_scanner(self):
+        # scan/batch/serve: osobny skaner z pre-screenem lub okrojonymi metadanymi; rejestr zawsze
+        # używa pełnego skanu
+        prescreen, fields = getattr(self.args, "prescreen", False), getattr(self.args, "metadata", None)
+        if not prescreen and fields is None:
+            return self.scanner
+        return PhoneScanner(prescreen=prescreen, fields=fields)
+
+    def numbers(self):
+        if self.args.numbers:
+            return iter(self.args.numbers)
+        return read_numbers(self.args.input)
+
+    def cmd_scan(self, writer):
+        inputs = deque()
+        def tracked(numbers):
+            for num in numbers:
+                inputs.append(num)
+                yield num
+        workers = getattr(self.args, "workers", 1)
+        chunk_size = getattr(self.args, "chunk_size", BATCH_CHUNK_SIZE)
+        for result in self.validation_scanner().stream_scan(tracked(self.numbers()), workers=workers,
+                                                            chunk_size=chunk_size):
+            writer.write({"input": inputs.popleft(), **result})
+
+    cmd_batch = cmd_scan
+
+    def row(self, result):
+        # JSONL zachowuje pełny kształt wpisu, CSV dostaje spłaszczony wiersz
+        if self.args.format == "jsonl":
+            return result
+        if "scan_data" in result:
+            return entry_row(result)
+        row = entry_row(result["entry"]) if "entry" in result else {}
+        row.update({key: value for key, value in result.items() if key != "entry"})
+        return row
+
+    def cmd_register(self, writer):
+        for num in self.numbers():
+            result = self.registry.register_number(num, self.args.notes, self.args.name,
+                                                   self.args.signal, self.args.ip, self.args.if_version)
+            writer.write({"input": num, **self.row(result)})
+
+    def cmd_register_batch(self, writer):
+        result = self.registry.register_many(read_records(self.args.input), workers=self.args.workers)
+        for item in result["results"]:
+            writer.write(item)
+
+    def cmd_enrich(self, writer):
+        queue = self.registry.enrichment
+        if self.args.list:
+            for item in queue.pending() if self.args.list == "pending" else queue.failed():
+                writer.write(item)
+            return
+        if self.args.retry_failed:
+            queue.retry_failed()
+        if self.args.requeue:
+            queue.requeue_entries(self.args.requeue)
+        for result in queue.process_due():
+            writer.write({**result, "error": result["last_error"]} if result["status"] == "failed" else result)
+
+    def cmd_lookup(self, writer):
+        for num in self.numbers():
+            writer.write({"input": num, **self.row(self.registry.check_if_registered(num))})
+
+    def cmd_check(self, writer):
+        # Masowe sprawdzanie (bulk_check); --bloom-only odpowiada z samego filtra bez otwierania rejestru
+        args = self.args
+        bloom = RegistryBloomFilter.load(args.bloom) if args.bloom else None
+        inputs = deque()
+        def tracked(numbers):
+            for num in numbers:
+                inputs.append(num)
+                yield num
+        try:
+            if args.bloom_only:
+                results = bulk_check(self.scanner, tracked(self.numbers()), bloom=bloom, batch_size=args.batch_size)
+            else:
+                results = self.registry.check_many(tracked(self.numbers()), bloom, args.batch_size)
+            for result in results:
+                writer.write({"input": inputs.popleft(), **result})
+        finally:
+            if bloom is not None:
+                bloom.close()
+
+    def cmd_bloom(self, writer):
+        path = self.args.output_filter or f"{self.registry.registry_file}.bloom"
+        writer.write(self.registry.build_bloom_filter(path, self.args.error_rate))
+
+    def cmd_search(self, writer):
+        if self.args.field:
+            results = self.registry.search_by_field(self.args.field, self.args.keyword)
+        else:
+            results = self.registry.search_by_notes(self.args.keyword)
+        for entry in results:
+            writer.write(self.row(entry))
+
+    def cmd_query(self, writer):
+        filters = {field: getattr(self.args, field) for field in QUERY_FIELDS}
+        result = self.registry.query(self.args.prefix, self.args.start, self.args.end, self.args.limit or None,
+                                     self.args.after, **filters)
+        for entry in result["results"]:
+            writer.write(self.row(entry))
+        if result["next"] and not self.args.quiet:
+            print(f"next page: --after {result['next']}", file=sys.stderr)
+
+    def cmd_changes(self, writer):
+        # Delta od --since albo od sekwencji zapisanej w --checkpoint; checkpoint aktualizowany po eksporcie
+        args = self.args
+        since = args.since
+        if since is None and args.checkpoint and os.path.exists(args.checkpoint):
+            with open(args.checkpoint, "r", encoding="utf-8") as f:
+                since = json.load(f)["seq"]
+        result = self.registry.delta(since or 0, args.events)
+        if "error" in result:
+            writer.write(result)
+            return
+        for record in result["records"]:
+            writer.write(self.row(record))
+        if args.checkpoint:
+            atomic_write_json(args.checkpoint, {"seq": result["until"], "synced_at": datetime.now().isoformat()})
+        if args.keep is not None:
+            truncated = self.registry.truncate_changes(args.keep)
+            if not args.quiet:
+                print(f"change log now starts at sequence {truncated['start']} "
+                      f"({truncated['removed']} events removed)", file=sys.stderr)
+        if not args.quiet:
+            if result.get("full"):
+                print(f"full snapshot: change log starts at sequence {result['start']}, after {result['since']}; "
+                      f"replace the mirror with these entries", file=sys.stderr)
+            print(f"synced through sequence {result['until']} (next: --since {result['until']})", file=sys.stderr)
+
+    def cmd_diff(self, writer):
+        try:
+            old, new = load_snapshot(self.args.old), load_snapshot(self.args.new)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            writer.write({"error": f"Cannot read snapshot: {str(e)}"})
+            return
+        for record in diff_snapshots(old, new):
+            writer.write(self.row(record))
+
+    def cmd_export(self):
+        fields = [field for field in self.args.fields.split(",") if field.strip()] if self.args.fields else None
+        try:
+            return self.registry.export(self.args.output, self.args.format, fields, self.args.gzip)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def cmd_delete(self, writer):
+        for num in self.numbers():
+            writer.write({"input": num, **self.registry.delete_entry(num, self.args.if_version)})
+
+    def cmd_serve(self):
+        args = self.args
+        service = ScanService(self.registry, self.validation_scanner(), args.host, args.port, args.max_concurrency,
+                              args.max_queue, args.batch_size, args.batch_window_ms / 1000, args.workers,
+                              args.chunk_size)
+        if self.registry.enrichment is not None:
+            self.registry.enrichment.start()
+        def ready(service):
+            if not args.quiet:
+                print(f"serving on http://{service.host}:{service.port} (Ctrl+C to stop)", file=sys.stderr)
+        try:
+            return service.run(ready)
+        finally:
+            if self.registry.enrichment is not None:
+                self.registry.enrichment.stop()
+
+    def cmd_migrate(self, writer):
+        target_file = registry_path(self.args.target or self.args.registry, self.args.to)
+        if self.args.to == "sqlite":
+            target = SQLitePhoneRegistry(target_file, scanner=self.scanner)
+            count = target.import_entries(self.registry.iter_entries())
+            target.close()
+        else:
+            registry = {entry["hashed_number"]: entry for entry in self.registry.iter_entries()}
+            target = STORAGE_BACKENDS[self.args.to](target_file)
+            target.save(registry)
+            target.close()
+            count = len(registry)
+        writer.write({"success": True, "message": f"Migrated {count} entries to {self.args.to} storage ({target_file})."})
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            if self.args.command == "serve":
+                result = self.cmd_serve()
+                count, errors = result["requests"], result["errors"]
+            elif self.args.command == "export":
+                # Eksport pisze bezpośrednio do pliku/stdout, bez RecordWriter
+                result = self.cmd_export()
+                if "error" in result:
+                    print(f"export: {result['error']}", file=sys.stderr)
+                count, errors = result.get("rows", 0), int("error" in result)
+            else:
+                fields = {"scan": SCAN_CSV_FIELDS, "batch": SCAN_CSV_FIELDS, "check": CHECK_CSV_FIELDS,
+                          "bloom": BLOOM_CSV_FIELDS, "changes": CHANGE_CSV_FIELDS,
+                          "diff": CHANGE_CSV_FIELDS}.get(self.args.command, ENTRY_CSV_FIELDS)
+                writer = RecordWriter(self.args.output, self.args.format, fields)
+                try:
+                    getattr(self, f"cmd_{self.args.command.replace('-', '_')}")(writer)
+                finally:
+                    writer.close()
+                count, errors = writer.count, writer.errors
+        finally:
+            if self._registry is not None:
+                self._registry.close()
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else 0.0
+        summary = (f"{self.args.command}: {count} records, {errors} errors, "
+                   f"{elapsed:.2f}s ({rate:.0f} records/s)")
+        app_log.info(f"Headless {summary}", extra={
+            "event": "headless_summary",
+            "fields": {"command": self.args.command, "records": count, "errors": errors,
+                       "elapsed_s": round(elapsed, 3), "records_per_s": round(rate, 1)}})
+        if not self.args.quiet:
+            print(summary, file=sys.stderr)
+        return 1 if errors else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="PhoneNetworkScan.py",
+                                     description="Ethical Phone Registry & Scanner (headless mode). "
+                                                 "Run without arguments for the interactive menu.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--registry", default="phone_registry.json", help="Registry file")
+    common.add_argument("--storage", choices=sorted(STORAGE_BACKENDS) + ["sqlite"], default="json",
+                        help="Registry storage backend (journal = append-only log + snapshot, "
+                             "sqlite = indexed database)")
+    common.add_argument("--lock-timeout", type=float, default=30.0, metavar="SECONDS",
+                        help="How long to wait for other processes writing to the same registry")
+    common.add_argument("--defer-enrichment", action="store_true",
+                        help="Register immediately and queue IP enrichment for a later 'enrich' run")
+    common.add_argument("-q", "--quiet", action="store_true", help="Do not print the summary to stderr")
+    common.add_argument("--log-file", default="registry_log.txt", help="Log file")
+    common.add_argument("--log-format", choices=["text", "json"], default="text",
+                        help="Log format (json = one event per line, written by a background thread)")
+    common.add_argument("--log-level", default="INFO",
+                        help="Log level, optionally per subsystem, e.g. 'INFO,scanner=WARNING,storage=DEBUG' "
+                             f"(subsystems: {', '.join(LOG_SUBSYSTEMS)})")
+    common.add_argument("--log-sample", type=float, default=None, metavar="RATE",
+                        help="Fraction of per-number events to log (0.01 = every 100th, 0 = summaries only)")
+    common.add_argument("--log-max-bytes", type=int, default=0,
+                        help="Rotate the log file after this many bytes (0 = never)")
+    common.add_argument("--metrics-file", default=None,
+                        help="Write runtime metrics at exit (Prometheus text, or JSON if the name ends in .json)")
+    common.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve /metrics (Prometheus) and /stats (JSON) on 127.0.0.1:PORT while running")
+    common.add_argument("--stats-interval", type=float, default=None, metavar="SECONDS",
+                        help="Log a metrics summary every SECONDS")
+    common.add_argument("--profile", choices=["cpu", "memory", "all"], default=None,
+                        help="Profile this run with cProfile and/or tracemalloc")
+    common.add_argument("--profile-output", default="phonescan_profile",
+                        help="Profile output prefix (.pstats/.txt/.tracemalloc.txt)")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    output.add_argument("-f", "--format", choices=["jsonl", "csv"], default="jsonl", help="Output format")
+    numbers = argparse.ArgumentParser(add_help=False)
+    numbers.add_argument("numbers", nargs="*", help="Phone numbers (default: read from --input)")
+    numbers.add_argument("-i", "--input", default="-", help="File with one number per line ('-' = stdin)")
+
+    screening = argparse.ArgumentParser(add_help=False)
+    screening.add_argument("--prescreen", action="store_true",
+                           help="Reject malformed, unsupported and impossible numbers before full metadata lookup")
+    screening.add_argument("--metadata", type=parse_scan_fields, default=None, metavar="FIELDS",
+                           help=f"Metadata to compute: comma-separated {', '.join(PhoneScanner.SCAN_FIELDS)}, "
+                                f"'all' (default) or 'none'")
+
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("scan", parents=[common, output, numbers, screening], help="Validate numbers")
+    batch = sub.add_parser("batch", parents=[common, output, numbers, screening],
+                           help="Validate numbers in parallel")
+    batch.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    batch.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="Numbers per worker chunk")
+    register = sub.add_parser("register", parents=[common, output, numbers], help="Register numbers")
+    register.add_argument("--notes", default="", help="Notes stored with each number")
+    register.add_argument("--name", default="", help="User-provided name")
+    register.add_argument("--signal", default="", help="User-reported signal strength")
+    register.add_argument("--ip", default="", help="Associated IP address")
+    register.add_argument("--if-version", type=int, default=None, metavar="VERSION",
+                          help="Only overwrite entries unchanged since this registry version (from 'lookup')")
+    register_batch = sub.add_parser("register-batch", parents=[common, output],
+                                    help="Register many numbers from a CSV file in one commit")
+    register_batch.add_argument("-i", "--input", default="-",
+                                help="CSV lines 'number,notes,name,signal,ip' ('-' = stdin)")
+    register_batch.add_argument("-w", "--workers", type=int, default=1, help="Worker processes for validation")
+    enrich = sub.add_parser("enrich", parents=[common, output], help="Process the deferred IP enrichment queue")
+    enrich.add_argument("--list", choices=["pending", "failed"], default=None, help="Only list queue items")
+    enrich.add_argument("--retry-failed", action="store_true", help="Move failed items back to pending")
+    enrich.add_argument("--requeue", choices=["missing", "all"], default=None,
+                        help="Queue existing entries with IPs (missing = without IP data)")
+    sub.add_parser("lookup", parents=[common, output, numbers], help="Check if numbers are registered")
+    check = sub.add_parser("check", parents=[common, output, numbers],
+                           help="Bulk membership check: normalize, de-duplicate and test numbers in batches")
+    check.add_argument("--bloom", default=None, metavar="FILE",
+                       help="Bloom filter snapshot (from 'bloom') that answers most absent numbers")
+    check.add_argument("--bloom-only", action="store_true",
+                       help="Answer from the snapshot alone without opening the registry (hits are unconfirmed)")
+    check.add_argument("--batch-size", type=int, default=CHECK_BATCH_SIZE, help="Numbers per registry lookup")
+    bloom = sub.add_parser("bloom", parents=[common, output],
+                           help="Write a Bloom filter snapshot of registered numbers for 'check --bloom'")
+    bloom.add_argument("--filter", dest="output_filter", default=None, metavar="FILE",
+                       help="Snapshot file (default: <registry>.bloom)")
+    bloom.add_argument("--error-rate", type=float, default=0.001, help="Target false positive rate")
+    changes = sub.add_parser("changes", parents=[common, output],
+                             help="Export entries changed since a sequence number, with tombstones for deletions")
+    changes.add_argument("--since", type=int, default=None,
+                         help="Last sequence already synced (default: from --checkpoint, else 0)")
+    changes.add_argument("--checkpoint", default=None, metavar="FILE",
+                         help="Read --since from FILE and store the new sequence there after the export")
+    changes.add_argument("--events", action="store_true",
+                         help="Every change event instead of the latest state of each changed entry")
+    changes.add_argument("--keep", type=int, default=None, metavar="N",
+                         help="After the export, drop change log events older than the last N registry versions")
+    diff = sub.add_parser("diff", parents=[common, output],
+                          help="Compare two registry snapshots (.json registry, .db, or JSONL export/delta)")
+    diff.add_argument("old", help="Older snapshot")
+    diff.add_argument("new", help="Newer snapshot")
+    search = sub.add_parser("search", parents=[common, output], help="Search registry by notes or field")
+    search.add_argument("keyword", help="Keyword to search for")
+    search.add_argument("--field", default=None, help="scan_data field to search (default: notes)")
+    query = sub.add_parser("query", parents=[common, output],
+                           help="Indexed registry query by number prefix/range and exact field values")
+    query.add_argument("--prefix", default=None, help="E.164 prefix, e.g. +4850")
+    query.add_argument("--from", dest="start", default=None, help="Range start (inclusive)")
+    query.add_argument("--to", dest="end", default=None, help="Range end (inclusive)")
+    for field in QUERY_FIELDS:
+        query.add_argument(f"--{field.replace('_', '-')}", dest=field, default=None,
+                           help=f"Exact {field} (case-insensitive)")
+    query.add_argument("--limit", type=int, default=100, help="Page size (0 = no limit)")
+    query.add_argument("--after", default=None, help="Cursor: last number of the previous page")
+    export = sub.add_parser("export", parents=[common], help="Export the whole registry (streaming)")
+    export.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    export.add_argument("-f", "--format", choices=RegistryExporter.FORMATS, default="csv",
+                        help="Export format (parquet/arrow need pyarrow)")
+    export.add_argument("--fields", default=None,
+                        help="Comma-separated columns to export (e.g. original_number,country,notes)")
+    export.add_argument("--gzip", action="store_true", help="Compress the output")
+    delete = sub.add_parser("delete", parents=[common, output, numbers], help="Delete numbers from registry")
+    delete.add_argument("--if-version", type=int, default=None, metavar="VERSION",
+                        help="Only delete entries unchanged since this registry version (from 'lookup')")
+    serve = sub.add_parser("serve", parents=[common, screening],
+                           help="Run a local HTTP/JSON service with the scanner and registry kept warm")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    serve.add_argument("--port", type=int, default=8080, help="Port to listen on (0 = any free port)")
+    serve.add_argument("--max-concurrency", type=int, default=64, help="Requests processed at the same time")
+    serve.add_argument("--max-queue", type=int, default=1024,
+                       help="Requests allowed to wait for a slot; beyond that the server answers 503")
+    serve.add_argument("--batch-size", type=int, default=64,
+                       help="Maximum number of concurrent /validate requests coalesced into one batch")
+    serve.add_argument("--batch-window-ms", type=float, default=2.0,
+                       help="How long a /validate batch waits for more requests")
+    serve.add_argument("-w", "--workers", type=int, default=1,
+                       help="Worker processes for /validate/batch (1 = scan in server threads)")
+    serve.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE,
+                       help="Numbers per streamed /validate/batch chunk")
+    migrate = sub.add_parser("migrate", parents=[common, output], help="Convert the registry to another storage backend")
+    migrate.add_argument("--to", choices=sorted(STORAGE_BACKENDS) + ["sqlite"], required=True, help="Target storage backend")
+    migrate.add_argument("--target", default=None, help="Target registry file (default: --registry)")
+    return parser
+
+def parse_scan_fields(spec):
+    # "carrier,number_type" -> lista pól; "all" -> None (pełny skan), "none" -> []
+    spec = spec.strip().lower()
+    if spec == "all":
+        return None
+    fields = [field.strip() for field in spec.split(",") if field.strip() and spec != "none"]
+    unknown = [field for field in fields if field not in PhoneScanner.SCAN_FIELDS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown metadata fields: {', '.join(unknown)} "
+                                         f"(available: {', '.join(PhoneScanner.SCAN_FIELDS)})")
+    return fields
+
+SAMPLED_EVENTS = ("number_scan", "number_invalid", "ip_check", "number_registered", "register_failed",
+                  "number_lookup", "http_request")
+
+def parse_log_levels(spec):
+    # "INFO,scanner=WARNING" -> (INFO, {"scanner": "WARNING"})
+    level, levels = "INFO", {}
+    for part in filter(None, (item.strip() for item in spec.split(","))):
+        name, _, value = part.rpartition("=")
+        value = value.strip().upper()
+        if not isinstance(logging.getLevelName(value), int):
+            raise argparse.ArgumentTypeError(f"unknown log level: {value}")
+        if not name:
+            level = value
+        elif name.strip() in LOG_SUBSYSTEMS:
+            levels[name.strip()] = value
+        else:
+            raise argparse.ArgumentTypeError(f"unknown log subsystem: {name}")
+    return level, levels
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        level, levels = parse_log_levels(args.log_level)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if getattr(args, "bloom_only", False) and not args.bloom:
+        parser.error("--bloom-only requires --bloom")
+    if getattr(args, "keep", None) is not None and args.keep < 0:
+        parser.error("--keep must be 0 or more")
+    sample_rates = None
+    if args.log_sample is not None:
+        sample_rates = {event: args.log_sample for event in SAMPLED_EVENTS}
+    configure_logging(args.log_file, level=level, structured=args.log_format == "json",
+                      max_bytes=args.log_max_bytes, levels=levels, sample_rates=sample_rates)
+    server = reporter = None
+    if args.metrics_port is not None:
+        server = MetricsServer(args.metrics_port).start()
+        if not args.quiet:
+            print(f"metrics: http://127.0.0.1:{server.port}/metrics", file=sys.stderr)
+    if args.stats_interval:
+        reporter = StatsReporter(args.stats_interval).start()
+    try:
+        if args.profile:
+            with Profiler(args.profile, args.profile_output) as profiler:
+                status = HeadlessCLI(args).run()
+            if not args.quiet:
+                print(f"profile: {', '.join(profiler.files)}", file=sys.stderr)
+            return status
+        return HeadlessCLI(args).run()
+    finally:
+        if reporter is not None:
+            reporter.stop()
+        if args.metrics_file:
+            METRICS.write(args.metrics_file)
+        if server is not None:
+            server.stop()
 
 # Główny entry point
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        try:
+            sys.exit(main())
+        except KeyboardInterrupt:
+            app_log.info("Headless run terminated by user")
+            sys.exit(130)
+        except BrokenPipeError:
+            # Odbiorca potoku (np. head) zamknął wyjście
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(0)
+    configure_logging()
+    load_ui()
     try:
         menu = SimpleModernMenu()
         menu.run()
     except KeyboardInterrupt:
         print(f"\n{Fore.RED}Program terminated by user.{Style.RESET_ALL}")
-        logging.info("Program terminated by user")
+        app_log.info("Program terminated by user")
     except Exception as e:
         print(f"\n{Fore.RED}An error occurred: {str(e)}{Style.RESET_ALL}")
-        logging.error(f"Application error: {str(e)}")
\ No newline at end of file
+        app_log.error(f"Application error: {str(e)}")
\ No newline at end of file
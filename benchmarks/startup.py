@@ -0,0 +1,105 @@
+# startup.py - Pomiar czasu startu PhoneNetworkScan.py i kosztu ładowania poszczególnych podsystemów.
+# Każdy pomiar w świeżym procesie (zimny start), wynik = mediana z --repeat powtórzeń.
+# Użycie: python benchmarks/startup.py [--repeat 5] [--json startup.json]
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "PhoneNetworkScan.py")
+
+# Podsystemy: kod wykonywany po imporcie modułu (czas mierzony wewnątrz procesu)
+SUBSYSTEMS = [
+    ("module import", "pass"),
+    ("phonenumbers core", "P.load_phonenumbers()"),
+    ("prefix metadata (geocoder/carrier/timezone)", "P.load_metadata()"),
+    ("first validate_number", "P.PhoneScanner().validate_number('+48500123456')"),
+    ("requests (IP enrichment)", "P.IPEnricher().session"),
+    ("menu UI (colorama/tabulate)", "P.load_ui()"),
+    ("SQLite registry", "P.SQLitePhoneRegistry(':memory:').close()"),
+    ("pyarrow (columnar export)", "import pyarrow, pyarrow.parquet"),
+]
+
+CHILD = """
+import sys, time, json
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import PhoneNetworkScan as P
+imported = time.perf_counter()
+try:
+    {code}
+    error = None
+except Exception as e:
+    error = str(e)
+finished = time.perf_counter()
+print(json.dumps({{"import": imported - started, "step": finished - imported, "error": error}}))
+"""
+
+# Pełne wywołania CLI (czas ścienny procesu, łącznie ze startem interpretera)
+COMMANDS = [
+    ("python -c pass", [sys.executable, "-c", "pass"]),
+    ("PhoneNetworkScan.py --help", [sys.executable, SCRIPT, "--help"]),
+    ("PhoneNetworkScan.py scan <number>", [sys.executable, SCRIPT, "scan", "+48500123456", "-q"]),
+]
+
+def run_child(code):
+    output = subprocess.run([sys.executable, "-c", CHILD.format(root=ROOT, code=code)],
+                            capture_output=True, text=True, cwd=ROOT, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_subsystems(repeat):
+    results = []
+    for name, code in SUBSYSTEMS:
+        runs = [run_child(code) for _ in range(repeat)]
+        results.append({
+            "subsystem": name,
+            "import_ms": round(statistics.median(run["import"] for run in runs) * 1000, 1),
+            "cost_ms": round(statistics.median(run["step"] for run in runs) * 1000, 1),
+            "error": runs[-1]["error"]
+        })
+    return results
+
+def measure_commands(repeat, workdir):
+    results = []
+    for name, command in COMMANDS:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            subprocess.run(command, capture_output=True, cwd=workdir)
+            timings.append(time.perf_counter() - started)
+        results.append({"command": name, "wall_ms": round(statistics.median(timings) * 1000, 1)})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure PhoneNetworkScan startup and per-subsystem load cost")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (median is reported)")
+    parser.add_argument("--json", default=None, help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    import tempfile
+    with tempfile.TemporaryDirectory() as workdir:
+        report = {
+            "python": sys.version.split()[0],
+            "subsystems": measure_subsystems(args.repeat),
+            "commands": measure_commands(args.repeat, workdir)
+        }
+
+    print(f"{'Subsystem':<46}{'first use (ms)':>16}")
+    for item in report["subsystems"]:
+        cost = "unavailable" if item["error"] else f"{item['cost_ms']:.1f}"
+        print(f"{item['subsystem']:<46}{cost:>16}")
+    print(f"\n{'Module import (ms)':<46}{report['subsystems'][0]['import_ms']:>16.1f}\n")
+    print(f"{'Command':<46}{'wall (ms)':>16}")
+    for item in report["commands"]:
+        print(f"{item['command']:<46}{item['wall_ms']:>16.1f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
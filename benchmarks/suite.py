@@ -0,0 +1,595 @@
+# suite.py - Benchmarki gorących ścieżek PhoneNetworkScan: skaner, rejestr, wyszukiwanie, eksport i wzbogacanie IP.
+# Każda operacja w osobnym procesie (czysta pamięć i cache), wynik = przepustowość, percentyle opóźnień
+# i szczytowa pamięć w JSON, do porównywania między wersjami.
+# Użycie: python benchmarks/suite.py [--sizes 10000,1000000] [--cases scan,search] [--json results.json]
+#         python benchmarks/suite.py --compare old.json new.json
+
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import PhoneNetworkScan as P
+
+BACKENDS = ("json", "journal", "sqlite")
+NOTE_WORDS = ("customer", "callback", "scam", "spam", "delivery", "bank", "survey", "verified", "robocall", "lead")
+CARRIER_NEEDLE = "mobile"
+
+# ---------------------------------------------------------------- dane syntetyczne
+
+def supported_regions():
+    # Regiony dla kodów krajów obsługiwanych przez PhoneScanner (supported_countries)
+    P.load_phonenumbers()
+    regions = []
+    for country_code in sorted(P.PhoneScanner().supported_countries):
+        for region in P.phonenumbers.region_codes_for_country_code(country_code):
+            if region != "001":
+                regions.append(region)
+    return sorted(regions)
+
+def example_numbers():
+    # Przykładowe numery (komórkowe i stacjonarne) dla każdego regionu jako szablony
+    P.load_phonenumbers()
+    examples = []
+    for region in supported_regions():
+        for number_type in (P.PhoneNumberType.MOBILE, P.PhoneNumberType.FIXED_LINE):
+            number = P.phonenumbers.example_number_for_type(region, number_type)
+            if number is not None and len(str(number.national_number)) >= 8:
+                examples.append(P.phonenumbers.format_number(number, P.phonenumbers.PhoneNumberFormat.E164))
+    return sorted(set(examples))
+
+def generate_numbers(count, seed=1):
+    # count różnych, poprawnych numerów E.164 rozłożonych na wszystkie obsługiwane kody krajów
+    P.load_phonenumbers()
+    rng = random.Random(seed)
+    templates = example_numbers()
+    numbers, seen, attempts = [], set(), 0
+    while len(numbers) < count and attempts < count * 20:
+        attempts += 1
+        template = templates[attempts % len(templates)]
+        candidate = template[:-4] + f"{rng.randrange(10000):04d}"
+        if candidate in seen:
+            continue
+        seen.add(candidate)
+        if P.phonenumbers.is_valid_number(P.phonenumbers.parse(candidate)):
+            numbers.append(candidate)
+    rng.shuffle(numbers)
+    return numbers
+
+def generate_dirty_numbers(count, junk_share=0.8, seed=1):
+    # Zanieczyszczony strumień wejściowy: junk_share śmieci (bez "+", za krótkie/za długie, nieobsługiwane
+    # i nieznane kody krajów, losowe cyfry), reszta to poprawne numery
+    rng = random.Random(seed)
+    valid = generate_numbers(count, seed)
+    mutations = (
+        lambda n: n[1:],
+        lambda n: n[:-rng.randint(3, 6)],
+        lambda n: n + str(rng.randint(1000, 999999)),
+        lambda n: "+91" + n[3:],
+        lambda n: "+999" + n[4:],
+        lambda n: "+" + "".join(rng.choice("0123456789") for _ in range(rng.randint(3, 16))),
+    )
+    numbers = [rng.choice(mutations)(number) if rng.random() < junk_share else number for number in valid]
+    return numbers
+
+def entry_templates():
+    scanner = P.PhoneScanner(cache=P.ScanCache(max_size=0))
+    templates, prefixes = [], set()
+    for number in example_numbers():
+        scan_result = scanner.validate_number(number)
+        # Unikalny prefiks (numer bez 6 ostatnich cyfr) gwarantuje unikalność generowanych numerów
+        if "error" not in scan_result and scan_result["valid"] and number[:-6] not in prefixes:
+            prefixes.add(number[:-6])
+            templates.append(scan_result)
+    return templates
+
+def generate_entries(count, seed=1):
+    # Wpisy rejestru w formacie PhoneRegistry (bez skanowania każdego numeru): numer = szablon regionu
+    # z podmienionymi 6 ostatnimi cyframi (permutacja indeksu, więc numery są unikalne), notatki z losowych słów
+    rng = random.Random(seed)
+    templates = entry_templates()
+    registered_at = datetime(2024, 1, 1).isoformat()
+    for index in range(count):
+        template = templates[index % len(templates)]
+        suffix = f"{(index // len(templates)) * 738337 % 1000000:06d}"
+        number = template["full_e164"][:-6] + suffix
+        scan_data = dict(template, full_e164=number,
+                         national_number=str(template["national_number"])[:-6] + suffix,
+                         full_international=template["full_international"],
+                         possible_formats=[template["full_international"], number, template["possible_formats"][2]],
+                         user_provided_name="", user_reported_signal="",
+                         ip_address=f"203.0.{rng.randrange(256)}.{rng.randrange(256)}" if rng.random() < 0.3 else "",
+                         last_scanned=registered_at)
+        yield {
+            "hashed_number": P.hash_number(number),
+            "original_number": number,
+            "scan_data": scan_data,
+            "ip_info": {},
+            "notes": " ".join(rng.choice(NOTE_WORDS) for _ in range(rng.randrange(4))),
+            "registered_at": registered_at
+        }
+
+def registry_fixture(backend, size, workdir):
+    # Plik rejestru danego backendu i rozmiaru - generowany raz i używany ponownie przez kolejne przypadki
+    path = os.path.join(workdir, f"fixture_{size}.{'db' if backend == 'sqlite' else 'json'}")
+    if os.path.exists(path):
+        return path
+    tmp_path = path + ".building"
+    if backend == "sqlite":
+        registry = P.SQLitePhoneRegistry(tmp_path)
+        registry.import_entries(generate_entries(size))
+        registry.close()
+    else:
+        # Zapis strumieniowy (bez budowania słownika całego rejestru w pamięci)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("{")
+            for index, entry in enumerate(generate_entries(size)):
+                f.write(("," if index else "") + json.dumps(entry["hashed_number"]) + ":" + json.dumps(entry))
+            f.write("}")
+    os.replace(tmp_path, path)
+    return path
+
+def working_copy(path, workdir):
+    # Przypadki modyfikujące rejestr pracują na kopii fixture
+    copy = os.path.join(workdir, "work_" + os.path.basename(path))
+    for suffix in ("", ".journal", "-wal", "-shm", ".enrich.json"):
+        if os.path.exists(copy + suffix):
+            os.remove(copy + suffix)
+    shutil.copyfile(path, copy)
+    return copy
+
+# ---------------------------------------------------------------- lokalny serwer ip-api
+
+class StubIPAPI:
+    # Zaślepka ip-api.com (GET /json/<ip>, POST /batch) z opcjonalnym opóźnieniem odpowiedzi
+    def __init__(self, latency=0.0):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        latency_s = latency
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, data):
+                if latency_s:
+                    time.sleep(latency_s)
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-Rl", "1000")
+                self.send_header("X-Ttl", "60")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self.send_json(StubIPAPI.info(self.path.rsplit("/", 1)[-1].split("?")[0]))
+
+            def do_POST(self):
+                queries = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                self.send_json([StubIPAPI.info(query["query"] if isinstance(query, dict) else query)
+                                for query in queries])
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @staticmethod
+    def info(ip_address):
+        return {"status": "success", "country": "Poland", "countryCode": "PL", "regionName": "Mazowieckie",
+                "city": "Warsaw", "isp": "Benchmark ISP", "org": "Benchmark", "as": "AS64500", "query": ip_address}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ---------------------------------------------------------------- pomiary
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KB, macOS: bajty
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    position = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[position]
+
+def measure_each(operation, items):
+    # Opóźnienie każdego wywołania osobno -> percentyle
+    timings = []
+    clock = time.perf_counter
+    started = clock()
+    for item in items:
+        call_started = clock()
+        operation(item)
+        timings.append(clock() - call_started)
+    total = clock() - started
+    timings.sort()
+    return {
+        "ops": len(timings),
+        "total_s": round(total, 4),
+        "ops_per_s": round(len(timings) / total, 1) if total > 0 else None,
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 4),
+        "p90_ms": round(percentile(timings, 0.90) * 1000, 4),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 4),
+        "max_ms": round(timings[-1] * 1000, 4)
+    }
+
+def measure_bulk(operation, items_count, repeat=1):
+    # Operacja na całej paczce; przepustowość liczona w elementach (numerach, wpisach, wierszach)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    best = timings[0]
+    return {
+        "ops": repeat,
+        "items": items_count,
+        "total_s": round(sum(timings), 4),
+        "best_s": round(best, 4),
+        "median_s": round(percentile(timings, 0.5), 4),
+        "items_per_s": round(items_count / best, 1) if best > 0 else None
+    }
+
+# ---------------------------------------------------------------- przypadki
+# Każdy przypadek: setup(ctx) -> operacja mierzona przez measure_each/measure_bulk; ctx["size"] to rozmiar rejestru
+
+def open_fixture(ctx, copy=False):
+    path = registry_fixture(ctx["backend"], ctx["size"], ctx["workdir"])
+    if copy:
+        path = working_copy(path, ctx["workdir"])
+    scanner = P.PhoneScanner(cache=P.ScanCache(max_size=0))
+    # Rozgrzewka: metadane geocoder/carrier ładowane przy pierwszym skanie nie wchodzą do pomiaru
+    scanner.validate_number("+48500123456")
+    return P.open_registry(path, ctx["backend"], scanner=scanner)
+
+def case_validate(ctx):
+    scanner = P.PhoneScanner(cache=P.ScanCache(max_size=0))
+    numbers = generate_numbers(ctx["ops"])
+    scanner.validate_number(numbers[0])
+    return lambda: measure_each(scanner.validate_number, numbers)
+
+def case_validate_cached(ctx):
+    scanner = P.PhoneScanner(cache=P.ScanCache())
+    numbers = generate_numbers(min(ctx["ops"], 1000))
+    for number in numbers:
+        scanner.validate_number(number)
+    return lambda: measure_each(scanner.validate_number, (numbers * (ctx["ops"] // len(numbers) + 1))[:ctx["ops"]])
+
+def case_validate_dirty(options):
+    def case(ctx):
+        scanner = P.PhoneScanner(cache=P.ScanCache(max_size=0), **options)
+        numbers = generate_dirty_numbers(ctx["ops"])
+        scanner.validate_number(numbers[0])
+        return lambda: measure_each(scanner.validate_number, numbers)
+    return case
+
+def case_batch_scan(ctx):
+    scanner = P.PhoneScanner(cache=P.ScanCache(max_size=0))
+    numbers = generate_numbers(ctx["ops"])
+    def run():
+        for _ in scanner.stream_scan(numbers, workers=ctx["workers"]):
+            pass
+    return lambda: measure_bulk(run, len(numbers))
+
+def case_register_number(ctx):
+    registry = open_fixture(ctx, copy=True)
+    ctx["close"] = registry.close
+    numbers = generate_numbers(ctx["register_ops"], seed=2)
+    return lambda: measure_each(registry.register_number, numbers)
+
+def case_register_many(ctx):
+    registry = open_fixture(ctx, copy=True)
+    ctx["close"] = registry.close
+    numbers = generate_numbers(ctx["ops"], seed=2)
+    records = [(number, "bulk import", "", "", "") for number in numbers]
+    return lambda: measure_bulk(lambda: registry.register_many(records, workers=1), len(records))
+
+def case_load_registry(ctx):
+    path = registry_fixture(ctx["backend"], ctx["size"], ctx["workdir"])
+    def run():
+        registry = P.open_registry(path, ctx["backend"])
+        if ctx["backend"] == "sqlite":
+            len(registry)
+        registry.close()
+    return lambda: measure_bulk(run, ctx["size"])
+
+def case_save_registry(ctx):
+    # Pełny zapis wszystkich wpisów; w SQLite save_registry to sam commit (zapisy są natychmiastowe),
+    # więc porównywalną pracą jest przepisanie wszystkich wierszy
+    registry = open_fixture(ctx, copy=True)
+    ctx["close"] = registry.close
+    if ctx["backend"] == "sqlite":
+        entries = list(registry.iter_entries())
+        return lambda: measure_bulk(lambda: registry.import_entries(entries), ctx["size"], ctx["repeat"])
+    return lambda: measure_bulk(registry.save_registry, ctx["size"], ctx["repeat"])
+
+def case_check_if_registered(ctx):
+    registry = open_fixture(ctx)
+    ctx["close"] = registry.close
+    rng = random.Random(3)
+    sample = [entry["original_number"] for entry in generate_entries(min(ctx["size"], 20000))]
+    # Połowa trafień, połowa numerów spoza rejestru
+    numbers = [rng.choice(sample) for _ in range(ctx["ops"] // 2)] + generate_numbers(ctx["ops"] - ctx["ops"] // 2, 4)
+    rng.shuffle(numbers)
+    return lambda: measure_each(registry.check_if_registered, numbers)
+
+def case_check_many(use_bloom):
+    # Dziennik połączeń: 10% numerów z rejestru, reszta spoza niego, z powtórzeniami
+    def case(ctx):
+        registry = open_fixture(ctx)
+        ctx["close"] = registry.close
+        rng = random.Random(5)
+        registered = [entry["original_number"] for entry in generate_entries(min(ctx["size"], 20000))]
+        absent = generate_numbers(ctx["ops"], 6)
+        numbers = [rng.choice(registered) if rng.random() < 0.1 else rng.choice(absent) for _ in range(ctx["ops"])]
+        bloom = None
+        if use_bloom:
+            path = os.path.join(ctx["workdir"], f"fixture_{ctx['size']}.{ctx['backend']}.bloom")
+            registry.build_bloom_filter(path)
+            bloom = P.RegistryBloomFilter.load(path)
+        def run():
+            for _ in registry.check_many(numbers, bloom):
+                pass
+        return lambda: measure_bulk(run, len(numbers), ctx["repeat"])
+    return case
+
+def case_delta(ctx):
+    # Delta po ctx["ops"] zmianach w rejestrze rozmiaru ctx["size"] - koszt ma zależeć od liczby zmian
+    registry = open_fixture(ctx, copy=True)
+    ctx["close"] = registry.close
+    since = registry.current_version()
+    changed = list(itertools.islice(generate_entries(ctx["size"] + ctx["ops"], seed=2), ctx["size"], None))
+    for offset in range(0, len(changed), 1000):
+        registry._store_entries({entry["hashed_number"]: entry for entry in changed[offset:offset + 1000]})
+    return lambda: measure_bulk(lambda: registry.delta(since), len(changed), ctx["repeat"])
+
+def case_search_notes(ctx):
+    registry = open_fixture(ctx)
+    ctx["close"] = registry.close
+    keywords = [NOTE_WORDS[index % len(NOTE_WORDS)] for index in range(ctx["queries"])]
+    return lambda: measure_each(registry.search_by_notes, keywords)
+
+def case_search_field(ctx):
+    registry = open_fixture(ctx)
+    ctx["close"] = registry.close
+    return lambda: measure_each(lambda keyword: registry.search_by_field("carrier", keyword),
+                                [CARRIER_NEEDLE] * ctx["queries"])
+
+def case_query_prefix(ctx):
+    registry = open_fixture(ctx)
+    ctx["close"] = registry.close
+    prefixes = sorted({entry["original_number"][:6] for entry in generate_entries(min(ctx["size"], 5000))})
+    registry.query(prefix=prefixes[0], limit=1)
+    return lambda: measure_each(lambda prefix: registry.query(prefix=prefix, limit=100),
+                                [prefixes[index % len(prefixes)] for index in range(ctx["queries"] * 10)])
+
+def case_export(fmt):
+    def case(ctx):
+        registry = open_fixture(ctx)
+        ctx["close"] = registry.close
+        output = os.path.join(ctx["workdir"], f"export.{fmt}")
+        return lambda: measure_bulk(lambda: registry.export(output, fmt), ctx["size"])
+    return case
+
+def case_check_ip(ctx):
+    stub = StubIPAPI(ctx["ip_latency"])
+    ctx["close"] = stub.close
+    scanner = P.PhoneScanner(enricher=P.IPEnricher(base_url=stub.url, requests_per_minute=0))
+    addresses = [f"198.51.{index // 256 % 256}.{index % 256}" for index in range(ctx["ops"])]
+    scanner.check_ip_address("192.0.2.1")
+    return lambda: measure_each(scanner.check_ip_address, addresses)
+
+def case_lookup_many(ctx):
+    stub = StubIPAPI(ctx["ip_latency"])
+    ctx["close"] = stub.close
+    enricher = P.IPEnricher(base_url=stub.url, requests_per_minute=0)
+    addresses = [f"198.18.{index // 256 % 256}.{index % 256}" for index in range(ctx["ops"])]
+    enricher.lookup("192.0.2.1")
+    return lambda: measure_bulk(lambda: enricher.lookup_many(addresses), len(addresses))
+
+# nazwa -> (funkcja, zależy od backendu i rozmiaru rejestru)
+CASES = {
+    "scan.validate_number": (case_validate, False),
+    "scan.validate_number_cached": (case_validate_cached, False),
+    "scan.validate_dirty": (case_validate_dirty({}), False),
+    "scan.validate_dirty_prescreen": (case_validate_dirty({"prescreen": True}), False),
+    "scan.validate_dirty_prescreen_carrier": (case_validate_dirty({"prescreen": True, "fields": ["carrier"]}), False),
+    "scan.batch_scan": (case_batch_scan, False),
+    "registry.register_number": (case_register_number, True),
+    "registry.register_many": (case_register_many, True),
+    "registry.load_registry": (case_load_registry, True),
+    "registry.save_registry": (case_save_registry, True),
+    "registry.check_if_registered": (case_check_if_registered, True),
+    "registry.check_many": (case_check_many(False), True),
+    "registry.check_many_bloom": (case_check_many(True), True),
+    "registry.delta": (case_delta, True),
+    "search.search_by_notes": (case_search_notes, True),
+    "search.search_by_field": (case_search_field, True),
+    "search.query_prefix": (case_query_prefix, True),
+    "export.csv": (case_export("csv"), True),
+    "export.jsonl": (case_export("jsonl"), True),
+    "ip.check_ip_address": (case_check_ip, False),
+    "ip.lookup_many": (case_lookup_many, False),
+}
+
+def run_case(name, ctx):
+    # Wykonywane w procesie potomnym; wypisuje jeden obiekt JSON
+    function, _ = CASES[name]
+    if ctx["log_format"] != "off":
+        P.configure_logging(os.path.join(ctx["workdir"], "bench_log.txt"), structured=ctx["log_format"] == "json")
+    result = {"case": name, "backend": ctx.get("backend"), "size": ctx.get("size")}
+    try:
+        setup_started = time.perf_counter()
+        operation = function(ctx)
+        result["setup_s"] = round(time.perf_counter() - setup_started, 3)
+        result["setup_rss_mb"] = peak_rss_mb()
+        if ctx["tracemalloc"]:
+            import tracemalloc
+            tracemalloc.start()
+        result.update(operation())
+        if ctx["tracemalloc"]:
+            result["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+            tracemalloc.stop()
+        result["peak_rss_mb"] = peak_rss_mb()
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if "close" in ctx:
+            ctx["close"]()
+    return result
+
+# ---------------------------------------------------------------- uruchamianie i raport
+
+def select_cases(patterns):
+    if not patterns:
+        return list(CASES)
+    selected = [name for name in CASES if any(name == pattern or name.startswith(pattern.rstrip(".") + ".")
+                                              for pattern in patterns)]
+    unknown = [pattern for pattern in patterns
+               if not any(name == pattern or name.startswith(pattern.rstrip(".") + ".") for name in CASES)]
+    if unknown:
+        raise SystemExit(f"Unknown cases: {', '.join(unknown)} (available: {', '.join(CASES)})")
+    return selected
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_child(name, ctx):
+    command = [sys.executable, os.path.abspath(__file__), "--run-case", name, "--context", json.dumps(ctx)]
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=ctx["workdir"])
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode or not lines:
+        return {"case": name, "backend": ctx.get("backend"), "size": ctx.get("size"),
+                "error": (completed.stderr.strip().splitlines() or ["no output"])[-1]}
+    return json.loads(lines[-1])
+
+def format_result(result):
+    if "error" in result:
+        return f"error: {result['error']}"
+    memory = f"rss {result['peak_rss_mb']} MB" if result.get("peak_rss_mb") is not None else ""
+    if "p50_ms" in result:
+        return (f"{result['ops_per_s']:>12,.1f} ops/s   p50 {result['p50_ms']:.3f} ms   p99 {result['p99_ms']:.3f} ms"
+                f"   {memory}")
+    return f"{result['items_per_s'] or 0:>12,.1f} items/s   best {result['best_s']:.3f} s   {memory}"
+
+def result_key(result):
+    return (result["case"], result.get("backend"), result.get("size"))
+
+def compare(baseline_file, current_file):
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = {result_key(result): result for result in json.load(f)["results"]}
+    with open(current_file, encoding="utf-8") as f:
+        current = json.load(f)["results"]
+    print(f"{'Case':<34}{'Backend':<9}{'Size':>10}{'Baseline':>14}{'Current':>14}{'Change':>10}")
+    for result in current:
+        old = baseline.get(result_key(result))
+        metric = "ops_per_s" if "ops_per_s" in result else "items_per_s"
+        if old is None or "error" in old or "error" in result or not old.get(metric):
+            change = "n/a"
+            old_value = old.get(metric) if old else None
+        else:
+            old_value = old[metric]
+            change = f"{(result[metric] / old_value - 1) * 100:+.1f}%"
+        print(f"{result['case']:<34}{result.get('backend') or '-':<9}{result.get('size') or '-':>10}"
+              f"{old_value if old_value is not None else '-':>14}{result.get(metric, '-'):>14}{change:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PhoneNetworkScan hot paths")
+    parser.add_argument("--cases", default="", help="Comma-separated cases or groups (scan, registry, search, "
+                                                     "export, ip); default: all")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Registry backends to benchmark")
+    parser.add_argument("--sizes", default="10000", help="Registry sizes, e.g. 10000,1000000,10000000")
+    parser.add_argument("--ops", type=int, default=2000, help="Operations per latency/throughput case")
+    parser.add_argument("--register-ops", type=int, default=200,
+                        help="register_number calls (json storage rewrites the file on every call)")
+    parser.add_argument("--queries", type=int, default=20, help="Queries per search case")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of bulk operations (best is reported)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for batch_scan")
+    parser.add_argument("--ip-latency", type=float, default=0.0, help="Stub ip-api response delay in seconds")
+    parser.add_argument("--log-format", choices=["off", "text", "json"], default="text",
+                        help="Logging during benchmarks (text = default application logging)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Also report the Python heap peak of each operation (slows timings)")
+    parser.add_argument("--workdir", default=None, help="Directory for generated registries (kept for reuse)")
+    parser.add_argument("--json", default=None, help="Write results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), default=None,
+                        help="Compare two result files instead of running")
+    parser.add_argument("--run-case", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--context", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, json.loads(args.context))))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    cases = select_cases([case for case in args.cases.split(",") if case.strip()])
+    backends = [backend for backend in args.backends.split(",") if backend]
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="phonescan-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    base_ctx = {"workdir": workdir, "ops": args.ops, "register_ops": args.register_ops, "queries": args.queries,
+                "repeat": args.repeat, "workers": args.workers, "ip_latency": args.ip_latency,
+                "log_format": args.log_format, "tracemalloc": args.tracemalloc}
+    report = {
+        "suite": "phonescan",
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in base_ctx.items() if key != "workdir"},
+        "results": []
+    }
+    try:
+        for name in cases:
+            if CASES[name][1]:
+                runs = [{"backend": backend, "size": size} for size in sizes for backend in backends]
+            else:
+                runs = [{}]
+            for run in runs:
+                result = run_child(name, {**base_ctx, **run})
+                report["results"].append(result)
+                label = f"{name} [{run['backend']}, {run['size']}]" if run else name
+                print(f"{label:<52}{format_result(result)}", flush=True)
+    finally:
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
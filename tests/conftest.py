@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# PhoneNetworkScan.py i benchmarks/suite.py (zaślepka ip-api StubIPAPI) importowane bez instalacji
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,72 @@
+import PhoneNetworkScan as pns
+
+REGISTERED = [f"+1415555{index:04d}" for index in range(200)]
+ABSENT = [f"+1415556{index:04d}" for index in range(2000)]
+
+
+def test_bloom_snapshot_round_trip(tmp_path):
+    registry = pns.PhoneRegistry(str(tmp_path / "registry.json"))
+    path = str(tmp_path / "registry.bloom")
+    try:
+        registry.register_many(REGISTERED)
+        info = registry.build_bloom_filter(path, error_rate=0.01)
+        assert info["count"] == len(REGISTERED) and info["version"] == registry.current_version()
+        bloom = pns.RegistryBloomFilter.load(path)
+        try:
+            assert bloom.info()["count"] == len(REGISTERED)
+            assert all(pns.hash_number(number) in bloom for number in REGISTERED)
+            false_positives = sum(pns.hash_number(number) in bloom for number in ABSENT)
+            assert false_positives < len(ABSENT) * 0.05
+        finally:
+            bloom.close()
+    finally:
+        registry.close()
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "registry.bloom"
+    path.write_bytes(b"not a bloom filter at all, just some text")
+    try:
+        pns.RegistryBloomFilter.load(str(path))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_check_many_with_bloom_matches_registry(tmp_path):
+    registry = pns.PhoneRegistry(str(tmp_path / "registry.json"))
+    path = str(tmp_path / "registry.bloom")
+    numbers = REGISTERED[::10] + ABSENT[::50] + ["not a number", REGISTERED[0]]
+    try:
+        registry.register_many(REGISTERED)
+        registry.build_bloom_filter(path)
+        bloom = pns.RegistryBloomFilter.load(path)
+        try:
+            plain = list(registry.check_many(numbers))
+            assert list(registry.check_many(numbers, bloom=bloom)) == plain
+            assert sum(result.get("registered", False) for result in plain) == len(REGISTERED[::10]) + 1
+            assert "error" in plain[-2]
+
+            # Zapis po zbudowaniu snapshotu: filtr nieaktualny jest pomijany, nowy wpis znaleziony
+            registry.register_number(ABSENT[0])
+            assert list(registry.check_many([ABSENT[0]], bloom=bloom))[0]["registered"]
+        finally:
+            bloom.close()
+    finally:
+        registry.close()
+
+
+def test_bulk_check_with_bloom_only(tmp_path):
+    registry = pns.PhoneRegistry(str(tmp_path / "registry.json"))
+    try:
+        registry.register_many(REGISTERED[:10])
+        registry.build_bloom_filter(str(tmp_path / "registry.bloom"))
+        bloom = pns.RegistryBloomFilter.load(str(tmp_path / "registry.bloom"))
+        try:
+            results = list(pns.bulk_check(registry.scanner, REGISTERED[:10] + ABSENT[:10], bloom=bloom))
+            assert all(result["registered"] and result["confirmed"] is False for result in results[:10])
+        finally:
+            bloom.close()
+    finally:
+        registry.close()
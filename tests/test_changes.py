@@ -0,0 +1,93 @@
+import pytest
+
+import PhoneNetworkScan as pns
+
+NUMBERS = [f"+1415555{index:04d}" for index in range(12)]
+
+
+def open_registry(path, storage):
+    if storage == "journal":
+        return pns.PhoneRegistry(str(path), storage=pns.JournalStorage(str(path), compact_every=5))
+    return pns.open_registry(str(path), storage)
+
+
+def registry_path(tmp_path, storage):
+    return tmp_path / ("registry.db" if storage == "sqlite" else "registry.json")
+
+
+def test_change_log_read_matches_scan(tmp_path):
+    log = pns.ChangeLog(str(tmp_path / "registry.json.changes"))
+    log.open(0)
+    for seq in range(1, 40):
+        log.append(seq, [("register", f"hash{seq}-{index}", "") for index in range(seq % 3 + 1)])
+    everything = list(log.read(0))
+    assert log.start == 0
+    for since in (0, 1, 7, 20, 38, 39, 50):
+        for until in (None, since, since + 5):
+            expected = [change for change in everything
+                        if change["seq"] > since and (until is None or change["seq"] <= until)]
+            assert list(log.read(since, until)) == expected
+
+
+def test_change_log_ignores_torn_tail(tmp_path):
+    log = pns.ChangeLog(str(tmp_path / "registry.json.changes"))
+    log.open(0)
+    log.append(1, [("register", "a", "+1")])
+    with open(log.path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 2, "op": "reg')
+    assert [change["hashed_number"] for change in log.read(0)] == ["a"]
+    log.append(2, [("register", "b", "+2")])
+    assert [change["hashed_number"] for change in log.read(0)] == ["a", "b"]
+    assert [change["hashed_number"] for change in log.read(1)] == ["b"]
+
+
+def test_delta_across_journal_compaction(tmp_path):
+    path = tmp_path / "registry.json"
+    registry, reader = open_registry(path, "journal"), open_registry(path, "journal")
+    try:
+        registry.register_many(NUMBERS[:4])
+        since = registry.current_version()
+        registry.register_number(NUMBERS[0], notes="changed")
+        registry.delete_entry(NUMBERS[1])
+        for number in NUMBERS[4:]:
+            registry.register_number(number)
+        # compact_every=5: snapshot przepisany, dziennik operacji zaczęty od nowa
+        assert registry.storage.pending_ops < 10
+        assert len(pns.JournalStorage(str(path)).load(truncate=False)) == len(NUMBERS) - 1
+
+        for client in (registry, reader):
+            delta = client.delta(since)
+            assert "full" not in delta and delta["until"] == registry.current_version()
+            records = {record["original_number"]: record for record in delta["records"]}
+            assert set(records) == {NUMBERS[0], NUMBERS[1], *NUMBERS[4:]}
+            assert records[NUMBERS[0]]["op"] == "update" and records[NUMBERS[0]]["notes"] == "changed"
+            assert records[NUMBERS[1]]["deleted"] and records[NUMBERS[1]]["op"] == "delete"
+            assert delta["records"][-1]["original_number"] == NUMBERS[-1]
+        assert reader.delta(delta["until"])["records"] == []
+        events = reader.delta(since, events=True)["records"]
+        assert [event["op"] for event in events[:2]] == ["update", "delete"]
+        assert len(events) == 10
+    finally:
+        registry.close()
+        reader.close()
+
+
+@pytest.mark.parametrize("storage", ["json", "journal", "sqlite"])
+def test_delta_falls_back_to_snapshot_after_truncation(tmp_path, storage):
+    registry = open_registry(registry_path(tmp_path, storage), storage)
+    try:
+        registry.register_many(NUMBERS[:3])
+        registry.register_number(NUMBERS[3])
+        registry.delete_entry(NUMBERS[0])
+        version = registry.current_version()
+        # register_many = jedna wersja, trzy zdarzenia
+        assert registry.truncate_changes(1) == {"start": version - 1, "removed": 4}
+
+        assert len(registry.delta(version - 1)["records"]) == 1
+        delta = registry.delta(0)
+        assert delta["full"] and delta["start"] == version - 1 and delta["until"] == version
+        assert sorted(record["original_number"] for record in delta["records"]) == NUMBERS[1:4]
+        assert not any(record["deleted"] for record in delta["records"])
+        assert "error" in registry.delta(version + 1)
+    finally:
+        registry.close()
@@ -0,0 +1,228 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import PhoneNetworkScan as pns
+from suite import StubIPAPI
+
+
+class FakeEnricher:
+    # Odpowiedzi kolejno z listy dla każdego IP (ostatnia się powtarza)
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def lookup_many(self, ip_addresses):
+        ip_addresses = list(ip_addresses)
+        self.calls.append(ip_addresses)
+        results = {}
+        for ip_address in ip_addresses:
+            answers = self.responses[ip_address]
+            results[ip_address] = answers.pop(0) if len(answers) > 1 else answers[0]
+        return results
+
+
+class Clock:
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pns.time, "time", clock)
+    return clock
+
+
+def ok(ip_address):
+    return {"ip_address": ip_address, "country": "Poland"}
+
+
+def open_queue(path, enricher, **kwargs):
+    registry = pns.PhoneRegistry(str(path))
+    return registry, pns.EnrichmentQueue(registry, enricher=enricher, **kwargs)
+
+
+def test_backoff_failure_and_retry(tmp_path, clock):
+    timeout = {"error": "IP check error: timeout"}
+    enricher = FakeEnricher({"10.0.0.1": [timeout, timeout, timeout, ok("10.0.0.1")]})
+    registry, queue = open_queue(tmp_path / "registry.json", enricher, max_attempts=3, base_delay=30)
+    try:
+        registry.register_number("+14155550001", ip_address="10.0.0.1")
+        assert registry.check_if_registered("+14155550001")["entry"]["ip_info"]["status"] == "pending"
+
+        assert queue.run_once()[0]["attempts"] == 1
+        assert queue.pending()[0]["next_attempt"] == clock.now + 30
+        assert queue.run_once() == []
+        clock.now += 30
+        assert queue.run_once()[0]["attempts"] == 2
+        assert queue.pending()[0]["next_attempt"] == clock.now + 60
+        clock.now += 60
+        assert queue.run_once()[0]["status"] == "failed"
+        assert queue.pending() == [] and len(queue.failed()) == 1
+        ip_info = registry.check_if_registered("+14155550001")["entry"]["ip_info"]
+        assert ip_info == {"status": "failed", "message": "IP check error: timeout"}
+
+        assert queue.retry_failed() == 1
+        assert queue.process_due()[0]["status"] == "done"
+        assert queue.pending() == [] and queue.failed() == []
+        assert registry.check_if_registered("+14155550001")["entry"]["ip_info"] == ok("10.0.0.1")
+        assert len(enricher.calls) == 4
+    finally:
+        queue.stop()
+        registry.close()
+
+
+def test_service_error_fails_without_retry(tmp_path, clock):
+    enricher = FakeEnricher({"192.168.0.1": [{"error": "IP check failed: private range"}]})
+    registry, queue = open_queue(tmp_path / "registry.json", enricher)
+    try:
+        registry.register_number("+14155550001", ip_address="192.168.0.1")
+        assert queue.run_once()[0]["status"] == "failed"
+        assert queue.failed()[0]["attempts"] == 1
+    finally:
+        queue.stop()
+        registry.close()
+
+
+def test_expired_claim_is_taken_over(tmp_path, clock):
+    path = tmp_path / "registry.json"
+    crashed_registry, crashed = open_queue(path, FakeEnricher({}), claim_timeout=600)
+    registry, queue = open_queue(path, FakeEnricher({"10.0.0.1": [ok("10.0.0.1")]}), claim_timeout=600)
+    try:
+        crashed_registry.register_number("+14155550001", ip_address="10.0.0.1")
+        # Pierwszy proces zajmuje pozycję i "umiera" przed zapisaniem wyniku
+        claimed_at = clock.now
+        assert len(crashed._claim(claimed_at)) == 1
+        clock.now += 599
+        assert queue.run_once() == []
+        assert queue.pending()[0]["status"] == "in_progress"
+        clock.now += 1
+        assert queue.run_once()[0]["status"] == "done"
+        assert registry.check_if_registered("+14155550001")["entry"]["ip_info"] == ok("10.0.0.1")
+        assert crashed.pending() == []
+    finally:
+        crashed.stop()
+        queue.stop()
+        crashed_registry.close()
+        registry.close()
+
+
+def test_result_for_reregistered_ip_is_skipped(tmp_path, clock):
+    enricher = FakeEnricher({"10.0.0.1": [ok("10.0.0.1")], "10.0.0.2": [ok("10.0.0.2")]})
+    registry, queue = open_queue(tmp_path / "registry.json", enricher)
+    try:
+        registry.register_number("+14155550001", ip_address="10.0.0.1")
+        batch = queue._claim(clock.now)
+        # Wpis zarejestrowany ponownie z innym IP w trakcie sprawdzania starego
+        registry.register_number("+14155550001", ip_address="10.0.0.2")
+        assert registry.update_ip_infos({batch[0]["hashed_number"]: ("10.0.0.1", ok("10.0.0.1"))}) == 0
+        assert [item["ip_address"] for item in queue.pending()] == ["10.0.0.2"]
+        queue.process_due()
+        assert registry.check_if_registered("+14155550001")["entry"]["ip_info"] == ok("10.0.0.2")
+    finally:
+        queue.stop()
+        registry.close()
+
+
+SUBMITTER = """
+import sys
+import PhoneNetworkScan as pns
+registry = pns.PhoneRegistry(sys.argv[1])
+queue = pns.EnrichmentQueue(registry)
+for index in range(30):
+    queue.submit(f"{sys.argv[2]}-{index}", "10.0.0.1")
+queue.stop()
+registry.close()
+"""
+
+
+def test_processes_share_queue(tmp_path):
+    path = str(tmp_path / "registry.json")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    submitters = [subprocess.Popen([sys.executable, "-c", SUBMITTER, path, name], cwd=tmp_path, env=env,
+                                   stderr=subprocess.PIPE) for name in ("a", "b", "c")]
+    for submitter in submitters:
+        assert submitter.wait(120) == 0, submitter.stderr.read().decode()
+    registry = pns.PhoneRegistry(path)
+    queue = pns.EnrichmentQueue(registry, compact_every=10)
+    try:
+        assert len(queue.pending()) == 90
+    finally:
+        queue.stop()
+        registry.close()
+
+
+def test_enricher_against_stub_api():
+    stub = StubIPAPI()
+    try:
+        enricher = pns.IPEnricher(base_url=stub.url, requests_per_minute=0)
+        info = enricher.lookup("10.0.0.1")
+        assert info["country"] == "Poland" and info["ip_address"] == "10.0.0.1"
+        results = enricher.lookup_many(["10.0.0.1", "10.0.0.2", " 10.0.0.3 ", ""])
+        assert sorted(results) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+        assert all(result["country"] == "Poland" for result in results.values())
+        assert enricher.cache.get("10.0.0.3")["ip_address"] == "10.0.0.3"
+    finally:
+        stub.close()
+
+
+def test_enricher_does_not_cache_errors():
+    enricher = pns.IPEnricher(requests_per_minute=0)
+    answers = [RuntimeError("timeout"), {"status": "fail", "message": "reserved range"},
+               {"status": "success", "country": "Poland"}]
+
+    def request(method, url, **kwargs):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    enricher._request = request
+    assert enricher.lookup("10.0.0.1") == {"error": "IP check error: timeout"}
+    assert enricher.lookup("10.0.0.1") == {"error": "IP check failed: reserved range"}
+    assert enricher.lookup("10.0.0.1")["country"] == "Poland"
+    assert enricher.lookup("10.0.0.1")["country"] == "Poland"
+    assert answers == []
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, headers):
+        self.headers = headers
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"status": "success", "country": "Poland"}
+
+
+class FakeSession:
+    def __init__(self, headers):
+        self.headers = headers
+
+    def request(self, method, url, **kwargs):
+        return FakeResponse(self.headers)
+
+
+@pytest.mark.parametrize("headers, pause", [
+    ({"X-Rl": "0", "X-Ttl": "abc"}, 60),
+    ({"X-Rl": "0.0", "X-Ttl": "12.5"}, 12),
+    ({"X-Rl": "-1"}, 60),
+    ({"X-Rl": "garbage", "X-Ttl": "30"}, None),
+    ({"X-Rl": "44", "X-Ttl": "nan"}, None),
+])
+def test_enricher_tolerates_malformed_rate_headers(headers, pause):
+    enricher = pns.IPEnricher(requests_per_minute=0)
+    enricher._session = FakeSession(headers)
+    pauses = []
+    enricher.limiter.pause = pauses.append
+    assert enricher.lookup("10.0.0.1")["country"] == "Poland"
+    assert pauses == ([pause] if pause is not None else [])
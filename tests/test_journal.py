@@ -0,0 +1,98 @@
+import json
+import os
+
+import PhoneNetworkScan as pns
+
+
+def entry(number, notes=""):
+    return {"hashed_number": pns.hash_number(number), "original_number": number, "notes": notes}
+
+
+def write_entries(storage, numbers):
+    registry = {}
+    for number in numbers:
+        item = entry(number)
+        registry[item["hashed_number"]] = item
+        storage.put(item["hashed_number"], item, registry)
+    return registry
+
+
+def test_replay_discards_partial_last_line(tmp_path):
+    path = str(tmp_path / "registry.json")
+    storage = pns.JournalStorage(path)
+    registry = write_entries(storage, ["+14155550001", "+14155550002", "+14155550003"])
+    storage.close()
+    good_size = os.path.getsize(storage.journal_file)
+    # Awaria w trakcie dopisywania: urwana ostatnia linia
+    with open(storage.journal_file, "a", encoding="utf-8") as f:
+        f.write('{"op":"put","key":"torn","entry":{"hashed_')
+
+    reader = pns.JournalStorage(path)
+    assert reader.load(truncate=False) == registry
+    assert os.path.getsize(storage.journal_file) > good_size
+
+    replayed = pns.JournalStorage(path)
+    assert replayed.load() == registry
+    assert os.path.getsize(storage.journal_file) == good_size
+    # Kolejny zapis nie skleja się z resztką urwanej linii
+    registry.update(write_entries(replayed, ["+14155550004"]))
+    replayed.close()
+    assert pns.JournalStorage(path).load() == registry
+
+
+def test_replay_skips_corrupt_record(tmp_path):
+    path = str(tmp_path / "registry.json")
+    storage = pns.JournalStorage(path)
+    registry = write_entries(storage, ["+14155550001"])
+    storage.close()
+    with open(storage.journal_file, "a", encoding="utf-8") as f:
+        f.write("not json\n")
+    storage = pns.JournalStorage(path)
+    storage.load()
+    registry.update(write_entries(storage, ["+14155550002"]))
+    storage.close()
+    assert pns.JournalStorage(path).load() == registry
+
+
+def test_sync_reads_other_writer_ops_and_compaction(tmp_path):
+    path = str(tmp_path / "registry.json")
+    writer, reader = pns.JournalStorage(path, compact_every=1000), pns.JournalStorage(path)
+    writer.load()
+    written = write_entries(writer, ["+14155550001"])
+    registry = reader.load()
+    assert registry == written and reader.sync() is None
+
+    written.update(write_entries(writer, ["+14155550002", "+14155550003"]))
+    kind, records = reader.sync()
+    assert kind == "ops" and len(records) == 2
+    reader.apply(registry, records)
+    assert registry == written
+
+    key = next(iter(written))
+    del written[key]
+    writer.delete(key, written)
+    writer.compact(written)
+    assert reader.sync() == ("full", written)
+    assert reader.sync() is None
+    writer.close()
+
+
+def test_registry_replays_journal_after_torn_tail(tmp_path):
+    path = str(tmp_path / "registry.json")
+    registry = pns.PhoneRegistry(path, storage=pns.JournalStorage(path))
+    registry.register_many(["+14155550001", "+14155550002"])
+    registry.register_number("+14155550003", notes="last")
+    registry.close()
+    with open(f"{path}.journal", "rb+") as f:
+        f.truncate(os.path.getsize(f"{path}.journal") - 5)
+
+    reopened = pns.PhoneRegistry(path, storage=pns.JournalStorage(path))
+    try:
+        # Paczka z register_many jest w całości, urwany ostatni zapis przepada
+        assert len(reopened) == 2
+        assert not reopened.check_if_registered("+14155550003")["registered"]
+        assert reopened.register_number("+14155550003")["success"]
+        with open(f"{path}.journal", "rb") as f:
+            assert all(json.loads(line) for line in f)
+    finally:
+        reopened.close()
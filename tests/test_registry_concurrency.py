@@ -0,0 +1,104 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import PhoneNetworkScan as pns
+
+# Proces piszący: rejestruje numery +1415555<prefix><nnn> i (wspólne dla obu procesów) +12125550<nnn>
+WRITER = """
+import sys
+import PhoneNetworkScan as pns
+path, storage, prefix, count = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+registry = pns.open_registry(path, storage)
+for index in range(count):
+    assert registry.register_number(f"+1415555{prefix}{index:03d}").get("success")
+    assert registry.register_number(f"+12125550{index:03d}", notes=prefix).get("success")
+registry.close()
+"""
+
+
+def open_registry(path, storage):
+    return pns.open_registry(str(path), storage)
+
+
+@pytest.mark.parametrize("storage", ["json", "journal", "sqlite"])
+def test_two_processes_register_on_one_file(tmp_path, storage):
+    path = tmp_path / ("registry.db" if storage == "sqlite" else "registry.json")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    writers = [subprocess.Popen([sys.executable, "-c", WRITER, str(path), storage, prefix, "40"], cwd=tmp_path,
+                                env=env, stderr=subprocess.PIPE) for prefix in ("1", "2")]
+    for writer in writers:
+        assert writer.wait(120) == 0, writer.stderr.read().decode()
+    registry = open_registry(path, storage)
+    try:
+        # 2 x 40 własnych numerów + 40 wspólnych (ostatni zapis wygrywa), żadna rejestracja nie zginęła
+        assert len(registry) == 120
+        assert registry.current_version() == 160
+        changes = list(registry.changes(0))
+        assert len(changes) == 160
+        assert [change["seq"] for change in changes] == sorted(change["seq"] for change in changes)
+        assert len({change["hashed_number"] for change in changes}) == 120
+    finally:
+        registry.close()
+
+
+@pytest.mark.parametrize("storage", ["json", "journal", "sqlite"])
+def test_expected_version_detects_concurrent_change(tmp_path, storage):
+    path = tmp_path / ("registry.db" if storage == "sqlite" else "registry.json")
+    first, second = open_registry(path, storage), open_registry(path, storage)
+    try:
+        assert first.register_number("+14155550001", notes="v1")["success"]
+        assert first.register_number("+14155550002", notes="v1")["success"]
+        lookup = first.check_if_registered("+14155550001")
+        # Inny "proces" zmienia wpis po odczycie
+        assert second.register_number("+14155550001", notes="v2")["success"]
+
+        conflict = first.register_number("+14155550001", notes="v3", expected_version=lookup["version"])
+        assert conflict.get("conflict") and conflict["version"] == lookup["version"] + 1
+        assert first.check_if_registered("+14155550001")["entry"]["notes"] == "v2"
+        # Wpis niezmieniony od odczytu można zapisać warunkowo
+        assert first.register_number("+14155550002", notes="v3", expected_version=lookup["version"])["success"]
+        assert first.delete_entry("+14155550001", expected_version=lookup["version"]).get("conflict")
+        fresh = first.check_if_registered("+14155550001")["version"]
+        assert first.delete_entry("+14155550001", expected_version=fresh)["success"]
+        assert not second.check_if_registered("+14155550001")["registered"]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_reader_reloads_changes_from_other_writer(tmp_path):
+    path = tmp_path / "registry.json"
+    writer = pns.PhoneRegistry(str(path), storage=pns.JournalStorage(str(path)))
+    reader = pns.PhoneRegistry(str(path), storage=pns.JournalStorage(str(path)))
+    try:
+        writer.register_number("+14155550001")
+        assert reader.check_if_registered("+14155550001")["registered"]
+        writer.delete_entry("+14155550001")
+        assert not reader.check_if_registered("+14155550001")["registered"]
+        assert reader.version == writer.version
+    finally:
+        writer.close()
+        reader.close()
+
+
+def test_registry_lock_is_reentrant_and_stores_version(tmp_path):
+    lock = pns.RegistryLock(str(tmp_path / "registry.json.lock"), timeout=0.2)
+    assert lock.read_version() == 0
+    assert not lock.exists()
+    with lock:
+        with lock:
+            lock.write_version(42)
+    assert lock.read_version() == 42
+    other = pns.RegistryLock(lock.path, timeout=0.2)
+    with lock:
+        # Drugi uchwyt (jak inny proces) nie dostaje blokady, ale czyta wersję
+        with pytest.raises(TimeoutError):
+            other.acquire()
+        assert other.read_version() == 42
+    with other:
+        pass
+    lock.close()
+    other.close()
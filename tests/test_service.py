@@ -0,0 +1,183 @@
+import asyncio
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import PhoneNetworkScan as pns
+
+
+@pytest.fixture
+def service(tmp_path):
+    registry = pns.PhoneRegistry(str(tmp_path / "registry.json"))
+    service = pns.ScanService(registry, port=0)
+    ready = threading.Event()
+    loops = []
+
+    def on_ready(_):
+        loops.append(asyncio.get_running_loop())
+        ready.set()
+
+    thread = threading.Thread(target=service.run, kwargs={"ready": on_ready}, daemon=True)
+    thread.start()
+    assert ready.wait(10)
+    yield service
+    loops[0].call_soon_threadsafe(service.stopping.set)
+    thread.join(10)
+    registry.close()
+
+
+def call(service, path, data=None):
+    # (status, odpowiedź JSON); data -> POST z ciałem JSON
+    body = json.dumps(data).encode() if data is not None else None
+    request = urllib.request.Request(f"http://127.0.0.1:{service.port}{path}", data=body,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_validate_accepts_literal_plus(service):
+    status, result = call(service, "/validate?number=+48500123456")
+    assert status == 200
+    assert result["input"] == "+48500123456"
+    assert result["full_e164"] == "+48500123456"
+
+
+def stream(service, path, body, content_type="application/json"):
+    # Odpowiedź NDJSON (chunked) -> lista obiektów
+    request = urllib.request.Request(f"http://127.0.0.1:{service.port}{path}", data=body,
+                                     headers={"Content-Type": content_type})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.headers["Content-Type"], response.read().decode()
+
+
+def raw(service, data):
+    # Surowe żądanie (np. z przekroczonym limitem linii) -> kod statusu
+    with socket.create_connection(("127.0.0.1", service.port), timeout=10) as sock:
+        sock.sendall(data)
+        return int(sock.makefile("rb").readline().split()[1])
+
+
+def test_health_metrics_stats(service):
+    call(service, "/register", {"number": "+14155552671"})
+    status, health = call(service, "/health")
+    assert status == 200
+    assert health["status"] == "ok" and health["entries"] == 1 and health["version"] == 1
+    with urllib.request.urlopen(f"http://127.0.0.1:{service.port}/metrics", timeout=10) as response:
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert b"phonescan_server_responses_total" in response.read()
+    status, stats = call(service, "/stats")
+    assert status == 200 and isinstance(stats, dict)
+
+
+def test_validate_get_and_post(service):
+    status, result = call(service, "/validate", {"number": "+442071838750"})
+    assert status == 200 and result["valid"] and result["full_e164"] == "+442071838750"
+    status, result = call(service, "/validate?number=%2B33612345678")
+    assert status == 200 and result["full_e164"] == "+33612345678"
+    assert call(service, "/validate")[0] == 400
+
+
+def test_validate_batch_json_and_text(service):
+    numbers = ["+14155552671", "+442071838750", "garbage"]
+    content_type, body = stream(service, "/validate/batch", json.dumps({"numbers": numbers}).encode())
+    assert content_type == "application/x-ndjson"
+    results = [json.loads(line) for line in body.splitlines()]
+    assert [result["input"] for result in results] == numbers
+    assert results[0]["valid"] and "error" in results[2]
+    _, body = stream(service, "/validate/batch", b"# komentarz\n+33612345678\n\n+48500123456\n", "text/plain")
+    assert [json.loads(line)["full_e164"] for line in body.splitlines()] == ["+33612345678", "+48500123456"]
+
+
+def test_register_lookup_delete_round_trip(service):
+    status, result = call(service, "/register", {"number": "+14155552671", "notes": "office", "name": "Desk"})
+    assert status == 200 and result["success"]
+    assert call(service, "/register", {"number": "garbage"})[0] == 422
+
+    status, result = call(service, "/lookup?number=+14155552671")
+    assert status == 200 and result["registered"] and result["entry"]["notes"] == "office"
+    version = result["version"]
+    status, result = call(service, "/lookup", {"number": "+14155552671"})
+    assert status == 200 and result["registered"]
+
+    # Zapis warunkowy: nieaktualna wersja -> 409
+    assert call(service, "/register", {"number": "+14155552671", "notes": "new", "if_version": version})[0] == 200
+    assert call(service, "/register", {"number": "+14155552671", "if_version": version})[0] == 409
+    assert call(service, "/delete", {"number": "+14155552671", "if_version": version})[0] == 409
+    assert call(service, "/delete", {"number": "+14155552671", "if_version": "x"})[0] == 400
+    status, result = call(service, "/delete", {"number": "+14155552671"})
+    assert status == 200 and result["success"]
+    assert not call(service, "/lookup?number=+14155552671")[1]["registered"]
+
+
+def test_register_batch_and_lookup_batch(service):
+    records = [{"number": "+14155552671", "notes": "a"}, ["+442071838750", "b", "", "", ""], {"number": "bad"}]
+    status, result = call(service, "/register/batch", {"records": records})
+    assert status == 200 and result["registered"] == 2
+    assert call(service, "/register/batch", {"records": "nope"})[0] == 400
+
+    numbers = ["+14155552671", "+33612345678", "+44 20 7183 8750"]
+    _, body = stream(service, "/lookup/batch", json.dumps({"numbers": numbers}).encode())
+    results = [json.loads(line) for line in body.splitlines()]
+    assert [result["input"] for result in results] == numbers
+    assert [result["registered"] for result in results] == [True, False, True]
+
+
+def test_search_and_query(service):
+    call(service, "/register/batch", {"records": [{"number": "+14155552671", "notes": "office phone"},
+                                                   {"number": "+14155550100", "notes": "home"},
+                                                   {"number": "+442071838750", "notes": "office"}]})
+    status, result = call(service, "/search?keyword=office")
+    assert status == 200 and result["count"] == 2
+    status, result = call(service, "/search?keyword=kingdom&field=country")
+    assert status == 200 and result["count"] == 1
+
+    status, result = call(service, "/query?prefix=+1415&limit=1")
+    assert status == 200
+    assert [entry["original_number"] for entry in result["results"]] == ["+14155550100"]
+    status, result = call(service, f"/query?prefix=+1415&limit=1&after={result['next']}")
+    assert [entry["original_number"] for entry in result["results"]] == ["+14155552671"]
+    status, result = call(service, "/query?country_code=44")
+    assert [entry["original_number"] for entry in result["results"]] == ["+442071838750"]
+    assert call(service, "/query?limit=x")[0] == 400
+
+
+def test_export_csv_and_jsonl(service):
+    call(service, "/register/batch", {"records": [{"number": "+14155552671"}, {"number": "+33612345678"}]})
+    content_type, body = stream(service, "/export?format=jsonl&fields=original_number,notes", None)
+    assert content_type == "application/x-ndjson"
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert sorted(row["original_number"] for row in rows) == ["+14155552671", "+33612345678"]
+    content_type, body = stream(service, "/export?fields=original_number", None)
+    assert content_type.startswith("text/csv") and len(body.strip().splitlines()) == 3
+    assert call(service, "/export?format=parquet")[0] == 400
+
+
+def test_changes(service):
+    call(service, "/register", {"number": "+14155552671"})
+    status, delta = call(service, "/changes")
+    assert status == 200 and delta["until"] == 1
+    assert [record["original_number"] for record in delta["records"]] == ["+14155552671"]
+    call(service, "/delete", {"number": "+14155552671"})
+    status, delta = call(service, "/changes?since=1&events=1")
+    assert [record["op"] for record in delta["records"]] == ["delete"]
+    assert call(service, "/changes?since=99")[0] == 422
+    assert call(service, "/changes?since=x")[0] == 400
+
+
+def test_unknown_route_and_method(service):
+    assert call(service, "/nope")[0] == 404
+    assert call(service, "/health", {})[0] == 405
+    assert call(service, "/delete")[0] == 405
+
+
+def test_oversized_request_line_and_header(service):
+    assert raw(service, b"GET /validate?number=" + b"1" * 70000 + b" HTTP/1.1\r\n\r\n") == 414
+    assert raw(service, b"GET /health HTTP/1.1\r\nX-Big: " + b"a" * 70000 + b"\r\n\r\n") == 431
+    assert call(service, "/health")[0] == 200
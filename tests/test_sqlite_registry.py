@@ -0,0 +1,55 @@
+import PhoneNetworkScan as pns
+
+NUMBERS = ["+14155552671", "+442071838750", "+33612345678"]
+
+
+def open_registries(tmp_path):
+    scanner = pns.PhoneScanner()
+    json_registry = pns.PhoneRegistry(str(tmp_path / "registry.json"), scanner=scanner)
+    sqlite_registry = pns.SQLitePhoneRegistry(str(tmp_path / "registry.db"), scanner=scanner)
+    return json_registry, sqlite_registry
+
+
+def test_sqlite_registry_has_base_attributes(tmp_path):
+    # Metody dziedziczone z PhoneRegistry korzystają z atrybutów ustawianych w PhoneRegistry.__init__
+    json_registry, sqlite_registry = open_registries(tmp_path)
+    try:
+        missing = set(vars(json_registry)) - set(vars(sqlite_registry)) - {"registry"}
+        assert not missing
+    finally:
+        json_registry.close()
+        sqlite_registry.close()
+
+
+def test_sqlite_registry_inherited_methods(tmp_path):
+    _, registry = open_registries(tmp_path)
+    try:
+        result = registry.register_many([(number, "note") for number in NUMBERS])
+        assert result["registered"] == len(NUMBERS)
+        assert registry.current_version() == registry.version == 1
+        assert registry.refresh() == 0
+        registry._maybe_refresh()
+
+        lookup = registry.check_if_registered(NUMBERS[0])
+        assert lookup["registered"] and lookup["version"] == 1
+        assert registry.register_number(NUMBERS[0], "again", expected_version=lookup["version"])["success"]
+        conflict = registry.register_number(NUMBERS[0], "stale", expected_version=lookup["version"])
+        assert conflict.get("conflict")
+
+        stale = pns.RegistryBloomFilter.for_capacity(10, 0.01, version=0)
+        checked = registry.check_many(NUMBERS + ["+15555550100"], bloom=stale)
+        assert [item.get("registered") for item in checked] == [True, True, True, False]
+
+        bloom = registry.build_bloom_filter(str(tmp_path / "registry.bloom"))
+        assert bloom["count"] == len(NUMBERS) and bloom["version"] == registry.version
+
+        delta = registry.delta(0)
+        assert delta["until"] == registry.version
+        assert {record["original_number"] for record in delta["records"]} == set(NUMBERS)
+
+        assert registry.query(prefix="+44")["count"] == 1
+        assert len(registry.get_registered_numbers()) == len(NUMBERS)
+        assert registry.delete_entry(NUMBERS[2])["success"]
+        assert len(registry) == len(NUMBERS) - 1
+    finally:
+        registry.close()